@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# this is AcquisitionThread.py  runs doScan commands off the Qt GUI thread
+
+import os
+import os.path as path
+import itertools
+import queue
+import threading
+import traceback
+from pyqtgraph.Qt import QtCore
+import Imaging.doScan as DS
+
+class clsAcquisitionThread(QtCore.QThread):
+    # Runs doScan.doCommonEntry jobs one at a time in the order they were submitted so the RasterGUI, the image
+    #   windows and the Axograph watcher stay responsive while the hardware computer acquires data.
+    #   submitJob returns at once and jobFinished(job, retDict) is emitted when that job is done; the signal is
+    #   delivered in the GUI thread where job["onFinished"](retDict) is called. Short commands (shutter,
+    #   arm/disarm photometry) are submitted with urgent=True so they run as soon as the job in progress is done
+    #   instead of after every queued movie or focus frame. runJobNow waits for the result of an urgent job.
+    jobFinished = QtCore.Signal(object, object)
+
+    def __init__(self):
+        QtCore.QThread.__init__(self)
+        self.jobQueue = queue.PriorityQueue() # (priority, submitNum, job); 0 urgent, 1 acquisitions, 2 stop
+        self.submitNums = itertools.count() # keeps jobs of the same priority in the order they were submitted
+        self.numPendingJobs = 0
+        self.numFinishedJobs = 0
+        self.finishingJob = None
+        self.pendingLock = threading.Lock()
+        self.jobFinished.connect(self._callFinishFunction)
+
+    def run(self):
+        while True:
+            job = self.jobQueue.get()[2]
+            if job is None:
+                break # sent by stop()
+            try:
+                retDict = DS.doCommonEntry(job["cmdFN"])
+            except BaseException:
+                print("Problem running doScan job " + str(job["cmdFN"]) + ":")
+                traceback.print_exc()
+                retDict = {"retOkay": False}
+            if job["removeCmdFile"] and path.exists(job["cmdFN"]):
+                os.remove(job["cmdFN"])
+            with self.pendingLock:
+                self.numPendingJobs -= 1
+                if not job["doneEvent"]:
+                    if not job["urgent"]:
+                        self.numFinishedJobs += 1 # counts acquisition results delivered by jobFinished
+                    job["finishNum"] = self.numFinishedJobs
+            job["retDict"] = retDict
+            if job["doneEvent"]:
+                job["doneEvent"].set()
+            else:
+                self.jobFinished.emit(job, retDict)
+
+    def submitJob(self, cmdFN, onFinished=None, removeCmdFile=True, urgent=False):
+        # cmdFN is a DoScan control file written for this job only (it is deleted after use if removeCmdFile)
+        return self._queueJob(cmdFN, onFinished, removeCmdFile, None, urgent)
+
+    def runJobNow(self, cmdFN, removeCmdFile=True):
+        # waits only for the job in progress (if any), not for queued acquisitions
+        job = self._queueJob(cmdFN, None, removeCmdFile, threading.Event(), True)
+        job["doneEvent"].wait()
+        return job["retDict"]
+
+    def numNewerResults(self):
+        # while an onFinished function runs: how many later acquisition jobs have already finished, so a caller
+        #   that only shows the latest result (eg focus mode) can skip this one
+        if not self.finishingJob:
+            return 0
+        with self.pendingLock:
+            return self.numFinishedJobs - self.finishingJob["finishNum"]
+
+    def isBusy(self):
+        with self.pendingLock:
+            return self.numPendingJobs > 0
+
+    def stop(self):
+        # lets queued jobs finish, then ends the thread
+        self.jobQueue.put((2, next(self.submitNums), None))
+        self.wait()
+
+    def _queueJob(self, cmdFN, onFinished, removeCmdFile, doneEvent, urgent):
+        job = {"cmdFN": cmdFN, "onFinished": onFinished, "removeCmdFile": removeCmdFile, "doneEvent": doneEvent,
+               "urgent": urgent}
+        with self.pendingLock:
+            self.numPendingJobs += 1
+            self.jobQueue.put((0 if urgent else 1, next(self.submitNums), job))
+        return job
+
+    def _callFinishFunction(self, job, retDict):
+        if job["onFinished"]:
+            self.finishingJob = job
+            try:
+                job["onFinished"](retDict)
+            finally:
+                self.finishingJob = None
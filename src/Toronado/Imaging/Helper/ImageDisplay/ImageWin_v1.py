@@ -22,7 +22,9 @@ import os.path as path
 import glob
 import os
 import Imaging.Helper.processImageData as PI
+import Imaging.doScan as DS
 import Imaging.Helper.rasterPlots as RP
+import Imaging.Helper.timingSpans as TS
 import pyperclip
 
 class clsImageWin(QtGui.QMainWindow):
@@ -67,7 +69,7 @@ class clsImageWin(QtGui.QMainWindow):
                 if len(oneImageDict["data"][oneChanLetter]) == 1:
                     tempStack.append(oneImageDict["data"][oneChanLetter][0]) # single image
                 else:
-                    tempStack.append(np.mean(np.array(tempDict["data"][oneChanLetter]), 0)) # a movie so average
+                    tempStack.append(np.mean(oneImageDict["data"][oneChanLetter], 0)) # a movie so average
                     print("Average movie to get one frame xx")
             # tempArray = np.asarray(tempStack) # convert from a list of 2D images into a 3D array
             if not colorizeDepth:
@@ -107,18 +109,37 @@ class clsImageWin(QtGui.QMainWindow):
         if self.allowFileLoad:
             tempDict = self.getImageDict(fileName, lagPixelsAdjust=self.postLagTweakPixels)
             if tempDict:
-                if self.autoAverage and tempDict["numFrames"] > 1:
-                    for oneChanLetter in tempDict["channelLetters"]:
-                        tempDict["data"][oneChanLetter] = [np.mean(np.array(tempDict["data"][oneChanLetter]), 0)]
-                    tempDict["numFrames"] = 1
-                self.retDict = tempDict # returned Dict is valid so replace current Dict stored in class instance
-                self._agumentDictWithInfoStrings(self.retDict) # add display border information
-                self.loadedFileName = fileName
-                if self.curChannelIndex >= len(self.retDict["channelLetters"]):
-                    self.curChannelIndex = 0 # reset if now impossible to display previous channelIndex
-                self.curChannel = self.retDict["channelLetters"][self.curChannelIndex]
-                self.curFrame = 0
-                self.refreshImageDisplay()
+                self._displayNewDict(tempDict, fileName)
+
+    def loadImageFromDict(self, imageDict):
+        # shows an image Dict that is already decoded (acquired data received in memory); several windows can be
+        #   passed the same Dict so this window keeps its own copy of the top level and of the data Dict
+        if self.allowFileLoad and imageDict:
+            tempDict = dict(imageDict)
+            tempDict["data"] = dict(imageDict["data"])
+            if self.postLagTweakPixels != tempDict.get("lagPixelsAdjust", 0):
+                if "rawData" not in tempDict:
+                    # raw ADC data is not kept with acquired images, so decode the saved file with this lag
+                    DS.waitForFileWrite(tempDict["loadedFileName"])
+                    self.loadImageFile(tempDict["loadedFileName"])
+                    return
+                if not PI.rephaseRasterData(tempDict, self.postLagTweakPixels):
+                    return
+            self._displayNewDict(tempDict, tempDict["loadedFileName"])
+
+    def _displayNewDict(self, tempDict, fileName):
+        if self.autoAverage and tempDict["numFrames"] > 1:
+            for oneChanLetter in tempDict["channelLetters"]:
+                tempDict["data"][oneChanLetter] = np.mean(tempDict["data"][oneChanLetter], 0, keepdims=True) # one-frame stack
+            tempDict["numFrames"] = 1
+        self.retDict = tempDict # returned Dict is valid so replace current Dict stored in class instance
+        self._agumentDictWithInfoStrings(self.retDict) # add display border information
+        self.loadedFileName = fileName
+        if self.curChannelIndex >= len(self.retDict["channelLetters"]):
+            self.curChannelIndex = 0 # reset if now impossible to display previous channelIndex
+        self.curChannel = self.retDict["channelLetters"][self.curChannelIndex]
+        self.curFrame = 0
+        self.refreshImageDisplay()
 
     def loadImageFileOld(self, fileName):
         # not called anymore
@@ -129,7 +150,7 @@ class clsImageWin(QtGui.QMainWindow):
                 tempDict = PI.loadRasterZipFile(fileName, lagPixelsAdjust=self.postLagTweakPixels, fastMode=False)
                 if self.autoAverage and tempDict["numFrames"] > 1:
                     for oneChanLetter in tempDict["channelLetters"]:
-                        tempDict["data"][oneChanLetter] = [np.mean(np.array(tempDict["data"][oneChanLetter]), 0)]
+                        tempDict["data"][oneChanLetter] = np.mean(tempDict["data"][oneChanLetter], 0, keepdims=True) # one-frame stack
                     tempDict["numFrames"] = 1
                 if tempDict:
                     self.retDict = tempDict # returned Dict is valid so replace current Dict stored in class instance
@@ -316,8 +337,9 @@ class clsImageWin(QtGui.QMainWindow):
             self.autoDisplayLevel = False
             span = self.maxDisplayLevel - self.minDisplayLevel
             self.maxDisplayLevel = int(self.minDisplayLevel + (1.25 * span))
-            if self.maxDisplayLevel >= 2048:
-                self.maxDisplayLevel = 2048
+            maxPossibleLevel = self.retDict.get("maxPossibleValue", 2048) # larger for binned images
+            if self.maxDisplayLevel >= maxPossibleLevel:
+                self.maxDisplayLevel = maxPossibleLevel
             self.refreshImageDisplay()
         if evt.key() == QtCore.Qt.Key_PageUp and self.retDict:
                 self.minDisplayLevel = self.minDisplayLevel + 10
@@ -589,6 +611,7 @@ class clsImageWin(QtGui.QMainWindow):
                 # done with save method within PI module since saves raw image data
                 PI.saveProcessedImageData(self.retDict, self.loadedFileName, newFormat, frameVar)
 
+    @TS.timed("refreshImageDisplay")
     def refreshImageDisplay(self, passDict=None):
         if not passDict:
             passDict = self.retDict
@@ -629,10 +652,12 @@ class clsImageWin(QtGui.QMainWindow):
                 if parts[1] == "redsat":
                     pass
         if 0 < self.saturationPercentage < 100:
-            satLevel = int((self.saturationPercentage / 100.) * 2048) # default
+            fullScale = passDict.get("maxPossibleValue", 2048) # default; 2048 times the bin area for binned images
             if "hardware" in passDict["parms"]:
                 if "maxadcvalue" in passDict["parms"]["hardware"]:
-                    satLevel = int((self.saturationPercentage / 100.) * int(passDict["parms"]["hardware"]["maxadcvalue"])) # replace with real value if provided
+                    # replace with real value if provided, scaled by the bin area since binned pixels are sums
+                    fullScale = int(passDict["parms"]["hardware"]["maxadcvalue"]) * (fullScale // 2048)
+            satLevel = int((self.saturationPercentage / 100.) * fullScale)
           # self.curSatMask.setCompositionMode(QtGui.QPainter.CompositionMode_Difference)
             tempData = passDict["data"][self.curChannel][self.curFrame]
             tempMask = tempData >= satLevel
@@ -23,7 +23,8 @@ import os.path as path
 import glob
 import os
 import Imaging.Helper.processImageData as PI
-import Imaging.Helper.rasterPlots as RP
+import Imaging.doScan as DS
+import Imaging.Helper.timingSpans as TS
 import pyperclip
 import functools
 import datetime
@@ -48,11 +49,13 @@ class clsImageWin(QtGui.QMainWindow):
         self.lastLoadFileFolder = None
         self.allowFileLoad = True
         self.autoAverage = False
+        self.lazyLoad = False # decode movie frames only when they are displayed
         self.postLagTweakPixels = 0
         self.useNativeGUI = useNativeGUI
 
     # core image display function
 
+    @TS.timed("refreshImageDisplay")
     def refreshImageDisplay(self, passDict=None):
         print("Refresh run at " + str(datetime.datetime.now()))
         if not passDict:
@@ -99,10 +102,12 @@ class clsImageWin(QtGui.QMainWindow):
                 if parts[1] == "redsat":
                     pass
         if 0 < self.saturationPercentage < 100:
-            satLevel = int((self.saturationPercentage / 100.) * 2048) # default
+            fullScale = passDict.get("maxPossibleValue", 2048) # default; 2048 times the bin area for binned images
             if "hardware" in passDict["parms"]:
                 if "maxadcvalue" in passDict["parms"]["hardware"]:
-                    satLevel = int((self.saturationPercentage / 100.) * int(passDict["parms"]["hardware"]["maxadcvalue"])) # replace with real value if provided
+                    # replace with real value if provided, scaled by the bin area since binned pixels are sums
+                    fullScale = int(passDict["parms"]["hardware"]["maxadcvalue"]) * (fullScale // 2048)
+            satLevel = int((self.saturationPercentage / 100.) * fullScale)
           # self.curSatMask.setCompositionMode(QtGui.QPainter.CompositionMode_Difference)
             tempData = passDict["data"][self.curChannel][self.curFrame]
             tempMask = tempData >= satLevel
@@ -159,12 +164,13 @@ class clsImageWin(QtGui.QMainWindow):
         tempColor = self.displayColorScheme
         imageList = []
         for oneImageFN in sorted(glob.glob(stackFolder + "/*.*")):
-            tempDict = self.getImageDict(oneImageFN)
+            tempDict = self.getImageDict(oneImageFN, allowLazy=False)
             if tempDict:
                 imageList.append(tempDict)
         if not imageList:
             print("Could not find any image files in folder: " + stackFolder)
             return None
+        self._releaseImageDict(self.retDict)
         newDict = imageList[0].copy()
         for oneChanLetter in imageList[0]["channelLetters"]:
             tempStack = []
@@ -172,7 +178,7 @@ class clsImageWin(QtGui.QMainWindow):
                 if len(oneImageDict["data"][oneChanLetter]) == 1:
                     tempStack.append(oneImageDict["data"][oneChanLetter][0]) # single image
                 else:
-                    tempStack.append(np.mean(np.array(tempDict["data"][oneChanLetter]), 0)) # a movie so average
+                    tempStack.append(np.mean(oneImageDict["data"][oneChanLetter], 0)) # a movie so average
                     print("Average movie to get one frame xx")
             # tempArray = np.asarray(tempStack) # convert from a list of 2D images into a 3D array
             if not colorizeDepth:
@@ -194,12 +200,19 @@ class clsImageWin(QtGui.QMainWindow):
         # self.displayColorScheme = tempColor # restore LUT
 
 
-    def getImageDict(self, fileName, lagPixelsAdjust=0):
+    def getImageDict(self, fileName, lagPixelsAdjust=0, allowLazy=True):
         # refactored 17 Feb 2017 to enable reading multiple types of image files
         fileType = path.splitext(fileName)[1].lower()
         tempDict = None
         if fileType in [".zip", ".gsi"]:
-            tempDict = PI.loadRasterZipFile(fileName, lagPixelsAdjust=lagPixelsAdjust, fastMode=False)
+            if self.lazyLoad and allowLazy and not self.autoAverage:
+                tempDict = PI.openRasterZipFile(fileName, lagPixelsAdjust=lagPixelsAdjust)
+            else:
+                # raw ADC data is not kept; the first lag command reads it from the file (see rephaseRasterData)
+                tempDict = PI.loadRasterZipFile(fileName, lagPixelsAdjust=lagPixelsAdjust, fastMode=False)
+        elif fileType in [".h5", ".hdf5"]:
+            # chunked h5 movies are read frame by frame when lazyLoad is on
+            tempDict = PI.loadRasterH5File(fileName, lazy=self.lazyLoad and allowLazy and not self.autoAverage)
         elif fileType in [".img"]:
             print("img load not implemented yet")
         elif fileType in [".tif", ".tiff"]:
@@ -212,18 +225,74 @@ class clsImageWin(QtGui.QMainWindow):
         if self.allowFileLoad:
             tempDict = self.getImageDict(fileName, lagPixelsAdjust=self.postLagTweakPixels)
             if tempDict:
-                if self.autoAverage and tempDict["numFrames"] > 1:
-                    for oneChanLetter in tempDict["channelLetters"]:
-                        tempDict["data"][oneChanLetter] = [np.mean(np.array(tempDict["data"][oneChanLetter]), 0)]
-                    tempDict["numFrames"] = 1
-                self.retDict = tempDict # returned Dict is valid so replace current Dict stored in class instance
-                self._agumentDictWithInfoStrings(self.retDict) # add display border information
-                self.loadedFileName = fileName
-                if self.curChannelIndex >= len(self.retDict["channelLetters"]):
-                    self.curChannelIndex = 0 # reset if now impossible to display previous channelIndex
-                self.curChannel = self.retDict["channelLetters"][self.curChannelIndex]
-                self.curFrame = 0
+                self._displayNewDict(tempDict, fileName)
+
+    def loadImageFromDict(self, imageDict):
+        # shows an image Dict that is already decoded (acquired data received in memory); several windows can be
+        #   passed the same Dict so this window keeps its own copy of the top level and of the data Dict
+        if self.allowFileLoad and imageDict:
+            tempDict = dict(imageDict)
+            tempDict["data"] = dict(imageDict["data"])
+            if self.postLagTweakPixels != tempDict.get("lagPixelsAdjust", 0):
+                if "rawData" not in tempDict:
+                    # raw ADC data is not kept with acquired images, so decode the saved file with this lag
+                    DS.waitForFileWrite(tempDict["loadedFileName"])
+                    self.loadImageFile(tempDict["loadedFileName"])
+                    return
+                if not PI.rephaseRasterData(tempDict, self.postLagTweakPixels):
+                    return
+            self._displayNewDict(tempDict, tempDict["loadedFileName"])
+
+    def _displayNewDict(self, tempDict, fileName):
+        self._autoAverageDict(tempDict)
+        self._releaseImageDict(self.retDict)
+        self.retDict = tempDict # returned Dict is valid so replace current Dict stored in class instance
+        self._agumentDictWithInfoStrings(self.retDict) # add display border information
+        self.loadedFileName = fileName
+        if self.curChannelIndex >= len(self.retDict["channelLetters"]):
+            self.curChannelIndex = 0 # reset if now impossible to display previous channelIndex
+        self.curChannel = self.retDict["channelLetters"][self.curChannelIndex]
+        self.curFrame = 0
+        self.refreshImageDisplay()
+
+    def _autoAverageDict(self, tempDict):
+        # replaces each movie with its average frame when autoAverage is on
+        if self.autoAverage and tempDict["numFrames"] > 1:
+            for oneChanLetter in tempDict["channelLetters"]:
+                tempDict["data"][oneChanLetter] = np.mean(tempDict["data"][oneChanLetter], 0, keepdims=True) # one-frame stack
+            tempDict["numFrames"] = 1
+
+    def changeLag(self, newLagPixels):
+        # redecodes the current image with a new (possibly fractional) lag adjustment; the raw ADC data is read
+        # from the file on the first change and kept with the image so later changes do not read the file again
+        self.postLagTweakPixels = newLagPixels
+        if self.retDict and path.splitext(self.loadedFileName)[1].lower() in [".zip", ".gsi"]:
+            numFrames = self.retDict["numFrames"]
+            self.retDict["numFrames"] = int(self.retDict["parms"]["numframes"])
+            if PI.rephaseRasterData(self.retDict, newLagPixels):
+                self._autoAverageDict(self.retDict)
+                self._agumentDictWithInfoStrings(self.retDict) # description includes the lag
                 self.refreshImageDisplay()
+                return
+            self.retDict["numFrames"] = numFrames
+        self.loadImageFile(self.loadedFileName) # reload zip file to change lag decoding
+
+    def autoAdjustLag(self):
+        # finds the lag adjustment that best meshes odd and even rows of the displayed frame and redisplays
+        if self.loadedFileName and path.splitext(self.loadedFileName)[1].lower() in [".zip", ".gsi"]:
+            bestLag = PI.findRasterLagAdjust(self.loadedFileName, lagPixelsAdjust=self.postLagTweakPixels,
+                                             chanLetter=self.curChannel, frameNum=self.curFrame)
+            if bestLag is not None and bestLag != self.postLagTweakPixels:
+                self.changeLag(bestLag)
+                print("Refreshed display to reflect adjusted lag of " + str(self.postLagTweakPixels) + " pixels.")
+
+    def _releaseImageDict(self, oldDict):
+        # closes the archive held open by a lazily loaded image Dict and drops any kept raw ADC data before the
+        #   Dict is replaced
+        if oldDict and "lazyFile" in oldDict:
+            oldDict["lazyFile"].close()
+        if oldDict and "rawData" in oldDict:
+            del oldDict["rawData"]
 
     def loadImageFileOld(self, fileName):
         # not called anymore
@@ -234,7 +303,7 @@ class clsImageWin(QtGui.QMainWindow):
                 tempDict = PI.loadRasterZipFile(fileName, lagPixelsAdjust=self.postLagTweakPixels, fastMode=False)
                 if self.autoAverage and tempDict["numFrames"] > 1:
                     for oneChanLetter in tempDict["channelLetters"]:
-                        tempDict["data"][oneChanLetter] = [np.mean(np.array(tempDict["data"][oneChanLetter]), 0)]
+                        tempDict["data"][oneChanLetter] = np.mean(tempDict["data"][oneChanLetter], 0, keepdims=True) # one-frame stack
                     tempDict["numFrames"] = 1
                 if tempDict:
                     self.retDict = tempDict # returned Dict is valid so replace current Dict stored in class instance
@@ -462,8 +531,9 @@ class clsImageWin(QtGui.QMainWindow):
             self.autoDisplayLevel = False
             span = self.maxDisplayLevel - self.minDisplayLevel
             self.maxDisplayLevel = int(self.minDisplayLevel + (1.25 * span))
-            if self.maxDisplayLevel >= 2048:
-                self.maxDisplayLevel = 2048
+            maxPossibleLevel = self.retDict.get("maxPossibleValue", 2048) # larger for binned images
+            if self.maxDisplayLevel >= maxPossibleLevel:
+                self.maxDisplayLevel = maxPossibleLevel
             self.refreshImageDisplay()
         if evt.key() == QtCore.Qt.Key_PageUp and self.retDict:
                 self.minDisplayLevel = self.minDisplayLevel + 10
@@ -482,7 +552,7 @@ class clsImageWin(QtGui.QMainWindow):
         if evt.key() == QtCore.Qt.Key_S and self.retDict:
             self.saveCurrent()
         if evt.key() == QtCore.Qt.Key_W and self.retDict:
-            RP.plotLag(self.retDict, self.postLagTweakPixels)
+            self.autoAdjustLag()
         if evt.key() == QtCore.Qt.Key_K:
             self.loadImageStackviaPopUp()
         if evt.key() == QtCore.Qt.Key_E and self.retDict:
@@ -664,9 +734,10 @@ class clsImageWin(QtGui.QMainWindow):
                     print("Zoom parameter (eg, 0.5 or 2) needed to change display zoom")
             elif actualCommand in ["lag", "postlag", "lagtweak"]:
                 if len(subparts) == 2:
-                    self.postLagTweakPixels = int(subparts[1])
-                    self.loadImageFile(self.loadedFileName) # reload zip file to change lag decoding
+                    self.changeLag(float(subparts[1])) # fractional pixel values are allowed
                     print("Refreshed display to reflect adjusted lag of " + str(self.postLagTweakPixels) + " pixels.")
+            elif actualCommand in ["autolag", "findlag", "bestlag"]:
+                self.autoAdjustLag()
             elif actualCommand in ["dump", "dumpparms", "dumpparameters"]:
                 print(" ")
                 print(" Dump of stored image parameters:")
@@ -678,6 +749,11 @@ class clsImageWin(QtGui.QMainWindow):
             elif actualCommand in ["colorizedepth", "colordepth", "depth"]:
                 self.colorizeDepth = subparts[1].lower() not in falseStrings
                 print("Set colorizeDepth to " + str(self.colorizeDepth))
+            elif actualCommand in ["lazy", "lazyload", "ondemand"]:
+                self.lazyLoad = subparts[1].lower() not in falseStrings
+                print("Set lazyLoad (decode frames only when displayed) to " + str(self.lazyLoad))
+                if self.loadedFileName:
+                    self.loadImageFile(self.loadedFileName)
             elif actualCommand in ["autoaverage", "average", "ave"]:
                 if int(subparts[1]) == 1:
                     self.autoAverage = True
@@ -702,7 +778,7 @@ class clsImageWin(QtGui.QMainWindow):
                                                      startFolder, options=options)[0]
         if fileName:
             print("Filename: " + fileName)
-            if path.splitext(fileName)[1].lower() in [".tif", ".tiff", ".zip", ".img", ".gsi"]:
+            if path.splitext(fileName)[1].lower() in [".tif", ".tiff", ".zip", ".img", ".gsi", ".h5", ".hdf5"]:
                 self.lastLoadFileFolder = path.split(fileName)[0]
                 self.loadImageFile(fileName)
             else:
@@ -728,6 +804,8 @@ class clsImageWin(QtGui.QMainWindow):
             newFormat = "bin"
         elif codeStr in ["tif", "tiff"]:
             newFormat = "tif"
+        elif codeStr in ["h5", "hdf5", "hdf"]:
+            newFormat = "h5" # whole movie, chunked for reading single frames or crops
         elif codeStr in ["png"]:
             newFormat = "png"
         else:
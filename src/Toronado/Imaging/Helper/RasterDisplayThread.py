@@ -50,6 +50,8 @@ class clsRasterDisplayThread(QtCore.QThread):
     def displayNewItem(self):
         if self.newDisplayItem:
             for oneWindow in self.imageWindows:
-                oneWindow.loadImageFile(self.newDisplayItem)
-                #oneWindow.loadImageFromDict(self.newDisplayItem)
+                if isinstance(self.newDisplayItem, dict):
+                    oneWindow.loadImageFromDict(self.newDisplayItem) # already decoded from data received in memory
+                else:
+                    oneWindow.loadImageFile(self.newDisplayItem)
             self.newDisplayItem = None
@@ -3,6 +3,7 @@
 
 This routine calls specialized non-raster scans used in the photometry mode.
 This non-raster scan generation module is required for Toronado (ie, do not delete this file)
+Every shape is one cycle of offsets around the spot center (patternOffsets) that is repeated for the sweep.
 
 last revised 19 Dec 2017 BWS
 
@@ -11,236 +12,101 @@ last revised 19 Dec 2017 BWS
 import sys, os, math
 import os.path as path
 import numpy as np
-
-def circle(allParms):
-    localInputFolder = allParms["Interface"]["localInputFolder"]
-    centerX = float(allParms["Minor"]["photometryCurXvolts"])
-    centerY = float(allParms["Minor"]["photometryCurYvolts"])
-    sweepDurMs = float(allParms["Minor"]["photometryDurMs"])
-    diameterMicrons = float(allParms["Minor"]["photometryDiameter"])
-    msPerRev = 1. / float(allParms["Minor"]["photometryRevPerMs"])
-    pixelUs = 1. # photometry always goes at 1 MHz pixel clock
-    pointsPerMs = int(1. / (pixelUs / 1000.))
-    pointsPerRev = int(pointsPerMs * msPerRev)
-    numRevRepeats = 1 + int(sweepDurMs / msPerRev) # add one extra rev
-
-    micronsPerVolt10X = float(allParms["system"]["micronspervolt10x"])
+import Imaging.Helper.Scans.scanFiles as SF
+
+def circle(allParms, zipMembers=None):
+    return _armPhotometryShape("circle", allParms, zipMembers)
+
+def lissajous(allParms, zipMembers=None):
+    return _armPhotometryShape("lissajous", allParms, zipMembers)
+
+def halfspiral(allParms, zipMembers=None):
+    return _armPhotometryShape("halfspiral", allParms, zipMembers)
+
+def spiral(allParms, zipMembers=None):
+    return _armPhotometryShape("spiral", allParms, zipMembers)
+
+def patternOffsets(shapeName, settings):
+    # one cycle of the shape as X and Y offsets in volts from the spot center
+    if shapeName == "circle":
+        return _ringOffsets(np.array([settings["outerRadius"]]), np.array([settings["pointsPerRev"]]))
+    if shapeName == "lissajous":
+        theta = np.pi / 2.
+        lissA = 3 # should be even
+        lissB = 4 # odd and one away from lissA
+        oneCircleTh = np.linspace(0, 2 * np.pi, settings["pointsPerRev"], endpoint = False)
+        return (settings["outerRadius"] * np.sin(theta + (lissA * oneCircleTh)),
+                settings["outerRadius"] * np.cos(lissB * oneCircleTh))
+    if shapeName in ["spiral", "halfspiral"]:
+        # rings step in to innerFraction of the outer radius and back out again; the number of steps is fixed for
+        #   now rather than taken from photometrySpiralSteps (actually almost twice this since it goes in and out)
+        if shapeName == "spiral":
+            numSpiralSteps, innerFraction = 5, 0.1 # go to 10% of initial diam
+        else:
+            numSpiralSteps, innerFraction = 3, 0.5 # go to 50% of initial diam
+        outerRadius = settings["outerRadius"]
+        radiusSteps = np.linspace(outerRadius, innerFraction * outerRadius, numSpiralSteps)
+        radii = np.concatenate((radiusSteps, np.sort(radiusSteps[:-1]))) # inner-most circle is not repeated
+        outerCircum = 2 * outerRadius * np.pi
+        ringPoints = (settings["pointsPerRev"] * ((2 * radii * np.pi) / outerCircum)).astype(int)
+        return _ringOffsets(radii, ringPoints)
+    raise ValueError("unknown photometry shape: " + shapeName)
+
+def _ringOffsets(radii, ringPoints):
+    # all rings in one preallocated pass: ring n has ringPoints[n] points evenly spaced around a circle of radius
+    #   radii[n]; angles are computed exactly as np.linspace(0, 2 * np.pi, ringPoints[n], endpoint=False) would
+    ringStarts = np.concatenate(([0], np.cumsum(ringPoints)[:-1]))
+    pointIndex = np.arange(np.sum(ringPoints), dtype="float64") - np.repeat(ringStarts, ringPoints)
+    ringTheta = pointIndex * np.repeat(2 * np.pi / np.maximum(ringPoints, 1), ringPoints)
+    pointRadius = np.repeat(radii, ringPoints)
+    return pointRadius * np.cos(ringTheta), pointRadius * np.sin(ringTheta)
+
+def _photometrySettings(allParms):
+    settings = {}
+    settings["sweepDurMs"] = float(allParms["Minor"]["photometryDurMs"])
+    settings["msPerRev"] = 1. / float(allParms["Minor"]["photometryRevPerMs"])
+    settings["pixelUs"] = 1. # photometry always goes at 1 MHz pixel clock
+    settings["pointsPerMs"] = int(1. / (settings["pixelUs"] / 1000.))
+    settings["pointsPerRev"] = int(settings["pointsPerMs"] * settings["msPerRev"])
+    # passed in mV, convert to Volts and radius [xx change after is known]
+    settings["outerRadius"] = float(allParms["Minor"]["photometryDiameter"]) / 2000.
+    settings["micronsPerVolt10X"] = float(allParms["system"]["micronspervolt10x"])
     objectiveStr = allParms["minor"]["objective"].upper().strip()
-    magnification = float(objectiveStr.split("X")[0])
+    settings["magnification"] = float(objectiveStr.split("X")[0])
+    return settings
 
-    newParms = {}
-    circleRadius = diameterMicrons / 2000. # passed in mV, convert to Volts and radius [xx change after is known]
-    oneCircleTh = np.linspace(0, 2 * np.pi, pointsPerRev, endpoint = False)
-    oneCircleX = centerX + (circleRadius * np.cos(oneCircleTh))
-    oneCircleY = centerY + (circleRadius * np.sin(oneCircleTh))
-    satScan = 0
-    if max(oneCircleX) > 9.996:
-        satScan = 1
-    if min(oneCircleX) < -9.996:
-        satScan = -1
-    newParms["saturatedFrameX"] = str(satScan)
-    satScan = 0
-    if max(oneCircleY) > 9.996:
-        satScan = 1
-    if min(oneCircleY) < -9.996:
-        satScan = -1
-    newParms["saturatedFrameY"] = str(satScan)
-    scanPointsX = np.tile(oneCircleX, numRevRepeats)
-    scanPointsY = np.tile(oneCircleY, numRevRepeats)
-    newParms["numRevs"] = str(numRevRepeats)
-    newParms["msPerRev"] = str(msPerRev)
-    newParms["pixelUs"] = str(pixelUs)
-    newParms["scanPointsX"] ="ScanPointsX_float64.bin"
-    newParms["scanPointsY"] ="ScanPointsY_float64.bin"
-    scanPointsX.tofile(localInputFolder + "/" + newParms["scanPointsX"])
-    scanPointsY.tofile(localInputFolder + "/" + newParms["scanPointsY"])
-    #print("Photometry circle diam volts: " + str(2 * circleRadius))
-    print("Photometry circle mode is armed (" + str(len(oneCircleX)) + " points per cycle).")
-    return newParms
+def _saturationFlag(oneCycle):
+    # 1 if the pattern goes above +9.996 V, -1 if it goes below -9.996 V (takes precedence), otherwise 0
+    if np.min(oneCycle) < -9.996:
+        return -1
+    return 1 if np.max(oneCycle) > 9.996 else 0
 
-def lissajous(allParms):
+def _armPhotometryShape(shapeName, allParms, zipMembers):
     localInputFolder = allParms["Interface"]["localInputFolder"]
-    centerX = float(allParms["Minor"]["photometryCurXvolts"])
-    centerY = float(allParms["Minor"]["photometryCurYvolts"])
-    sweepDurMs = float(allParms["Minor"]["photometryDurMs"])
-    diameterMicrons = float(allParms["Minor"]["photometryDiameter"])
-    msPerRev = 1. / float(allParms["Minor"]["photometryRevPerMs"])
-    pixelUs = 1. # photometry always goes at 1 MHz pixel clock
-    pointsPerMs = int(1. / (pixelUs / 1000.))
-    pointsPerRev = int(pointsPerMs * msPerRev)
-    numRevRepeats = 1 + int(sweepDurMs / msPerRev) # add one extra rev
-
-    micronsPerVolt10X = float(allParms["system"]["micronspervolt10x"])
-    objectiveStr = allParms["minor"]["objective"].upper().strip()
-    magnification = float(objectiveStr.split("X")[0])
-
+    settings = _photometrySettings(allParms)
+    if shapeName in ["spiral", "halfspiral"] and settings["outerRadius"] <= 0:
+        # ring sizes are fractions of the outer ring; a zero diameter circle or lissajous is just a parked spot
+        print("ERROR - photometryDiameter must be greater than zero for " + shapeName + " photometry")
+        return False
+    offsetsX, offsetsY = patternOffsets(shapeName, settings)
+    oneCycleX = float(allParms["Minor"]["photometryCurXvolts"]) + offsetsX
+    oneCycleY = float(allParms["Minor"]["photometryCurYvolts"]) + offsetsY
     newParms = {}
-    circleRadius = diameterMicrons / 2000. # passed in mV, convert to Volts and radius [xx change after is known]
-    theta = np.pi / 2.
-    lissA = 3 # should be even
-    lissB = 4 # odd and one away from lissA
-    oneCircleTh = np.linspace(0, 2 * np.pi, pointsPerRev, endpoint = False)
-    oneCircleX = centerX + (circleRadius * np.sin(theta + (lissA * oneCircleTh)))
-    oneCircleY = centerY + (circleRadius * np.cos(lissB * oneCircleTh))
-    satScan = 0
-    if max(oneCircleX) > 9.996:
-        satScan = 1
-    if min(oneCircleX) < -9.996:
-        satScan = -1
-    newParms["saturatedFrameX"] = str(satScan)
-    satScan = 0
-    if max(oneCircleY) > 9.996:
-        satScan = 1
-    if min(oneCircleY) < -9.996:
-        satScan = -1
-    newParms["saturatedFrameY"] = str(satScan)
-    scanPointsX = np.tile(oneCircleX, numRevRepeats)
-    scanPointsY = np.tile(oneCircleY, numRevRepeats)
+    newParms["saturatedFrameX"] = str(_saturationFlag(oneCycleX))
+    newParms["saturatedFrameY"] = str(_saturationFlag(oneCycleY))
+    if shapeName in ["circle", "lissajous"]:
+        numRevRepeats = 1 + int(settings["sweepDurMs"] / settings["msPerRev"]) # add one extra rev
+    else:
+        spiralMs = np.size(oneCycleY) * (1. / settings["pointsPerMs"])
+        numRevRepeats = 1 + int(settings["sweepDurMs"] / spiralMs) # add one extra spiral
+    scanPointsX = np.tile(oneCycleX, numRevRepeats)
+    scanPointsY = np.tile(oneCycleY, numRevRepeats)
     newParms["numRevs"] = str(numRevRepeats)
-    newParms["msPerRev"] = str(msPerRev)
-    newParms["pixelUs"] = str(pixelUs)
+    newParms["msPerRev"] = str(settings["msPerRev"])
+    newParms["pixelUs"] = str(settings["pixelUs"])
     newParms["scanPointsX"] ="ScanPointsX_float64.bin"
     newParms["scanPointsY"] ="ScanPointsY_float64.bin"
-    scanPointsX.tofile(localInputFolder + "/" + newParms["scanPointsX"])
-    scanPointsY.tofile(localInputFolder + "/" + newParms["scanPointsY"])
-    #print("Photometry circle diam volts: " + str(2 * circleRadius))
-    print("Photometry circle mode is armed (" + str(len(oneCircleX)) + " points per cycle).")
+    SF.saveScanPoints(scanPointsX, newParms["scanPointsX"], localInputFolder, zipMembers)
+    SF.saveScanPoints(scanPointsY, newParms["scanPointsY"], localInputFolder, zipMembers)
+    print("Photometry " + shapeName + " mode is armed (" + str(len(oneCycleX)) + " points per cycle).")
     return newParms
-
-def halfspiral(allParms):
-    localInputFolder = allParms["Interface"]["localInputFolder"]
-    centerX = float(allParms["Minor"]["photometryCurXvolts"])
-    centerY = float(allParms["Minor"]["photometryCurYvolts"])
-    sweepDurMs = float(allParms["Minor"]["photometryDurMs"])
-    diameterMicrons = float(allParms["Minor"]["photometryDiameter"])
-    msPerRev = 1. / float(allParms["Minor"]["photometryRevPerMs"])
-    pixelUs = 1. # photometry always goes at 1 MHz pixel clock
-    pointsPerMs = int(1. / (pixelUs / 1000.))
-    pointsPerRev = int(pointsPerMs * msPerRev) # calc as per circle
-
-    micronsPerVolt10X = float(allParms["system"]["micronspervolt10x"])
-    objectiveStr = allParms["minor"]["objective"].upper().strip()
-    magnification = float(objectiveStr.split("X")[0])
-
-    newParms = {}
-    outerCircleRadius = diameterMicrons / 2000. # passed in mV, convert to Volts and radius [xx change after is known]
-    outerCircum = 2 * outerCircleRadius * np.pi
-    # numSpiralSteps = int(allParms["Minor"]["photometrySpiralSteps"])
-    numSpiralSteps = 3
-     # actually almost twice this because it goes in and out that number of steps
-    oneSpiralX = np.zeros(0) # empty float array
-    oneSpiralY = np.zeros(0)
-
-    radiusSteps = np.linspace(outerCircleRadius, 0.5 * outerCircleRadius, numSpiralSteps) # go to 50% of initial diam
-    for radius in radiusSteps: # going smaller part of spiral
-        thisCircleCircum = 2 * radius * np.pi
-        pointsThisCircle = int(pointsPerRev * (thisCircleCircum / outerCircum))
-        oneCircleTh = np.linspace(0, 2 * np.pi, pointsThisCircle, endpoint = False)
-        oneSpiralX = np.concatenate((oneSpiralX, centerX + (radius * np.cos(oneCircleTh))))
-        oneSpiralY = np.concatenate((oneSpiralY, centerY + (radius * np.sin(oneCircleTh))))
-
-    radiusSteps = np.sort(radiusSteps[:-1]) # don't repeat inner-most circle then go back out to largest circle
-    for radius in radiusSteps: # going bigger part of spiral
-        thisCircleCircum = 2 * radius * np.pi
-        pointsThisCircle = int(pointsPerRev * (thisCircleCircum / outerCircum))
-        oneCircleTh = np.linspace(0, 2 * np.pi, pointsThisCircle, endpoint = False)
-        oneSpiralX = np.concatenate((oneSpiralX, centerX + (radius * np.cos(oneCircleTh))))
-        oneSpiralY = np.concatenate((oneSpiralY, centerY + (radius * np.sin(oneCircleTh))))
-
-    spiralMs = np.size(oneSpiralY) * (1. / pointsPerMs)
-    satScan = 0
-    if max(oneSpiralX) > 9.996:
-        satScan = 1
-    if min(oneSpiralX) < -9.996:
-        satScan = -1
-    newParms["saturatedFrameX"] = str(satScan)
-    satScan = 0
-    if max(oneSpiralY) > 9.996:
-        satScan = 1
-    if min(oneSpiralY) < -9.996:
-        satScan = -1
-    newParms["saturatedFrameY"] = str(satScan)
-
-    numRevRepeats = 1 + int(sweepDurMs / spiralMs) # add one extra spiral
-    scanPointsX = np.tile(oneSpiralX, numRevRepeats)
-    scanPointsY = np.tile(oneSpiralY, numRevRepeats)
-    newParms["numRevs"] = str(numRevRepeats)
-    newParms["msPerRev"] = str(msPerRev)
-    newParms["pixelUs"] = str(pixelUs)
-    newParms["scanPointsX"] ="ScanPointsX_float64.bin"
-    newParms["scanPointsY"] ="ScanPointsY_float64.bin"
-    scanPointsX.tofile(localInputFolder + "/" + newParms["scanPointsX"])
-    scanPointsY.tofile(localInputFolder + "/" + newParms["scanPointsY"])
-    #print("Photometry circle diam volts: " + str(2 * circleRadius))
-    print("Photometry halfspiral mode is armed (" + str(len(oneSpiralX)) + " points per cycle).")
-    return newParms
-
-def spiral(allParms):
-    localInputFolder = allParms["Interface"]["localInputFolder"]
-    centerX = float(allParms["Minor"]["photometryCurXvolts"])
-    centerY = float(allParms["Minor"]["photometryCurYvolts"])
-    sweepDurMs = float(allParms["Minor"]["photometryDurMs"])
-    diameterMicrons = float(allParms["Minor"]["photometryDiameter"])
-    msPerRev = 1. / float(allParms["Minor"]["photometryRevPerMs"])
-    pixelUs = 1. # photometry always goes at 1 MHz pixel clock
-    pointsPerMs = int(1. / (pixelUs / 1000.))
-    pointsPerRev = int(pointsPerMs * msPerRev) # calc as per circle
-
-    micronsPerVolt10X = float(allParms["system"]["micronspervolt10x"])
-    objectiveStr = allParms["minor"]["objective"].upper().strip()
-    magnification = float(objectiveStr.split("X")[0])
-
-    newParms = {}
-    outerCircleRadius = diameterMicrons / 2000. # passed in mV, convert to Volts and radius [xx change after is known]
-    outerCircum = 2 * outerCircleRadius * np.pi
-    # numSpiralSteps = int(allParms["Minor"]["photometrySpiralSteps"])
-    numSpiralSteps = 5
-     # actually almost twice this because it goes in and out that number of steps
-    oneSpiralX = np.zeros(0) # empty float array
-    oneSpiralY = np.zeros(0)
-
-    radiusSteps = np.linspace(outerCircleRadius, 0.1 * outerCircleRadius, numSpiralSteps) # go to 10% of initial diam
-    for radius in radiusSteps: # going smaller part of spiral
-        thisCircleCircum = 2 * radius * np.pi
-        pointsThisCircle = int(pointsPerRev * (thisCircleCircum / outerCircum))
-        oneCircleTh = np.linspace(0, 2 * np.pi, pointsThisCircle, endpoint = False)
-        oneSpiralX = np.concatenate((oneSpiralX, centerX + (radius * np.cos(oneCircleTh))))
-        oneSpiralY = np.concatenate((oneSpiralY, centerY + (radius * np.sin(oneCircleTh))))
-
-    radiusSteps = np.sort(radiusSteps[:-1]) # don't repeat inner-most circle then go back out to largest circle
-    for radius in radiusSteps: # going bigger part of spiral
-        thisCircleCircum = 2 * radius * np.pi
-        pointsThisCircle = int(pointsPerRev * (thisCircleCircum / outerCircum))
-        oneCircleTh = np.linspace(0, 2 * np.pi, pointsThisCircle, endpoint = False)
-        oneSpiralX = np.concatenate((oneSpiralX, centerX + (radius * np.cos(oneCircleTh))))
-        oneSpiralY = np.concatenate((oneSpiralY, centerY + (radius * np.sin(oneCircleTh))))
-
-    spiralMs = np.size(oneSpiralY) * (1. / pointsPerMs)
-    satScan = 0
-    if max(oneSpiralX) > 9.996:
-        satScan = 1
-    if min(oneSpiralX) < -9.996:
-        satScan = -1
-    newParms["saturatedFrameX"] = str(satScan)
-    satScan = 0
-    if max(oneSpiralY) > 9.996:
-        satScan = 1
-    if min(oneSpiralY) < -9.996:
-        satScan = -1
-    newParms["saturatedFrameY"] = str(satScan)
-
-    numRevRepeats = 1 + int(sweepDurMs / spiralMs) # add one extra spiral
-    scanPointsX = np.tile(oneSpiralX, numRevRepeats)
-    scanPointsY = np.tile(oneSpiralY, numRevRepeats)
-    newParms["numRevs"] = str(numRevRepeats)
-    newParms["msPerRev"] = str(msPerRev)
-    newParms["pixelUs"] = str(pixelUs)
-    newParms["scanPointsX"] ="ScanPointsX_float64.bin"
-    newParms["scanPointsY"] ="ScanPointsY_float64.bin"
-    scanPointsX.tofile(localInputFolder + "/" + newParms["scanPointsX"])
-    scanPointsY.tofile(localInputFolder + "/" + newParms["scanPointsY"])
-    #print("Photometry circle diam volts: " + str(2 * circleRadius))
-    print("Photometry halfspiral mode is armed (" + str(len(oneSpiralX)) + " points per cycle).")
-    return newParms
-
-
@@ -12,8 +12,10 @@ last revised 1 Apr 2017 BWS
 import sys, os, math
 import os.path as path
 import numpy as np
+import Imaging.Helper.Scans.scanFiles as SF
 
-def standard(allParms, newParms):
+def standard(allParms, newParms, zipMembers=None):
+    # zipMembers (optional Dict) collects the scan waveform bytes for an in-memory zip instead of writing files
     localInputFolder = allParms["Interface"]["localInputFolder"]
     pixelsX = int(allParms["Major"]["Xsize"])
     pixelsY = int(allParms["Major"]["Ysize"])
@@ -132,15 +134,9 @@ def standard(allParms, newParms):
                          pixelsX + turnLength)
 
     # rotate frame if needed
-    if int(allParms["Minor"]["rotation"]) != 0:
-        rot = np.radians(float(allParms["Major"]["rotation"]))
-        mSinRot = math.sin(rot)
-        mCosRot = math.cos(rot)
-        for ii in range(len(scanPointsX)):
-            TX = scanPointsX[ii]
-            TY = scanPointsY[ii]
-            scanPointsX[ii] = (((TX - mXcenter) * mCosRot) - ((TY - mYcenter) * mSinRot)) + mXcenter
-            scanPointsY[ii] = (((TX - mXcenter) * mSinRot) + ((TY - mYcenter) * mCosRot)) + mYcenter
+    if float(allParms["Minor"]["rotation"]) != 0:
+        scanPointsX, scanPointsY = rotateFrame(scanPointsX, scanPointsY, float(allParms["Minor"]["rotation"]),
+                                               mXcenter, mYcenter)
 
     # Save scan waveforms as binary files and generate final parameter text file with all new and old values
     #  only save one frame even if multi-frame movie requested; assume hardware computer will duplicate frame
@@ -156,10 +152,36 @@ def standard(allParms, newParms):
     if min(scanPointsY) < -9.996:
         satScan = -1
     newParms["saturatedFrameY"] = str(satScan)
-    newParms["scanPointsX"] ="ScanPointsX_float64.bin"
-    scanPointsX.tofile(localInputFolder + "/" + newParms["scanPointsX"])
-    newParms["scanPointsY"] = "ScanPointsY_float64.bin"
-    scanPointsY.tofile(localInputFolder + "/" + newParms["scanPointsY"])
+    rowPairOnly, sampleType = SF.scanEncoding(allParms)
+    if rowPairOnly and float(allParms["Minor"]["rotation"]) != 0:
+        rowPairOnly = False # a rotated frame is no longer a repeated row pair plus a Y ramp
+        print("Warning: rotated scans are sent as full frames (scanEncoding rowpair ignored)")
+    if sampleType != "float64" or rowPairOnly:
+        newParms["scanSampleType"] = sampleType
+    if rowPairOnly:
+        # hardware side rebuilds the frame as tile(rowPair, Ysize/2) and a Y ramp held for each line
+        newParms["scanDescription"] = "rowpair"
+        newParms["scanRows"] = str(pixelsY)
+        newParms["scanPointsPerLine"] = str(pixelsX + turnLength)
+        newParms["scanYstartVolts"] = repr(mYcenter + halfVoltsY)
+        newParms["scanYendVolts"] = repr(mYcenter - halfVoltsY)
+        newParms["scanRowPairX"] = SF.saveEncodedScanPoints(rowPair, "ScanRowPairX", sampleType, localInputFolder,
+                                                            zipMembers)
+    else:
+        newParms["scanPointsX"] = SF.saveEncodedScanPoints(scanPointsX, "ScanPointsX", sampleType, localInputFolder,
+                                                           zipMembers)
+        newParms["scanPointsY"] = SF.saveEncodedScanPoints(scanPointsY, "ScanPointsY", sampleType, localInputFolder,
+                                                           zipMembers)
     return newParms
     
 
+def rotateFrame(scanPointsX, scanPointsY, rotationDegrees, centerX, centerY):
+    # rotates the whole frame about (centerX, centerY) with one 2x2 rotation matrix applied to the stacked X/Y
+    #   offsets; each element is computed with the same operations in the same order as the original per-point
+    #   loop (x' = dX*cos - dY*sin + centerX, y' = dX*sin + dY*cos + centerY) so the waveforms are bit-identical
+    rot = np.radians(rotationDegrees)
+    rotMatrix = np.array([[math.cos(rot), -1. * math.sin(rot)], [math.sin(rot), math.cos(rot)]])
+    offsets = np.stack((scanPointsX - centerX, scanPointsY - centerY))
+    rotated = rotMatrix[:, 0:1] * offsets[0] + rotMatrix[:, 1:2] * offsets[1]
+    rotated += np.array([[centerX], [centerY]])
+    return rotated[0], rotated[1]
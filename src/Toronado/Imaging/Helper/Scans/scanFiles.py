@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+""" scanFiles.py
+
+Output helpers shared by the scan generation modules. Scan waveforms are either written to the local input
+folder (the original on-disk path) or collected as bytes in a zipMembers Dict that doScan turns into the
+command zip file in memory.
+
+The optional Minor parameter scanEncoding selects a more compact transport for the standard scans: full frames as
+float64 (the default, what the original hardware program reads), float32 or int16 DAC codes, and "rowpair" sends
+only the X row pair plus the slow-axis Y ramp settings. expandScanPoints turns any of these back into one frame
+of float64 waveforms on the hardware side (see hardwareStandIn.py).
+
+"""
+
+import os
+import numpy as np
+
+scanSampleTypes = ["float64", "float32", "int16"]
+dacVoltsPerCode = 10. / 32768. # int16 codes span -10 to +10 V like a 16-bit scan DAC
+
+def saveScanPoints(scanPoints, fileName, localInputFolder, zipMembers=None):
+    # scanPoints is a numpy array; fileName is the name used inside the zip file (eg ScanPointsX_float64.bin)
+    if zipMembers is None:
+        scanPoints.tofile(localInputFolder + "/" + fileName)
+    else:
+        zipMembers[fileName] = scanPoints.tobytes()
+
+def saveScanText(text, fileName, localInputFolder, zipMembers=None):
+    # text files get the same line endings they would have if written to disk in text mode
+    if zipMembers is None:
+        with open(localInputFolder + "/" + fileName, "w") as fOut:
+            fOut.write(text)
+    else:
+        zipMembers[fileName] = text.replace("\n", os.linesep).encode()
+
+def scanEncoding(allParms):
+    # returns (rowPairOnly, sampleType) from the Minor scanEncoding parameter, eg "float32" or "rowpair int16"
+    encodingWords = allParms["Minor"].get("scanencoding", "float64").lower().replace(",", " ").split()
+    sampleType = "float64"
+    for oneWord in encodingWords:
+        if oneWord in scanSampleTypes:
+            sampleType = oneWord
+        elif oneWord != "rowpair":
+            print("Warning: ignored unknown scanEncoding entry: " + oneWord)
+    return "rowpair" in encodingWords, sampleType
+
+def encodeScanPoints(scanPoints, sampleType):
+    if sampleType == "int16":
+        return np.clip(np.round(scanPoints / dacVoltsPerCode), -32768, 32767).astype("int16")
+    return scanPoints.astype(sampleType, copy=False)
+
+def decodeScanPoints(fileBytes, sampleType):
+    # returns float64 volts from the bytes of a file written by saveEncodedScanPoints
+    scanPoints = np.frombuffer(fileBytes, dtype=sampleType)
+    if sampleType == "int16":
+        return scanPoints * dacVoltsPerCode
+    return scanPoints.astype("float64")
+
+def saveEncodedScanPoints(scanPoints, baseName, sampleType, localInputFolder, zipMembers=None):
+    # saves scanPoints as baseName_sampleType.bin (eg ScanPointsX_int16.bin) and returns that file name
+    fileName = baseName + "_" + sampleType + ".bin"
+    saveScanPoints(encodeScanPoints(scanPoints, sampleType), fileName, localInputFolder, zipMembers)
+    return fileName
+
+def expandScanPoints(imageParms, scanFiles):
+    # returns one frame of float64 X and Y waveforms; imageParms has the lowercase ImageDescription keys and
+    #   scanFiles is a Dict of file name => bytes. Row pair descriptions are expanded the same way
+    #   createStandardScans.standard builds its full frames (Y is rounded to the sample type like X was)
+    sampleType = imageParms.get("scansampletype", "float64")
+    if imageParms.get("scandescription", "frame") != "rowpair":
+        return (decodeScanPoints(scanFiles[imageParms["scanpointsx"]], sampleType),
+                decodeScanPoints(scanFiles[imageParms["scanpointsy"]], sampleType))
+    numRows = int(imageParms["scanrows"])
+    xFrame = np.tile(decodeScanPoints(scanFiles[imageParms["scanrowpairx"]], sampleType), int(numRows / 2))
+    yFrame = np.repeat(np.linspace(float(imageParms["scanystartvolts"]), float(imageParms["scanyendvolts"]), numRows),
+                       int(imageParms["scanpointsperline"]))
+    if sampleType != "float64":
+        yFrame = decodeScanPoints(encodeScanPoints(yFrame, sampleType).tobytes(), sampleType)
+    return xFrame, yFrame
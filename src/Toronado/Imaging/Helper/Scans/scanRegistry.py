@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+""" scanRegistry.py
+
+Finds the scan generation functions once and keeps the resolved callables so doScan does not import modules and
+look up functions on every scan. Two kinds of functions are registered:
+    raster       name(allParms, newParms, zipMembers=None)   selected by the Minor parameter scanFunction
+    photometry   name(allParms, zipMembers=None)             selected by the Minor parameter photometryShape
+Both return the Dict that becomes the [Derived] section of ImageDescription.txt (zipMembers is optional).
+
+At the first lookup every create*.py module in Imaging.Helper.Scans is imported; functions from modules with
+Photometry in their name are photometry functions and the rest are raster functions. Functions whose arguments do
+not fit their kind (eg helpers like rotateFrame) are skipped. Lab-specific modules kept elsewhere are added with
+registerScanModule("myLab.myScans") or by listing them in the System INI entry scanModules (comma separated).
+Errors while importing a module are printed with their traceback instead of being hidden.
+
+"""
+
+import importlib
+import inspect
+import pkgutil
+import threading
+import traceback
+
+scanPackageName = "Imaging.Helper.Scans"
+scanKinds = {"raster": ["allparms", "newparms"], "photometry": ["allparms"]} # required arguments of each kind
+
+_scanFunctions = {"raster": {}, "photometry": {}} # kind => name (lowercase) => (function, acceptsZipMembers)
+_skippedFunctions = {} # name (lowercase) => why a public function of a scan module was not registered
+_registeredModules = set()
+_discoveryDone = False
+_registryLock = threading.RLock()
+
+def findScanFunction(kind, functionName):
+    # returns the registered function (None after printing the reason if there is no usable one)
+    _discoverScanModules()
+    cleanName = functionName.lower().strip()
+    with _registryLock:
+        if cleanName in _scanFunctions[kind]:
+            return _scanFunctions[kind][cleanName][0]
+        if cleanName in _skippedFunctions:
+            print("ERROR - scan function " + functionName + " was not registered: " + _skippedFunctions[cleanName])
+        else:
+            print("ERROR - no " + kind + " scan function named " + functionName + "; available: " +
+                  ", ".join(sorted(_scanFunctions[kind])))
+    return None
+
+def acceptsZipMembers(scanFunction):
+    # True if scanFunction can return its waveforms in a zipMembers Dict (checked once when it was registered)
+    with _registryLock:
+        for registeredFunctions in _scanFunctions.values():
+            for oneFunction, zipMembersOkay in registeredFunctions.values():
+                if oneFunction is scanFunction:
+                    return zipMembersOkay
+    return "zipMembers" in inspect.signature(scanFunction).parameters
+
+def registerScanModule(moduleName, kind=None):
+    # imports moduleName (once) and registers its scan functions; kind defaults to photometry for modules with
+    #   Photometry in their name and raster otherwise. Returns the number of functions registered. The built-in
+    #   modules are always registered first so a lab module's function replaces a built-in one of the same name
+    _discoverScanModules()
+    with _registryLock:
+        if moduleName in _registeredModules:
+            return 0
+        _registeredModules.add(moduleName)
+        try:
+            scanModule = importlib.import_module(moduleName)
+        except Exception:
+            print("ERROR - problem importing scan module: " + moduleName)
+            traceback.print_exc()
+            return 0
+        if not kind:
+            kind = "photometry" if "photometry" in moduleName.lower() else "raster"
+        numRegistered = 0
+        for functionName, scanFunction in inspect.getmembers(scanModule, inspect.isfunction):
+            if functionName.startswith("_") or scanFunction.__module__ != scanModule.__name__:
+                continue # private helpers and functions imported from other modules
+            problemStr = _checkSignature(scanFunction, kind)
+            if problemStr:
+                _skippedFunctions.setdefault(functionName.lower(), problemStr)
+            elif registerScanFunction(kind, functionName, scanFunction):
+                numRegistered += 1
+        return numRegistered
+
+def registerScanFunction(kind, functionName, scanFunction):
+    # adds one function; a later module may replace a function of the same name (eg a lab version of standard)
+    problemStr = _checkSignature(scanFunction, kind)
+    if problemStr:
+        print("ERROR - could not register scan function " + functionName + ": " + problemStr)
+        return False
+    with _registryLock:
+        _scanFunctions[kind][functionName.lower()] = (scanFunction,
+                                                      "zipMembers" in inspect.signature(scanFunction).parameters)
+        _skippedFunctions.pop(functionName.lower(), None)
+    return True
+
+def registerScanModules(moduleNames):
+    # moduleNames is a comma separated string, eg the scanModules entry of the System INI file
+    for moduleName in moduleNames.split(","):
+        if len(moduleName.strip()):
+            registerScanModule(moduleName.strip())
+
+def scanFunctionNames(kind):
+    _discoverScanModules()
+    with _registryLock:
+        return sorted(_scanFunctions[kind])
+
+def _discoverScanModules():
+    global _discoveryDone
+    with _registryLock:
+        if _discoveryDone:
+            return
+        _discoveryDone = True
+        try:
+            scanPackage = importlib.import_module(scanPackageName)
+        except Exception:
+            print("ERROR - problem importing scan package: " + scanPackageName)
+            traceback.print_exc()
+            return
+        for moduleInfo in sorted(pkgutil.iter_modules(scanPackage.__path__), key=lambda oneInfo: oneInfo.name):
+            if moduleInfo.name.startswith("create"):
+                registerScanModule(scanPackageName + "." + moduleInfo.name)
+
+def _checkSignature(scanFunction, kind):
+    # returns "" if scanFunction can be called as a scan function of this kind, otherwise what is wrong
+    try:
+        scanParameters = list(inspect.signature(scanFunction).parameters.values())
+    except (TypeError, ValueError):
+        return "its arguments cannot be inspected"
+    requiredNames = [oneParm.name.lower() for oneParm in scanParameters if oneParm.default is inspect.Parameter.empty
+                     and oneParm.kind in (oneParm.POSITIONAL_ONLY, oneParm.POSITIONAL_OR_KEYWORD)]
+    if len(requiredNames) != len(scanKinds[kind]):
+        return ("a " + kind + " scan function needs exactly " + str(len(scanKinds[kind])) + " required arguments (" +
+                ", ".join(scanKinds[kind]) + ") but it has " + str(len(requiredNames)))
+    return ""
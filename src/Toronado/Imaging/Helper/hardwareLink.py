@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+""" hardwareLink.py
+
+Persistent session protocol between doScan and the hardware (DAQ) computer.
+
+The original protocol opens a new connection to the hardware computer for every command zip file and the
+hardware computer connects back to returnIP:returnPort for every acquired .gsi file. In session mode one
+long-lived TCP connection carries both directions as length-prefixed messages:
+    4-byte tag + 8-byte big-endian payload length + payload
+Tags sent to the hardware computer:   CMDZ (command zip file)
+Tags sent back by the hardware side:  OKAY (command received), DATA (acquired .gsi file), FAIL (error text)
+Every CMDZ is answered by OKAY or FAIL right away; commands that acquire data are followed by one DATA.
+
+clsDataReceiver keeps the return port of the original protocol open between acquisitions instead of binding
+a new listening socket for every frame.
+
+"""
+
+import socket
+import struct
+import threading
+import queue
+import time
+import Imaging.Helper.timingSpans as TS
+
+sessionHeader = struct.Struct("!4sQ")
+
+def sendMessage(sock, tag, payload=b""):
+    sock.sendall(sessionHeader.pack(tag, len(payload)))
+    if len(payload) > 0:
+        sock.sendall(payload)
+
+def receiveMessage(sock):
+    # returns (tag, payload); (None, None) if the other side closed the connection
+    header = _recvExactly(sock, sessionHeader.size)
+    if header is None:
+        return None, None
+    tag, numBytes = sessionHeader.unpack(header)
+    payload = _recvExactly(sock, numBytes)
+    if payload is None:
+        return None, None
+    return tag, payload
+
+def _recvExactly(sock, numBytes):
+    # reads exactly numBytes into one preallocated buffer (returned as a bytearray, no extra copy); None if the
+    # connection closes first
+    buffer = bytearray(numBytes)
+    view = memoryview(buffer)
+    numRead = 0
+    while numRead < numBytes:
+        chunkBytes = sock.recv_into(view[numRead:], min(numBytes - numRead, 1 << 20))
+        if chunkBytes == 0:
+            return None
+        numRead += chunkBytes
+    return buffer
+
+
+class clsHardwareSession(object):
+    # client side of a session; doScan keeps one of these per hardware computer address
+    def __init__(self, hardwareAddress, connectTimeoutSec=1):
+        self.hardwareAddress = hardwareAddress
+        self.connectTimeoutSec = connectTimeoutSec
+        self.sock = None
+
+    def connect(self, diagMode=False):
+        if self.sock:
+            return True
+        try:
+            self.sock = socket.create_connection(self.hardwareAddress, timeout=self.connectTimeoutSec)
+        except OSError:
+            print("** ERROR: Could not connect to hardware computer at " + str(self.hardwareAddress))
+            self.sock = None
+            return False
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if diagMode:
+            print("hardware session connected ...")
+        return True
+
+    def sendCommand(self, zipBytes, diagMode=False):
+        # sends one command zip file and waits for the hardware computer to confirm it; True if accepted
+        for attemptNum in range(2): # a session dropped by the other side is reopened once
+            if not self.connect(diagMode):
+                return False
+            try:
+                self.sock.settimeout(None)
+                sendMessage(self.sock, b"CMDZ", zipBytes)
+                self.sock.settimeout(max(self.connectTimeoutSec, 5))
+                tag, payload = receiveMessage(self.sock)
+            except OSError:
+                tag, payload = None, None
+            if tag == b"OKAY":
+                return True
+            if tag == b"FAIL":
+                print("** ERROR: hardware computer rejected command: " + payload.decode(errors="replace"))
+                return False
+            self.close()
+        print("** ERROR: lost session with hardware computer at " + str(self.hardwareAddress))
+        return False
+
+    def waitForData(self, timeOutSec, diagMode=False):
+        # returns the bytes of the next acquired .gsi file, or None on time-out or error
+        if not self.sock:
+            return None
+        try:
+            self.sock.settimeout(timeOutSec)
+            tag, payload = None, None
+            with TS.span("hardwareWait"):
+                header = _recvExactly(self.sock, sessionHeader.size)
+            if header is not None:
+                tag, numBytes = sessionHeader.unpack(header)
+                with TS.span("receive", numBytes):
+                    payload = _recvExactly(self.sock, numBytes)
+                if payload is None:
+                    tag = None
+        except socket.timeout:
+            print("ERROR - hardware computer did not respond with acquired data within max time allowed.")
+            self.close() # late data would arrive out of step with the next command
+            return None
+        except OSError:
+            tag, payload = None, None
+        if tag == b"DATA":
+            if diagMode:
+                print("received " + str(len(payload)) + " bytes of acquired data over hardware session")
+            return payload
+        if tag == b"FAIL":
+            print("** ERROR: hardware computer could not acquire data: " + payload.decode(errors="replace"))
+        else:
+            print("** ERROR: hardware session closed while waiting for acquired data")
+            self.close()
+        return None
+
+    def close(self):
+        if self.sock:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+
+class clsDataReceiver(object):
+    # long-lived listener for the original protocol where the hardware computer connects to returnIP:returnPort
+    #   once per acquisition; a background thread accepts each upload and queues its bytes for waitForData()
+    def __init__(self, servAddr):
+        self.servAddr = servAddr
+        self.dataQueue = queue.Queue()
+        self.serv = None
+        self.acceptThread = None
+        self.expectedBytes = 1 << 20 # grows to the size of the last upload; scans usually repeat the same size
+
+    def start(self):
+        if self.serv:
+            return True
+        serv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        serv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1) # rebinding must not fail on TIME_WAIT
+        try:
+            serv.bind(self.servAddr)
+        except OSError as errorInfo:
+            print("** ERROR: Could not listen for acquired data on " + str(self.servAddr) + ": " + str(errorInfo))
+            serv.close()
+            return False
+        serv.listen(5)
+        self.serv = serv
+        self.acceptThread = threading.Thread(target=self._acceptLoop, args=(serv,), daemon=True)
+        self.acceptThread.start()
+        return True
+
+    def discardPending(self):
+        # drops uploads nobody waited for (eg data that arrived after an earlier time-out) before a new command
+        numDiscarded = 0
+        while True:
+            try:
+                self.dataQueue.get_nowait()
+            except queue.Empty:
+                return numDiscarded
+            numDiscarded += 1
+
+    def waitForData(self, timeOutSec, diagMode=False):
+        # returns the bytes of the next uploaded .gsi file, or None on time-out
+        waitStart = time.time()
+        try:
+            listenAddr, data, acceptTime = self.dataQueue.get(timeout=timeOutSec)
+        except queue.Empty:
+            print("ERROR - hardware computer did not respond with acquired data within max time allowed.")
+            return None
+        # time until the hardware computer started sending; the transfer itself is the receive span
+        TS.addSpan("hardwareWait", waitStart, 1000. * max(0., acceptTime - waitStart))
+        if diagMode:
+            print("received " + str(len(data)) + " bytes of acquired data from " + str(listenAddr))
+        return data
+
+    def close(self):
+        if self.serv:
+            self.serv.close()
+            self.serv = None
+
+    def _acceptLoop(self, serv):
+        while True:
+            try:
+                listenConn, listenAddr = serv.accept()
+            except OSError:
+                return # listening socket closed
+            acceptTime = time.time()
+            try:
+                with listenConn:
+                    with TS.span("receive"):
+                        data = self._receiveUpload(listenConn)
+            except OSError as errorInfo:
+                print("** ERROR: lost connection while receiving acquired data: " + str(errorInfo))
+                continue
+            self.dataQueue.put((listenAddr, data, acceptTime))
+
+    def _receiveUpload(self, listenConn):
+        # reads until the hardware computer closes the connection, with large recv_into calls straight into a
+        # buffer sized for the expected upload (doubled if the upload turns out to be bigger)
+        data = bytearray(self.expectedBytes + 1) # one spare byte so a full buffer can still detect the end
+        numRead = 0
+        while True:
+            if numRead == len(data):
+                data.extend(bytes(len(data)))
+            with memoryview(data) as view:
+                chunkBytes = listenConn.recv_into(view[numRead:], min(len(data) - numRead, 4 << 20))
+            if chunkBytes == 0:
+                break
+            numRead += chunkBytes
+        del data[numRead:] # trims the unused tail in place
+        self.expectedBytes = max(numRead, 1)
+        return data
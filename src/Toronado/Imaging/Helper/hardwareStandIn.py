@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+""" hardwareStandIn.py
+
+A Python stand-in for the ToronadoHardware (RasterNoGUI) program so doScan, RasterGUI and the image windows
+can be run and tested without the scanning rig. It listens on the hardware port, accepts the same command
+zip files and answers DoScan and DoTestPhotometry commands with synthetic .gsi files. The ADC values come
+from a fixed pattern of bright spots sampled along the X/Y scan waveforms (delayed by lagPixels, like the
+real galvos), so bidirectional lag, binning and rotation settings all show up in the images.
+
+Both protocols are supported on the same port: the original one (one connection per command zip file and a
+new connection back to returnipaddress:returnport with the data) and the hardwareLink session protocol.
+Each connection is served in its own thread, so an open session does not hold up other connections; commands
+are still processed one at a time, as on the hardware computer.
+
+  python hardwareStandIn.py --port 9999
+
+"""
+
+import sys, os
+import io
+import socket
+import threading
+import zipfile
+import argparse
+import configparser as ConfigParser
+import numpy as np
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+import Imaging.Helper.hardwareLink as HL
+import Imaging.Helper.Scans.scanFiles as SF
+
+class clsHardwareStandIn(object):
+
+    def __init__(self, listenAddress=("127.0.0.1", 9999), diagMode=False):
+        self.listenAddress = listenAddress
+        self.diagMode = diagMode
+        self.cachedFiles = {} # ImageDesc and scan waveform files kept between scans, like tempCacheFolder
+        self.commandLock = threading.Lock() # one command at a time across all connections
+        self.serverSocket = None
+        self.serverThread = None
+        self.running = False
+
+    def start(self):
+        # serves in a background thread; returns once the port is listening
+        self.serverSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.serverSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.serverSocket.bind(self.listenAddress)
+        self.serverSocket.listen(5)
+        self.running = True
+        self.serverThread = threading.Thread(target=self.serveForever, daemon=True)
+        self.serverThread.start()
+
+    def stop(self):
+        self.running = False
+        if self.serverSocket:
+            self.serverSocket.close()
+            self.serverSocket = None
+
+    def serveForever(self):
+        while self.running:
+            try:
+                conn, connAddr = self.serverSocket.accept()
+            except OSError:
+                break # socket closed by stop()
+            threading.Thread(target=self._serveConnection, args=(conn,), daemon=True).start()
+
+    def _serveConnection(self, conn):
+        with conn:
+            firstBytes = HL._recvExactly(conn, 4)
+            if firstBytes is None:
+                return
+            if bytes(firstBytes) == b"PK\x03\x04":
+                self._serveOriginalProtocol(conn, firstBytes)
+            else:
+                self._serveSession(conn, firstBytes)
+
+    def processCommandZip(self, zipBytes):
+        # returns (cmdDict, gsiBytes); gsiBytes is None for commands that do not return data
+        with zipfile.ZipFile(io.BytesIO(zipBytes), "r") as fZip:
+            newFiles = {memberName: fZip.read(memberName) for memberName in fZip.namelist()}
+        cmdDict = _iniBytesToDict(newFiles["Cmd.txt"])
+        currentCommand = cmdDict["currentcommand"].lower().strip()
+        if self.diagMode:
+            print("stand-in received command: " + currentCommand)
+        with self.commandLock:
+            if currentCommand == "doscan":
+                if int(cmdDict.get("updatescanwaveforms", "1")) == 1:
+                    self.cachedFiles = newFiles
+                elif not self.cachedFiles:
+                    raise ValueError("no scan waveforms available")
+                return cmdDict, _makeRasterGsi(cmdDict, self.cachedFiles)
+            if currentCommand == "dotestphotometry":
+                return cmdDict, _makePhotometryGsi(cmdDict, newFiles)
+        return cmdDict, None # shutter, arm/disarm photometry etc just need to be accepted
+
+    def _serveOriginalProtocol(self, conn, firstBytes):
+        zipBuffer = bytearray(firstBytes)
+        while True:
+            data = conn.recv(1 << 20)
+            if not data:
+                break
+            zipBuffer += data
+        try:
+            cmdDict, gsiBytes = self.processCommandZip(bytes(zipBuffer))
+        except (KeyError, ValueError, zipfile.BadZipFile) as errorInfo:
+            print("stand-in could not process command: " + str(errorInfo))
+            return
+        if gsiBytes is not None:
+            returnAddress = (cmdDict["returnipaddress"], int(cmdDict["returnport"]))
+            with socket.create_connection(returnAddress, timeout=5) as returnConn:
+                returnConn.sendall(gsiBytes)
+
+    def _serveSession(self, conn, firstBytes):
+        pendingHeader = firstBytes
+        while self.running:
+            if pendingHeader is not None:
+                restOfHeader = HL._recvExactly(conn, HL.sessionHeader.size - len(pendingHeader))
+                header = None if restOfHeader is None else bytes(pendingHeader) + bytes(restOfHeader)
+                pendingHeader = None
+            else:
+                header = HL._recvExactly(conn, HL.sessionHeader.size)
+            if header is None:
+                return # client closed the session
+            tag, numBytes = HL.sessionHeader.unpack(header)
+            payload = HL._recvExactly(conn, numBytes)
+            if payload is None:
+                return
+            if tag != b"CMDZ":
+                HL.sendMessage(conn, b"FAIL", b"unknown message tag " + tag)
+                continue
+            try:
+                cmdDict, gsiBytes = self.processCommandZip(bytes(payload))
+            except (KeyError, ValueError, zipfile.BadZipFile) as errorInfo:
+                HL.sendMessage(conn, b"FAIL", str(errorInfo).encode())
+                continue
+            HL.sendMessage(conn, b"OKAY")
+            if gsiBytes is not None:
+                HL.sendMessage(conn, b"DATA", gsiBytes)
+
+
+def _iniBytesToDict(iniBytes):
+    # one-level Dict with lowercase keys (section names are dropped), like processImageData._dictFromZip
+    config = ConfigParser.ConfigParser()
+    config.read_string(iniBytes.decode("ASCII"))
+    tempDict = {}
+    for sectionName in config.sections():
+        for key, value in config.items(sectionName):
+            tempDict[key.lower()] = value
+    return tempDict
+
+def _makeRasterGsi(cmdDict, inputFiles):
+    imageDescFN = cmdDict["imagedesc"]
+    imageParms = _iniBytesToDict(inputFiles[imageDescFN])
+    numFrames = int(cmdDict["numframes"])
+    lagPixels = int(imageParms["lagpixels"])
+    xFrame, yFrame = SF.expandScanPoints(imageParms, inputFiles) # full float64 frame from any scanEncoding
+    # the hardware repeats the one frame of waveforms for every frame plus one extra point per frame (the
+    # lag drift fix in processImageData); samples are taken lagPixels points after each position is commanded
+    xFrame = np.append(xFrame, xFrame[-1])
+    yFrame = np.append(yFrame, yFrame[-1])
+    numPad = lagPixels + len(xFrame) # room for the decoder to read past the last frame
+    xPos = np.concatenate((np.full(lagPixels, xFrame[0]), np.tile(xFrame, numFrames), np.full(numPad, xFrame[-1])))
+    yPos = np.concatenate((np.full(lagPixels, yFrame[0]), np.tile(yFrame, numFrames), np.full(numPad, yFrame[-1])))
+    gsiFiles = {}
+    gsiFiles["Cmd.txt"] = inputFiles["Cmd.txt"]
+    gsiFiles[imageDescFN] = inputFiles[imageDescFN]
+    gsiFiles["hardwareSettings.txt"] = b"[Hardware]\r\nDeviceType = PythonStandIn\r\nMaxADCvalue = 2047\r\n"
+    for chanLetter in imageParms.get("adcchanletters", "A"):
+        chanNum = ord(chanLetter.upper()) - 65
+        adcData = _syntheticSpecimen(xPos, yPos, float(imageParms.get("zoomasvolts", 10)), seed=chanNum)
+        gsiFiles["ADC" + str(chanNum) + "_ImageRaw_int16.bin"] = adcData.tobytes()
+    return _zipFiles(gsiFiles)
+
+def _makePhotometryGsi(cmdDict, inputFiles):
+    imageParms = _iniBytesToDict(inputFiles[cmdDict["imagedesc"]])
+    xPos = np.frombuffer(inputFiles[imageParms["scanpointsx"]], dtype="float64")
+    yPos = np.frombuffer(inputFiles[imageParms["scanpointsy"]], dtype="float64")
+    gsiFiles = {"Cmd.txt": inputFiles["Cmd.txt"]}
+    for chanNum in [0, 1]:
+        gsiFiles["ADC" + str(chanNum) + "_ImageRaw_int16.bin"] = _syntheticSpecimen(xPos, yPos, 10., chanNum).tobytes()
+    return _zipFiles(gsiFiles)
+
+def _syntheticSpecimen(xPos, yPos, spanVolts, seed=0, numSpots=40):
+    # int16 ADC values (0 to 2047) for a fixed field of Gaussian spots plus shot-like noise
+    rng = np.random.default_rng(seed)
+    halfSpan = max(spanVolts, 0.1) / 2.
+    spotX = rng.uniform(-halfSpan, halfSpan, numSpots)
+    spotY = rng.uniform(-halfSpan, halfSpan, numSpots)
+    spotWidth = rng.uniform(0.01, 0.04, numSpots) * spanVolts
+    adcValues = np.full(len(xPos), 100., dtype="float32")
+    for spotNum in range(numSpots):
+        distSq = np.square(xPos - spotX[spotNum], dtype="float32") + np.square(yPos - spotY[spotNum], dtype="float32")
+        adcValues += 1500. * np.exp(distSq / (-2. * spotWidth[spotNum] ** 2))
+    adcValues += rng.normal(0., 20., len(xPos)).astype("float32")
+    return np.clip(adcValues, 0, 2047).astype("int16")
+
+def _zipFiles(fileDict):
+    zipBuffer = io.BytesIO()
+    with zipfile.ZipFile(zipBuffer, "w") as fZip:
+        for memberName, memberBytes in fileDict.items():
+            fZip.writestr(memberName, memberBytes)
+    return zipBuffer.getvalue()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stand-in for the Toronado hardware computer")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=9999, help="hardwareADCport from Toronado.ini (default 9999)")
+    parser.add_argument("--diag", action="store_true", help="print each command received")
+    args = parser.parse_args()
+    standIn = clsHardwareStandIn((args.host, args.port), diagMode=args.diag)
+    standIn.start()
+    print("Hardware stand-in listening on " + args.host + ":" + str(args.port) + " (Ctrl-C to end)")
+    try:
+        while standIn.serverThread.is_alive():
+            standIn.serverThread.join(0.5)
+    except KeyboardInterrupt:
+        standIn.stop()
@@ -5,6 +5,7 @@
 # includes fix for lag drift during movies in decodeData (index += 1)
 # changed loadRasterZipFile on 28 Mar 2017 to allow for .gsi files that are renamed Zip image files
 # added reading photometry test data 7 Dec 2017
+# added chunked HDF5 (.h5) export and reader
 
 import numpy as np
 from scipy.io import savemat
@@ -14,18 +15,32 @@ import os
 import shutil
 import configparser as ConfigParser
 import zipfile
-import glob, copy, pickle
+import glob, pickle
+import collections
+import threading
+import struct
+import io
 import tifffile as TIFF
+import concurrent.futures
+import Imaging.Helper.timingSpans as TS
+try:
+    import h5py # optional; only needed to save or read .h5 image files
+except ImportError:
+    h5py = None
+
+defaultDecodeWorkers = 1 # number of ADC channels loadRasterZipFile decodes at the same time
 
 def readImageFile(fileName, readHeader=True):
     if path.splitext(fileName)[1].lower() in [".tif", ".tiff"]:
         retDict = _loadTIFF(fileName, readHeader=readHeader)
     elif path.splitext(fileName)[1].lower() == ".img":
         retDict = _loadIMG(fileName, readHeader=readHeader)
-    elif path.splitext(fileName[1].lower() in [".zip", ".gsi"]): # gsi is a renamed zip file
+    elif path.splitext(fileName)[1].lower() in [".zip", ".gsi"]: # gsi is a renamed zip file
         retDict = loadRasterZipFile(fileName)
+    elif path.splitext(fileName)[1].lower() in [".h5", ".hdf5"]:
+        retDict = loadRasterH5File(fileName)
     else:
-        print("unknown file type: " + path.splitext(fileName[1]))
+        print("unknown file type: " + path.splitext(fileName)[1])
         return None
     if not retDict:
         return None
@@ -51,7 +66,9 @@ def loadPhotometryZipFile(fileName):
     retDict["containsValidData"] = True
     return retDict
 
-def loadRasterZipFile(fileName, specificADCchannels=None, lagPixelsAdjust=0, fastMode=False):
+@TS.timed("decode")
+def loadRasterZipFile(fileName, specificADCchannels=None, lagPixelsAdjust=0, fastMode=False, asStack=True,
+                      memoryMap=False, workers=None, autoLag=False, keepRawData=False, zipBytes=None):
     """
     loadRasterZipFile -- last revised 31 Mat 2017 BWS
 
@@ -61,78 +78,266 @@ def loadRasterZipFile(fileName, specificADCchannels=None, lagPixelsAdjust=0, fas
     int(retDict[parms][xsize]). You can extract a specific set of channels by passing letters
     like "A" or ["A", "B"]. fastMode=True skips several steps like finding max pixel values in each stack.
     You can shift the reading frame during decoding by lagPixelsAdjust=xx to optimize odd/even row
-    correlation in bidirectional image stacks. Max positive shift is 20 pixels; negative shifts are possible.
+    correlation in bidirectional image stacks. Shifts can be negative or fractional (fractional shifts blend
+    neighboring samples) and are only limited by the amount of raw data in the file.
+    By default (asStack=True) each channel is one numpy array of shape (numFrames, Xsize, Ysize) that indexes
+    like the old list of frames (retDict[data][A][0] is still the first frame); asStack=False returns a list.
+    memoryMap=True decodes ADC files that are stored uncompressed in the archive directly from a memory map of
+    the file instead of reading each raw ADC file into memory first (deflated files are read as before).
+    workers=N decodes up to N channels at the same time in a thread pool; the default comes from
+    setDefaultDecodeWorkers (set from decodeWorkers in the [Raster] section of Toronado.ini).
+    If the scan was acquired with xbinning/ybinning above 1, adjacent pixels are summed while decoding; the
+    stacks are then int32, Xsize/Ysize are the binned sizes and maxPossibleValue is 2048 times the bin area.
+    autoLag=True replaces lagPixelsAdjust with the value findBestLagAdjust picks from the first frame of the
+    first channel before decoding (bidirectional scans only). The lag used is saved in retDict[lagPixelsAdjust].
+    keepRawData=True keeps each undecoded ADC stream in retDict[rawData][A] etc so rephaseRasterData can change
+    the lag later without reading the file again (use with memoryMap=True to avoid holding a second copy).
+    zipBytes can hold the contents of the archive when it is already in memory (eg acquired data just received
+    from the hardware computer); fileName is then only used as the name of the data and need not exist yet.
     """
-    if not path.exists(fileName):
+    if zipBytes is not None:
+        zipSource = io.BytesIO(zipBytes)
+    elif path.exists(fileName):
+        zipSource = fileName
+    else:
         print("Requested .zip or .gsi file not found: " + fileName)
         return None
-    with zipfile.ZipFile(fileName, "r") as fZip:
-        contents = fZip.namelist()
-        retDict = {}
-        retDict["data"] = {}
-        retDict["loadedFileName"] = fileName
-        retDict["channelNames"] = {} # for full name like Green or Red
-        retDict["channelMaxValues"] = {}
-
-        # file type specific stuff here
-        if path.splitext(fileName)[1].lower() == ".zip":
-            descFN = "ImageDescription.txt"
-            if not descFN in contents:
-                print("Zip file does not have an image description file: " + descFN)
-                return None
-            retDict["parms"] = _dictFromZip(descFN, fZip) # converts all new keys to lowercase
-            retDict["parms"]["rastercmd"] = fZip.read("RasterCmd.txt").decode("utf-8")
-        else:
-            if not path.splitext(fileName)[1].lower() == ".gsi":
-                print("ERROR - loadRasterZipFile routine can only process .zip or .gsi files.")
-                return None
-            tempCmd = _dictFromZip("Cmd.txt", fZip)
-            retDict["parms"] = _dictFromZip(tempCmd["imagedesc"], fZip)
-            if "hardwareSettings.txt" in contents:
-                retDict["parms"]["hardware"] = _dictFromZip("hardwareSettings.txt", fZip)
-            retDict["parms"]["numframes"] = int(tempCmd["numframes"])
-            retDict["parms"]["positiondata"] = (1 == int(tempCmd["returnpositiondata"]))
-
-        # common read stuff below here
-        retDict["Xsize"] = int(retDict["parms"]["xsize"])
-        retDict["Ysize"] = int(retDict["parms"]["ysize"])
-        retDict["numFrames"] = int(retDict["parms"]["numframes"])
-        includedADCchannels = []
-        for oneChanNum in ["0", "1", "2", "3"]:
-            if _ADCnameFromNum(oneChanNum) in contents:
-                includedADCchannels.append(int(oneChanNum))
-        if len(includedADCchannels) == 0:
-            print("Requested .zip or .gsi file does not contain any Raster ADC output files")
+    with zipfile.ZipFile(zipSource, "r") as fZip:
+        retDict, chansToExtract = _readRasterHeader(fileName, fZip, specificADCchannels)
+        if not retDict:
             return None
-        if specificADCchannels:
-            chansToExtract = []
-            for oneChan in specificADCchannels:
-                chanNum = ord(oneChan.upper()) - 65 # to make A => 0, B => 1, etc
-                if chanNum in includedADCchannels:
-                    chansToExtract.append(chanNum)
-                else:
-                    print("Warning -- Requested channel not included in Zip file: " + oneChan)
+        if workers is None:
+            workers = defaultDecodeWorkers
+        if autoLag:
+            lagPixelsAdjust = _findZipLagAdjust(fZip, retDict["parms"], chansToExtract[0], lagPixelsAdjust)
+        binX, binY, retDict["Xsize"], retDict["Ysize"], maxPossibleValue = _rasterBinning(retDict["parms"])
+        chanArgs = (fZip, retDict["parms"], lagPixelsAdjust, fastMode, asStack, memoryMap, maxPossibleValue,
+                    keepRawData)
+        if workers > 1 and len(chansToExtract) > 1:
+            # each channel is read, decoded and scanned for its max value in its own thread; zlib inflation and
+            # the numpy gather/bincount steps release the GIL so channels overlap
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(workers, len(chansToExtract))) as pool:
+                chanResults = list(pool.map(lambda oneChanNum: _loadOneRasterChannel(oneChanNum, *chanArgs),
+                                            chansToExtract))
         else:
-            chansToExtract = includedADCchannels
-        if len(chansToExtract) == 0:
-            print("loadZipCore is ending because there are no Raster-generated ADC channels to extract.")
-            return None
-        retDict["channelLetters"] = [chr(65 + oneChanNum) for oneChanNum in chansToExtract]
-        for oneChanNum in chansToExtract:
-            chanLetter = chr(65 + oneChanNum) # 0 => A, 1 => B, etc
-            chanFN = _ADCnameFromNum(oneChanNum) # makes full name, eg 0 => ADC0_ImageRaw_int16.bin
-            retDict["data"][chanLetter] = _decodeRasterData(_arrayFromZip(chanFN, fZip), retDict["parms"],
-                                                           lagPixelsAdjust=lagPixelsAdjust)
+            chanResults = [_loadOneRasterChannel(oneChanNum, *chanArgs) for oneChanNum in chansToExtract]
+        if keepRawData:
+            retDict["rawData"] = {}
+        for chanLetter, chanData, chanMaxValue, rawData in chanResults:
+            if chanData is None:
+                print("Could not decode raster data for channel " + chanLetter + " in " + fileName)
+                return None
+            if keepRawData:
+                retDict["rawData"][chanLetter] = rawData
+            retDict["data"][chanLetter] = chanData
             retDict["channelNames"][chanLetter] = retDict["parms"][("chan" + chanLetter + "name").lower()]
-            if fastMode:
-                retDict["channelMaxValues"][chanLetter] = 2047
-            else:
-                retDict["channelMaxValues"][chanLetter] = 10 * int(np.percentile(retDict["data"][chanLetter], 99) / 10)
+            retDict["channelMaxValues"][chanLetter] = chanMaxValue
     # end of zip file processing so close it automatically
-    retDict["maxPossibleValue"] = 2048
+    retDict["maxPossibleValue"] = maxPossibleValue
+    retDict["lagPixelsAdjust"] = lagPixelsAdjust
     retDict["containsValidData"] = True
     return retDict
 
+def setDefaultDecodeWorkers(numWorkers):
+    # sets the number of channels loadRasterZipFile decodes in parallel when workers is not passed
+    global defaultDecodeWorkers
+    defaultDecodeWorkers = max(1, int(numWorkers))
+    return defaultDecodeWorkers
+
+def rephaseRasterData(retDict, lagPixelsAdjust):
+    """
+    rephaseRasterData -- changes the lag adjustment of an already loaded raster dict in place
+
+    Frames are decoded again from the raw ADC streams kept by loadRasterZipFile(keepRawData=True), so the
+    archive is not reopened; lazily opened dicts (openRasterZipFile) just switch to the new lag. If the raw ADC
+    streams were not kept they are read from retDict[loadedFileName] the first time and kept in retDict[rawData]
+    for later lag changes. Fractional lags are allowed. Returns True if the data were rephased.
+    """
+    newData = {}
+    for chanLetter in retDict["channelLetters"]:
+        oldChannel = retDict["data"][chanLetter]
+        if isinstance(oldChannel, clsLazyRasterChannel):
+            newChannel = clsLazyRasterChannel(oldChannel.lazyFile, oldChannel.memberName, retDict["parms"],
+                                              lagPixelsAdjust=lagPixelsAdjust, cachedFrames=oldChannel.cachedFrames)
+            if not newChannel.containsValidData:
+                newChannel = None
+        else:
+            rawData = _rawDataForRephase(retDict, chanLetter)
+            if rawData is None:
+                print("Raw ADC data is not available for channel " + chanLetter + "; reload the file to change the lag")
+                return False
+            newChannel = _decodeRasterData(rawData, retDict["parms"], lagPixelsAdjust=lagPixelsAdjust,
+                                           asStack=isinstance(oldChannel, np.ndarray))
+        if newChannel is None:
+            print("Could not rephase channel " + chanLetter + " with lag adjustment of " + str(lagPixelsAdjust))
+            return False
+        newData[chanLetter] = newChannel
+    retDict["data"].update(newData)
+    retDict["lagPixelsAdjust"] = lagPixelsAdjust
+    return True
+
+def findBestLagAdjust(frameData, lagPixelsAdjust=0, searchPixels=20, minAdjust=None, maxAdjust=None):
+    """
+    findBestLagAdjust -- picks the lagPixelsAdjust that best meshes odd and even rows of a bidirectional scan
+
+    frameData is one decoded, unbinned frame [x][y] that was decoded with lagPixelsAdjust. Changing the lag by
+    d pixels moves forward rows and reversed rows d pixels in opposite directions, so the best change is minus
+    half the shift that maximizes the cross-correlation of even rows against odd rows. All candidate shifts are
+    scored at once from one FFT cross-correlation. Candidates are lagPixelsAdjust +/- searchPixels, limited to
+    minAdjust ... maxAdjust. Returns the best lagPixelsAdjust (lagPixelsAdjust plus a whole number of pixels).
+    """
+    scores = _lagScores(frameData, lagPixelsAdjust, searchPixels, minAdjust, maxAdjust)
+    if not scores:
+        return lagPixelsAdjust
+    return max(scores, key=scores.get)
+
+def findRasterLagAdjust(fileName, lagPixelsAdjust=0, chanLetter=None, frameNum=0, searchPixels=20):
+    # runs findBestLagAdjust on one frame of a .gsi/.zip file; only the data up to that frame is read
+    if not path.exists(fileName):
+        print("Requested .zip or .gsi file not found: " + fileName)
+        return None
+    with zipfile.ZipFile(fileName, "r") as fZip:
+        retDict, chansToExtract = _readRasterHeader(fileName, fZip, chanLetter)
+        if not retDict:
+            return None
+        return _findZipLagAdjust(fZip, retDict["parms"], chansToExtract[0], lagPixelsAdjust, frameNum=frameNum,
+                                 searchPixels=searchPixels)
+
+def openRasterZipFile(fileName, specificADCchannels=None, lagPixelsAdjust=0, cachedFrames=8):
+    """
+    openRasterZipFile -- lazy version of loadRasterZipFile
+
+    Parses Cmd.txt and the ImageDesc file once and returns the same dict layout as loadRasterZipFile, except
+    that each retDict[data][A] is a clsLazyRasterChannel that decodes frames from the ADC data in the archive
+    only when they are indexed (retDict[data][A][5] decodes just the sixth frame). ADC files stored without
+    compression are read through a memory map rather than through the zip reader; deflated ADC files are inflated
+    as frames are requested, so stepping forward is cheap but jumping back re-inflates from the start of the file.
+    The most recently used
+    cachedFrames frames of each channel are kept. The archive stays open until retDict[lazyFile].close() is called.
+    channelMaxValues are estimated from the first frame only.
+    """
+    if not path.exists(fileName):
+        print("Requested .zip or .gsi file not found: " + fileName)
+        return None
+    lazyFile = clsLazyRasterFile(fileName)
+    retDict, chansToExtract = _readRasterHeader(fileName, lazyFile.zipHandle, specificADCchannels)
+    if not retDict:
+        lazyFile.close()
+        return None
+    binX, binY, retDict["Xsize"], retDict["Ysize"], maxPossibleValue = _rasterBinning(retDict["parms"])
+    for oneChanNum in chansToExtract:
+        chanLetter = chr(65 + oneChanNum) # 0 => A, 1 => B, etc
+        oneChannel = clsLazyRasterChannel(lazyFile, _ADCnameFromNum(oneChanNum), retDict["parms"],
+                                          lagPixelsAdjust=lagPixelsAdjust, cachedFrames=cachedFrames)
+        if not oneChannel.containsValidData:
+            print("Could not decode raster data for channel " + chanLetter + " in " + fileName)
+            lazyFile.close()
+            return None
+        retDict["data"][chanLetter] = oneChannel
+        retDict["channelNames"][chanLetter] = retDict["parms"][("chan" + chanLetter + "name").lower()]
+        retDict["channelMaxValues"][chanLetter] = 10 * int(_fastPercentile(oneChannel[0], 99,
+                                                                           maxPossibleValue=maxPossibleValue) / 10)
+    retDict["lazyFile"] = lazyFile
+    retDict["maxPossibleValue"] = maxPossibleValue
+    retDict["containsValidData"] = True
+    return retDict
+
+class clsLazyRasterFile(object):
+    # keeps a raster zip archive open so ADC data can be read in pieces by clsLazyRasterChannel objects
+    def __init__(self, fileName):
+        self.fileName = fileName
+        self.zipHandle = zipfile.ZipFile(fileName, "r")
+        self.readLock = threading.Lock() # frames may be requested from the display thread and the main thread
+        self.memberMaps = {} # memory maps of binary members stored without compression
+        self.memberStreams = {} # open readers of deflated members, kept so forward reads continue where they stopped
+
+    def readPoints(self, memberName, firstPoint, numPoints):
+        # returns numPoints values starting at firstPoint from one binary member (dtype taken from the member name)
+        if memberName not in self.memberMaps:
+            self.memberMaps[memberName] = _memmapFromZip(memberName, self.zipHandle, allowFallback=False)
+        if self.memberMaps[memberName] is not None:
+            return self.memberMaps[memberName][firstPoint:firstPoint + numPoints]
+        # a deflated member can only be inflated from its start, so its reader stays open between calls: stepping
+        #   forward through a movie just inflates the frames in between, while going back to an earlier frame
+        #   inflates again from the start of the member (the frame cache of clsLazyRasterChannel covers recent ones)
+        myDtype = _dtypeFromName(memberName)
+        with self.readLock:
+            if memberName not in self.memberStreams:
+                self.memberStreams[memberName] = self.zipHandle.open(memberName, "r")
+            fMember = self.memberStreams[memberName]
+            fMember.seek(firstPoint * myDtype.itemsize)
+            rawBytes = fMember.read(numPoints * myDtype.itemsize)
+        return np.frombuffer(rawBytes, dtype=myDtype)
+
+    def memberPoints(self, memberName):
+        return _numPointsInZip(memberName, self.zipHandle)
+
+    def close(self):
+        self.memberMaps = {}
+        with self.readLock:
+            for fMember in self.memberStreams.values():
+                fMember.close()
+            self.memberStreams = {}
+        if self.zipHandle:
+            self.zipHandle.close()
+            self.zipHandle = None
+
+class clsLazyRasterChannel(object):
+    # list-like view of one ADC channel; frames are decoded on first use and kept in a small LRU cache
+    def __init__(self, lazyFile, memberName, parmDict, lagPixelsAdjust=0, cachedFrames=8):
+        self.lazyFile = lazyFile
+        self.memberName = memberName
+        self.layout = _rasterLayout(parmDict, lagPixelsAdjust)
+        self.numFrames = self.layout["numFrames"]
+        self.shape = (self.numFrames, self.layout["binnedX"], self.layout["binnedY"])
+        if self.layout["binX"] > 1 or self.layout["binY"] > 1:
+            self.dtype = np.dtype("int32") # binned pixels are sums
+        else:
+            self.dtype = np.dtype("int16")
+        self.cachedFrames = max(1, cachedFrames)
+        self.frameCache = collections.OrderedDict()
+        lastPoint = _lastRasterPoint(self.layout, self.numFrames)
+        self.containsValidData = self.layout["firstPoint"] >= 0 and lastPoint <= lazyFile.memberPoints(memberName)
+
+    def __len__(self):
+        return self.numFrames
+
+    def __iter__(self):
+        for frameNum in range(self.numFrames):
+            yield self[frameNum]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return np.array([self[frameNum] for frameNum in range(*index.indices(self.numFrames))], dtype=self.dtype)
+        if isinstance(index, tuple):
+            return self[index[0]][index[1:]]
+        frameNum = int(index)
+        if frameNum < 0:
+            frameNum += self.numFrames
+        if frameNum < 0 or frameNum >= self.numFrames:
+            raise IndexError("frame index out of range: " + str(index))
+        if frameNum in self.frameCache:
+            self.frameCache.move_to_end(frameNum)
+        else:
+            self.frameCache[frameNum] = self.getFrames(frameNum, 1)[0]
+            if len(self.frameCache) > self.cachedFrames:
+                self.frameCache.popitem(last=False) # drop least recently viewed frame
+        return self.frameCache[frameNum]
+
+    def __array__(self, dtype=None, copy=None):
+        # decodes the whole movie (eg, when saving or averaging)
+        allFrames = self.getFrames(0, self.numFrames)
+        if dtype is not None:
+            allFrames = allFrames.astype(dtype)
+        return allFrames
+
+    def getFrames(self, firstFrame, numFrames):
+        # decodes a run of frames with one read from the archive; returns numpy(numFrames, x, y)
+        firstPoint = self.layout["firstPoint"] + (firstFrame * self.layout["frameStride"])
+        numPoints = _lastRasterPoint(self.layout, numFrames) - self.layout["firstPoint"]
+        rawData = self.lazyFile.readPoints(self.memberName, firstPoint, numPoints)
+        return _gatherRasterFrames(rawData, self.layout, 0, numFrames)
+
 def saveProcessedImageData(passDict, curFileName, newFormatStr, specificFrame=-1):
     # called by ImageDisplay window to re-format already saved data (eg, dump decoded image stack as a binary file)
     # generate output files for each ADC channel; specificFrame=-1 for entire movie
@@ -143,100 +348,524 @@ def saveProcessedImageData(passDict, curFileName, newFormatStr, specificFrame=-1
         fileRoot = curFileName
     fileRoot = path.splitext(fileRoot)[0]
     finalName = "" # default for return value
-    if newFormatStr in ["mat", "pk", "zip"]:
+    if newFormatStr in ["mat", "pk", "zip", "h5"]:
         # these extensions will save entire zip file content, not specific frames
         if newFormatStr == "mat": # xx fix to remove from channel loop and also fix 1-frame movies to have 2D stacks
             finalName = fileRoot + ".mat" # always saves entire zip file contents
             matCellName = (path.split(fileRoot)[1]).replace(" ", "_")
-            tempDict = copy.deepcopy(passDict) # create a copy of main Dict since we have to modify data arrays
-            for oneChanLetter in tempDict["parms"]["adcchanletters"]:
-                if len(passDict["data"][oneChanLetter]) == 1:
-                    tempDict["data"][oneChanLetter] = passDict["data"][oneChanLetter][0] # get rid of enclosing list
-                else:
-                    tempDict["data"][oneChanLetter] = np.array(passDict["data"][oneChanLetter]) # to 3-D np Array
+            tempDict = _dictForSaving(passDict)
+            for oneChanLetter in tempDict["data"]:
+                if len(tempDict["data"][oneChanLetter]) == 1:
+                    tempDict["data"][oneChanLetter] = tempDict["data"][oneChanLetter][0] # get rid of enclosing list
             saveDict = {}
             saveDict[matCellName] = tempDict # nest passDict one level down so there is a single variable in Matlab
             savemat(finalName, saveDict)
             print("Saved " + finalName)
-        if newFormatStr == "pk":
+        elif newFormatStr == "pk":
             finalName = path.splitext(fileRoot)[0] + ".pk"
             with open(finalName, "wb") as fP:
-                pickle.dump(passDict, fP)
+                pickle.dump(_dictForSaving(passDict), fP)
             print("Saved " + finalName)
+        elif newFormatStr == "h5":
+            finalName = fileRoot + ".h5" # always saves entire movie for every channel
+            if _saveRasterH5(passDict, finalName):
+                print("Saved " + finalName)
+            else:
+                finalName = ""
         else:
             print("Unknown whole dict save method")
     else:
         # these extensions will trigger saving a specific frame rather than all the data
+        # whole movies are streamed to disk a chunk of frames at a time straight from the decoded data (or from
+        # the archive for lazily opened files) so no second copy of the movie is made
         for oneChanLetter in passDict["parms"]["adcchanletters"]:
-            if oneChanLetter == "A":
-                chanName = passDict["parms"]["chananame"]
-            else:
-                chanName = passDict["parms"]["chanBname"]
+            chanName = passDict["parms"][("chan" + oneChanLetter + "name").lower()]
             oneFileRoot = fileRoot + "_ADC" + oneChanLetter + "_" + chanName
             if specificFrame == -1:
-                saveData = np.array(passDict["data"][oneChanLetter]) # whole stack to numpy 3-D array
+                saveData = passDict["data"][oneChanLetter] # whole movie
                 sizeStr = "_" + str(passDict["numFrames"]) + "x" + str(passDict["Xsize"]) + "x" + str(passDict["Ysize"])
             else:
-                saveData = passDict["data"][oneChanLetter][specificFrame] # one image is a 2-D numpy array
+                saveData = [passDict["data"][oneChanLetter][specificFrame]] # one image is a 2-D numpy array
                 sizeStr = "_" + str(passDict["Xsize"]) + "x" + str(passDict["Ysize"])
             finalName = None
             if newFormatStr == "tif":
                 finalName = oneFileRoot + sizeStr + ".tif"
-                TIFF.imsave(finalName, saveData)
+                _saveFramesTIFF(finalName, saveData)
             elif newFormatStr == "bin":
-                finalName = oneFileRoot + sizeStr + "_int16.bin"
-                saveData.tofile(finalName)
+                finalName = oneFileRoot + sizeStr + "_" + _frameDtype(saveData).name + ".bin"
+                with open(finalName, "wb") as fOut:
+                    for frameChunk in _iterFrameChunks(saveData):
+                        frameChunk.tofile(fOut) # sequential appends
             else:
                 print("Unknown file type for saving processed data: " + newFormatStr)
             if finalName:
                 print("Saved " + finalName)
     return finalName
 
-def _decodeRasterData(rawData, parmDict, lagPixelsAdjust=0):
+def loadRasterH5File(fileName, lazy=True):
+    """
+    loadRasterH5File -- reads .h5 files written by saveProcessedImageData(..., "h5")
+
+    Returns the same dict layout as loadRasterZipFile. With lazy=True each retDict[data][A] is the h5py dataset
+    itself, so retDict[data][A][10] or retDict[data][A][10, 0:64, 0:64] reads only the chunks that are needed;
+    the file stays open until retDict[lazyFile].close() is called. lazy=False reads every movie into memory.
+    """
+    if h5py is None:
+        print("h5py must be installed to read .h5 files")
+        return None
+    if not path.exists(fileName):
+        print("Requested .h5 file not found: " + fileName)
+        return None
+    fH5 = h5py.File(fileName, "r")
+    retDict = {}
+    retDict["loadedFileName"] = fileName
+    retDict["parms"] = _dictFromH5Attrs(fH5["parms"])
+    for key in ["Xsize", "Ysize", "numFrames", "maxPossibleValue"]:
+        retDict[key] = int(fH5.attrs[key])
+    retDict["lagPixelsAdjust"] = float(fH5.attrs.get("lagPixelsAdjust", 0))
+    retDict["channelLetters"] = sorted(fH5["data"].keys())
+    retDict["data"] = {}
+    retDict["channelNames"] = {}
+    retDict["channelMaxValues"] = {}
+    for chanLetter in retDict["channelLetters"]:
+        oneChannel = fH5["data"][chanLetter]
+        retDict["channelNames"][chanLetter] = str(oneChannel.attrs.get("channelName", chanLetter))
+        retDict["channelMaxValues"][chanLetter] = int(oneChannel.attrs.get("channelMaxValue",
+                                                                          retDict["maxPossibleValue"] - 1))
+        if lazy:
+            retDict["data"][chanLetter] = oneChannel
+        else:
+            retDict["data"][chanLetter] = oneChannel[()]
+    if lazy:
+        retDict["lazyFile"] = fH5
+    else:
+        fH5.close()
+    retDict["containsValidData"] = True
+    return retDict
+
+def _dictForSaving(passDict):
+    # shallow copy of passDict for .mat and .pk files: the open archive of lazily loaded files and the raw ADC data
+    #   kept for lag changes are left out, and lazy channels are read into numpy(frames, x, y) arrays
+    tempDict = {key: value for key, value in passDict.items() if key not in ["lazyFile", "rawData"]}
+    tempDict["data"] = {}
+    for oneChanLetter, oneChannel in passDict["data"].items():
+        tempDict["data"][oneChanLetter] = np.asarray(oneChannel)
+    return tempDict
+
+def _saveRasterH5(passDict, fileName, tileSize=128):
+    # one gzip compressed dataset per channel (data/A etc) chunked as one frame by tileSize x tileSize pixels so
+    # single frames and crops can be read without the rest of the movie; frames are written a chunk at a time
+    if h5py is None:
+        print("h5py must be installed to save .h5 files")
+        return False
+    with h5py.File(fileName, "w") as fH5:
+        fH5.attrs["Xsize"] = passDict["Xsize"]
+        fH5.attrs["Ysize"] = passDict["Ysize"]
+        fH5.attrs["numFrames"] = passDict["numFrames"]
+        fH5.attrs["maxPossibleValue"] = passDict.get("maxPossibleValue", 2048)
+        fH5.attrs["lagPixelsAdjust"] = passDict.get("lagPixelsAdjust", 0)
+        fH5.attrs["sourceFileName"] = str(passDict.get("loadedFileName", ""))
+        _dictToH5Attrs(passDict["parms"], fH5.create_group("parms"))
+        dataGroup = fH5.create_group("data")
+        for chanLetter in passDict["channelLetters"]:
+            frameSource = passDict["data"][chanLetter]
+            numFrames = len(frameSource)
+            frameShape = np.shape(frameSource[0])
+            chunkShape = (1, min(tileSize, frameShape[0]), min(tileSize, frameShape[1]))
+            oneChannel = dataGroup.create_dataset(chanLetter, shape=(numFrames,) + frameShape,
+                                                  dtype=_frameDtype(frameSource), chunks=chunkShape,
+                                                  compression="gzip", compression_opts=4, shuffle=True)
+            firstFrame = 0
+            for frameChunk in _iterFrameChunks(frameSource):
+                oneChannel[firstFrame:firstFrame + len(frameChunk)] = frameChunk
+                firstFrame += len(frameChunk)
+            if "channelNames" in passDict and chanLetter in passDict["channelNames"]:
+                oneChannel.attrs["channelName"] = str(passDict["channelNames"][chanLetter])
+            if "channelMaxValues" in passDict and chanLetter in passDict["channelMaxValues"]:
+                oneChannel.attrs["channelMaxValue"] = int(passDict["channelMaxValues"][chanLetter])
+    return True
+
+def _dictToH5Attrs(parmDict, h5Group):
+    # parms values become string attributes (as in the ImageDesc file); nested Dicts become subgroups
+    for key, value in parmDict.items():
+        if isinstance(value, dict):
+            _dictToH5Attrs(value, h5Group.create_group(key))
+        else:
+            h5Group.attrs[key] = str(value)
+
+def _dictFromH5Attrs(h5Group):
+    tempDict = {key: str(value) for key, value in h5Group.attrs.items()}
+    for key in h5Group.keys():
+        tempDict[key] = _dictFromH5Attrs(h5Group[key])
+    return tempDict
+
+def _iterFrameChunks(frameSource, framesPerChunk=16):
+    # yields numpy(n, x, y) blocks of frames from a stack, a list of frames or a clsLazyRasterChannel
+    numFrames = len(frameSource)
+    for firstFrame in range(0, numFrames, framesPerChunk):
+        chunkFrames = min(framesPerChunk, numFrames - firstFrame)
+        if isinstance(frameSource, clsLazyRasterChannel):
+            yield frameSource.getFrames(firstFrame, chunkFrames)
+        elif isinstance(frameSource, np.ndarray):
+            yield frameSource[firstFrame:firstFrame + chunkFrames] # view, not a copy
+        else:
+            yield np.asarray(frameSource[firstFrame:firstFrame + chunkFrames])
+
+def _frameDtype(frameSource):
+    if isinstance(frameSource, (np.ndarray, clsLazyRasterChannel)):
+        return np.dtype(frameSource.dtype)
+    return np.asarray(frameSource[0]).dtype
+
+def _saveFramesTIFF(fileName, frameSource):
+    # appends frames to one multi-page TIFF; BigTIFF is used when the movie would pass the 4 GB TIFF limit
+    numFrames = len(frameSource)
+    frameBytes = np.asarray(frameSource[0]).nbytes
+    useBigTiff = (numFrames * frameBytes) > (2 ** 32 - 2 ** 25) # leave room for page headers
+    with TIFF.TiffWriter(fileName, bigtiff=useBigTiff) as tifWriter:
+        writeFrame = getattr(tifWriter, "write", None) or tifWriter.save # save in older tifffile versions
+        for frameChunk in _iterFrameChunks(frameSource):
+            for oneFrame in frameChunk:
+                writeFrame(oneFrame, contiguous=True) # contiguous pages form one image series
+
+def _readRasterHeader(fileName, fZip, specificADCchannels=None):
+    # reads parameters from a raster zip archive; returns a partially filled retDict plus the ADC channel
+    # numbers to extract, or (None, None) if the archive cannot be decoded
+    contents = fZip.namelist()
+    retDict = {}
+    retDict["data"] = {}
+    retDict["loadedFileName"] = fileName
+    retDict["channelNames"] = {} # for full name like Green or Red
+    retDict["channelMaxValues"] = {}
+
+    # file type specific stuff here
+    if path.splitext(fileName)[1].lower() == ".zip":
+        descFN = "ImageDescription.txt"
+        if not descFN in contents:
+            print("Zip file does not have an image description file: " + descFN)
+            return None, None
+        retDict["parms"] = _dictFromZip(descFN, fZip) # converts all new keys to lowercase
+        retDict["parms"]["rastercmd"] = fZip.read("RasterCmd.txt").decode("utf-8")
+    else:
+        if not path.splitext(fileName)[1].lower() == ".gsi":
+            print("ERROR - loadRasterZipFile routine can only process .zip or .gsi files.")
+            return None, None
+        tempCmd = _dictFromZip("Cmd.txt", fZip)
+        retDict["parms"] = _dictFromZip(tempCmd["imagedesc"], fZip)
+        if "hardwareSettings.txt" in contents:
+            retDict["parms"]["hardware"] = _dictFromZip("hardwareSettings.txt", fZip)
+        retDict["parms"]["numframes"] = int(tempCmd["numframes"])
+        retDict["parms"]["positiondata"] = (1 == int(tempCmd["returnpositiondata"]))
+
+    # common read stuff below here
+    retDict["Xsize"] = int(retDict["parms"]["xsize"])
+    retDict["Ysize"] = int(retDict["parms"]["ysize"])
+    retDict["numFrames"] = int(retDict["parms"]["numframes"])
+    includedADCchannels = []
+    for oneChanNum in ["0", "1", "2", "3"]:
+        if _ADCnameFromNum(oneChanNum) in contents:
+            includedADCchannels.append(int(oneChanNum))
+    if len(includedADCchannels) == 0:
+        print("Requested .zip or .gsi file does not contain any Raster ADC output files")
+        return None, None
+    if specificADCchannels:
+        chansToExtract = []
+        for oneChan in specificADCchannels:
+            chanNum = ord(oneChan.upper()) - 65 # to make A => 0, B => 1, etc
+            if chanNum in includedADCchannels:
+                chansToExtract.append(chanNum)
+            else:
+                print("Warning -- Requested channel not included in Zip file: " + oneChan)
+    else:
+        chansToExtract = includedADCchannels
+    if len(chansToExtract) == 0:
+        print("loadZipCore is ending because there are no Raster-generated ADC channels to extract.")
+        return None, None
+    retDict["channelLetters"] = [chr(65 + oneChanNum) for oneChanNum in chansToExtract]
+    return retDict, chansToExtract
+
+def _rawDataForRephase(retDict, chanLetter):
+    # raw ADC stream of one channel: the one kept in retDict[rawData], else read once from the loaded archive
+    if "rawData" in retDict and chanLetter in retDict["rawData"]:
+        return retDict["rawData"][chanLetter]
+    fileName = retDict.get("loadedFileName", "")
+    if path.splitext(fileName)[1].lower() not in [".zip", ".gsi"] or not path.exists(fileName):
+        return None
+    try:
+        with zipfile.ZipFile(fileName, "r") as fZip:
+            rawData = _arrayFromZip(_ADCnameFromNum(ord(chanLetter) - 65), fZip)
+    except (OSError, KeyError, zipfile.BadZipFile):
+        print("ERROR - could not read raw ADC data for channel " + chanLetter + " from " + fileName)
+        return None
+    retDict.setdefault("rawData", {})[chanLetter] = rawData
+    return rawData
+
+def _findZipLagAdjust(fZip, parmDict, chanNum, lagPixelsAdjust, frameNum=0, searchPixels=20):
+    # decodes one frame at full resolution (ignoring binning) and returns findBestLagAdjust for it
+    layout = dict(_rasterLayout(parmDict, lagPixelsAdjust), binX=1, binY=1)
+    if not layout["bidirectional"]:
+        print("Lag adjustment search skipped because the scan is not bidirectional.")
+        return lagPixelsAdjust
+    frameNum = min(max(0, frameNum), layout["numFrames"] - 1)
+    numPoints = _lastRasterPoint(layout, frameNum + 1)
+    rawData = _pointsFromZip(_ADCnameFromNum(chanNum), fZip, numPoints)
+    if layout["firstPoint"] < 0 or len(rawData) < numPoints:
+        print("ERROR - raw ADC data too short to search for the best lag adjustment")
+        return lagPixelsAdjust
+    oneFrame = _gatherRasterFrames(rawData, layout, layout["firstPoint"] + (frameNum * layout["frameStride"]), 1)[0]
+    # candidates must leave the first line and the last frame inside the raw data
+    minAdjust = lagPixelsAdjust - layout["firstPoint"]
+    maxAdjust = _maxLagAdjust(layout, lagPixelsAdjust, _numPointsInZip(_ADCnameFromNum(chanNum), fZip))
+    bestAdjust = findBestLagAdjust(oneFrame, lagPixelsAdjust, searchPixels=searchPixels, minAdjust=minAdjust,
+                                   maxAdjust=maxAdjust)
+    print("Best lag adjustment is " + str(bestAdjust) + " pixels.")
+    return bestAdjust
+
+def _lagScores(frameData, lagPixelsAdjust, searchPixels, minAdjust, maxAdjust):
+    # returns {candidate lagPixelsAdjust: normalized even/odd row correlation}
+    frameData = np.asarray(frameData, dtype="float64")
+    pixelsX = frameData.shape[0]
+    numPairs = frameData.shape[1] // 2
+    if numPairs < 1 or pixelsX < 4:
+        print("Frame is too small to search for the best lag adjustment")
+        return {}
+    evenRows = frameData[:, 0:2 * numPairs:2].T # [pair][x]
+    oddRows = frameData[:, 1:2 * numPairs:2].T
+    evenRows = evenRows - evenRows.mean(axis=1, keepdims=True)
+    oddRows = oddRows - oddRows.mean(axis=1, keepdims=True)
+    fftLength = 2 * pixelsX # zero padded so the correlation is linear rather than circular
+    crossSpectrum = np.sum(np.conj(np.fft.rfft(evenRows, fftLength)) * np.fft.rfft(oddRows, fftLength), axis=0)
+    crossCorr = np.fft.irfft(crossSpectrum, fftLength) # crossCorr[s] = sum over x of even[x] * odd[x + s]
+    rowNorm = np.sqrt(np.sum(evenRows ** 2) * np.sum(oddRows ** 2)) / pixelsX
+    if rowNorm == 0:
+        return {}
+    lowAdjust = lagPixelsAdjust - searchPixels
+    if minAdjust is not None:
+        lowAdjust = max(lowAdjust, minAdjust)
+    highAdjust = lagPixelsAdjust + searchPixels
+    if maxAdjust is not None:
+        highAdjust = min(highAdjust, maxAdjust)
+    scores = {}
+    for pixelStep in range(int(np.ceil(lowAdjust - lagPixelsAdjust)), int(np.floor(highAdjust - lagPixelsAdjust)) + 1):
+        candidate = lagPixelsAdjust + pixelStep
+        rowShift = -2 * pixelStep
+        overlap = pixelsX - abs(rowShift)
+        if overlap >= pixelsX // 2: # keep at least half of each row overlapping
+            scores[candidate] = crossCorr[rowShift % fftLength] / (overlap * rowNorm)
+    return scores
+
+def _loadOneRasterChannel(chanNum, fZip, parmDict, lagPixelsAdjust, fastMode, asStack, memoryMap,
+                          maxPossibleValue=2048, keepRawData=False):
+    # reads, decodes and finds the max value of one ADC channel; returns (letter, data, maxValue, rawData)
+    # rawData is None unless keepRawData is True
+    chanLetter = chr(65 + chanNum) # 0 => A, 1 => B, etc
+    chanFN = _ADCnameFromNum(chanNum) # makes full name, eg 0 => ADC0_ImageRaw_int16.bin
+    if memoryMap:
+        rawData = _memmapFromZip(chanFN, fZip)
+    else:
+        rawData = _arrayFromZip(chanFN, fZip)
+    chanData = _decodeRasterData(rawData, parmDict, lagPixelsAdjust=lagPixelsAdjust, asStack=asStack)
+    if not keepRawData:
+        rawData = None # releases the memory map (if used) now that the channel is decoded
+    if chanData is None:
+        return chanLetter, None, None, None
+    if fastMode:
+        chanMaxValue = maxPossibleValue - 1
+    else:
+        chanMaxValue = 10 * int(_fastPercentile(chanData, 99, maxPossibleValue=maxPossibleValue) / 10)
+    return chanLetter, chanData, chanMaxValue, rawData
+
+def _decodeRasterData(rawData, parmDict, lagPixelsAdjust=0, asStack=False):
     # This routine decode the binary int16 data from a single ADC channel
     # returns a list of numpy(x,y) frames; lag correction can be adjusted from saved value in off-line decode
     # last revised 29 May 2016 BWS
-    pixelsX = int(parmDict["xsize"])
-    pixelsY = int(parmDict["ysize"])
-    bidirectional = (1 == int(parmDict["bidirectional"]))
-    if lagPixelsAdjust > 20:
-        print("Warning -- max allowable positive lag pixel adjustment is 20. Resetting to this max value.")
-        lagPixelsAdjust = 20
-    lagPixels = int(parmDict["lagpixels"]) + lagPixelsAdjust
+    # the per-row loop was replaced by the vectorized _decodeRasterStack engine; asStack=True returns that
+    # contiguous (numFrames, X, Y) array directly, otherwise the list contains views into it
+    zStack = _decodeRasterStack(rawData, parmDict, lagPixelsAdjust=lagPixelsAdjust)
+    if zStack is None or asStack:
+        return zStack
+    return list(zStack)
+
+def _rasterLayout(parmDict, lagPixelsAdjust=0):
+    # computes the raw data offsets needed to decode a raster scan once instead of inside a per-row loop
+    # every scan line (forward or reverse) starts turnLength points after the end of the previous line, so
+    # lines are rowStride points apart; each frame uses one extra point (the index += 1 lag drift fix)
+    layout = {}
+    layout["pixelsX"] = int(parmDict["xsize"])
+    layout["pixelsY"] = int(parmDict["ysize"])
+    layout["numFrames"] = int(parmDict["numframes"])
+    layout["bidirectional"] = (1 == int(parmDict["bidirectional"]))
+    # a fractional lag adjustment is decoded by blending the frames that start at firstPoint and firstPoint + 1
+    wholeAdjust = int(np.floor(lagPixelsAdjust))
+    layout["lagFraction"] = float(lagPixelsAdjust - wholeAdjust)
     turnLength = int(parmDict["turnlength"])
-    numFrames = int(parmDict["numframes"]) # xx changed
-    zStack = [] # empty list to contain all decoded frames
-    index = lagPixels # start transferring data after jumping over lagPixels num of points
-    for _ in range(numFrames):
-        oneFrame = np.zeros((pixelsX, pixelsY), dtype="int16") # empty starting array must be created for each frame
-        if bidirectional:
-            # for bidirectional data we have to reverse odd rows
-            for y in range(0, pixelsY, 2):
-                index += turnLength
-                oneFrame[:,y] = rawData[index:index+pixelsX] # forward
-                index += pixelsX + turnLength
-                oneFrame[:,y+1] = rawData[index:index+pixelsX][::-1] # reverse
-                index += pixelsX
-        else:
-            # unidirectional data
-            for y in range(0, pixelsY):
-                index += turnLength
-                oneFrame[:,y] = rawData[index:index+pixelsX] # forward
-                index += pixelsX
-        index += 1 # added as temp fix for lag drift during movies 10 Jun 2016 xx
-        zStack.append(oneFrame)
+    layout["firstPoint"] = int(parmDict["lagpixels"]) + wholeAdjust + turnLength # first pixel of first line
+    layout["rowStride"] = layout["pixelsX"] + turnLength
+    layout["frameStride"] = (layout["pixelsY"] * layout["rowStride"]) + 1 # added 1 for lag drift fix 10 Jun 2016
+    # xbinning/ybinning (Minor parameters saved in the ImageDesc file) sum adjacent pixels during the decode
+    layout["binX"] = max(1, int(parmDict.get("xbinning", 1)))
+    layout["binY"] = max(1, int(parmDict.get("ybinning", 1)))
+    layout["binnedX"] = layout["pixelsX"] // layout["binX"]
+    layout["binnedY"] = layout["pixelsY"] // layout["binY"]
+    if layout["binnedX"] < 1 or layout["binnedY"] < 1:
+        layout["binX"], layout["binY"] = 1, 1 # binning larger than the image is ignored
+        layout["binnedX"], layout["binnedY"] = layout["pixelsX"], layout["pixelsY"]
+    return layout
+
+def _rasterBinning(parmDict):
+    # returns (binX, binY, binned Xsize, binned Ysize, max possible pixel value) for a raster ImageDesc dict
+    layout = _rasterLayout(parmDict)
+    if layout["pixelsX"] % layout["binX"] or layout["pixelsY"] % layout["binY"]:
+        print("Warning -- image size is not a multiple of the binning factor; extra pixels are dropped.")
+    return (layout["binX"], layout["binY"], layout["binnedX"], layout["binnedY"],
+            2048 * layout["binX"] * layout["binY"])
+
+def _decodeRasterStack(rawData, parmDict, lagPixelsAdjust=0):
+    # vectorized decode of the binary int16 data from a single ADC channel; returns one contiguous
+    # numpy(numFrames, x, y) array with the same values as the original frame by frame, row by row loop
+    layout = _rasterLayout(parmDict, lagPixelsAdjust)
+    numFrames = layout["numFrames"]
+    if layout["firstPoint"] < 0 or _lastRasterPoint(layout, numFrames) > len(rawData):
+        print("ERROR - raw ADC data does not contain enough points to decode " + str(numFrames) + " frames with lag "
+              + str(layout["firstPoint"]) + " (" + str(len(rawData)) + " points available)")
+        return None
+    return _gatherRasterFrames(rawData, layout, layout["firstPoint"], numFrames)
+
+def _lastRasterPoint(layout, numFrames):
+    # index just past the last raw point needed to decode numFrames frames
+    return (layout["firstPoint"] + ((numFrames - 1) * layout["frameStride"])
+            + ((layout["pixelsY"] - 1) * layout["rowStride"]) + layout["pixelsX"] + (layout["lagFraction"] > 0))
+
+def _maxLagAdjust(layout, lagPixelsAdjust, numPoints):
+    # largest lag adjustment that still fits all frames inside numPoints of raw data
+    return lagPixelsAdjust + numPoints - _lastRasterPoint(layout, layout["numFrames"])
+
+def _gatherRasterFrames(rawData, layout, firstPoint, numFrames):
+    # All scan lines are gathered at once through a strided view onto rawData (no copy until the final
+    # transfer into the output array); odd rows are reversed for bidirectional scans
+    if layout["lagFraction"] > 0:
+        return _gatherFractionalFrames(rawData, layout, firstPoint, numFrames)
+    if layout["binX"] > 1 or layout["binY"] > 1:
+        return _gatherBinnedFrames(rawData, layout, firstPoint, numFrames)
+    pixelsX = layout["pixelsX"]
+    pixelsY = layout["pixelsY"]
+    itemSize = rawData.itemsize
+    allLines = np.lib.stride_tricks.as_strided(rawData[firstPoint:], shape=(numFrames, pixelsY, pixelsX),
+                                               strides=(layout["frameStride"] * itemSize,
+                                                        layout["rowStride"] * itemSize, itemSize))
+    zStack = np.empty((numFrames, pixelsX, pixelsY), dtype="int16")
+    zStackLines = zStack.transpose(0, 2, 1) # view of output with the same [frame][line][pixel] order as allLines
+    if layout["bidirectional"]:
+        # for bidirectional data we have to reverse odd rows
+        zStackLines[:, 0::2, :] = allLines[:, 0::2, :] # forward
+        zStackLines[:, 1::2, :] = allLines[:, 1::2, ::-1] # reverse
+    else:
+        zStackLines[:] = allLines
+    return zStack
+
+def _gatherFractionalFrames(rawData, layout, firstPoint, numFrames):
+    # linear interpolation between the stacks decoded one raw point apart; only the gather offsets change,
+    # the result is rounded back to the integer dtype of the unshifted stack
+    wholeLayout = dict(layout, lagFraction=0.)
+    fraction = layout["lagFraction"]
+    zStack = _gatherRasterFrames(rawData, wholeLayout, firstPoint, numFrames)
+    nextStack = _gatherRasterFrames(rawData, wholeLayout, firstPoint + 1, numFrames)
+    blended = ((1. - fraction) * zStack) + (fraction * nextStack)
+    np.rint(blended, out=blended)
+    zStack[:] = blended
+    return zStack
+
+def _gatherBinnedFrames(rawData, layout, firstPoint, numFrames, framesPerChunk=16):
+    # binned version of _gatherRasterFrames; returns int32 numpy(numFrames, binnedX, binnedY)
+    # a few frames at a time are decoded at full resolution and then summed by reshaping each frame into
+    # (binnedX, binX, binnedY, binY) blocks, so the full resolution stack never exists for the whole movie
+    binX, binY = layout["binX"], layout["binY"]
+    binnedX, binnedY = layout["binnedX"], layout["binnedY"]
+    fullLayout = dict(layout, binX=1, binY=1)
+    zStack = np.empty((numFrames, binnedX, binnedY), dtype="int32")
+    for firstFrame in range(0, numFrames, framesPerChunk):
+        chunkFrames = min(framesPerChunk, numFrames - firstFrame)
+        chunkStart = firstPoint + (firstFrame * layout["frameStride"])
+        fullFrames = _gatherRasterFrames(rawData, fullLayout, chunkStart, chunkFrames)
+        fullFrames = fullFrames[:, :binnedX * binX, :binnedY * binY] # drop pixels beyond a whole bin
+        np.sum(fullFrames.reshape(chunkFrames, binnedX, binX, binnedY, binY), axis=(2, 4), dtype="int32",
+               out=zStack[firstFrame:firstFrame + chunkFrames])
     return zStack
 
+@TS.timed("percentile")
+def _fastPercentile(imageData, percentile=99, maxPossibleValue=2048, subsample=1):
+    # histogram replacement for np.percentile on raw ADC images: one bincount pass instead of a sort/partition.
+    # int16 data is counted over the full int16 range (via a uint16 view, no copy); other integer data is
+    # clipped to +/- maxPossibleValue first. The rank interpolation matches np.percentile so results are the
+    # same; subsample=N only looks at every Nth pixel for an even faster estimate. Float data uses np.percentile.
+    flatData = np.ravel(imageData)[::subsample]
+    if flatData.size == 0 or flatData.dtype.kind not in "iu":
+        return np.percentile(flatData, percentile)
+    chunkSize = 1 << 22 # limits the temporary index array bincount makes
+    if flatData.dtype == np.int16:
+        counts = np.zeros(65536, dtype=np.int64)
+        for chunkStart in range(0, flatData.size, chunkSize):
+            counts += np.bincount(flatData[chunkStart:chunkStart + chunkSize].view(np.uint16), minlength=65536)
+        counts = np.concatenate((counts[32768:], counts[:32768])) # reorder as signed values -32768 ... 32767
+        lowestValue = -32768
+    else:
+        counts = np.zeros(2 * maxPossibleValue, dtype=np.int64)
+        for chunkStart in range(0, flatData.size, chunkSize):
+            oneChunk = np.clip(flatData[chunkStart:chunkStart + chunkSize], -maxPossibleValue, maxPossibleValue - 1)
+            counts += np.bincount((oneChunk + maxPossibleValue).astype(np.intp), minlength=2 * maxPossibleValue)
+        lowestValue = -maxPossibleValue
+    cumCounts = np.cumsum(counts)
+    rankPos = (percentile / 100.) * (flatData.size - 1) # same linear interpolation rule as np.percentile
+    lowerRank = int(np.floor(rankPos))
+    lowerValue = np.searchsorted(cumCounts, lowerRank, side="right") + lowestValue
+    upperValue = np.searchsorted(cumCounts, min(lowerRank + 1, flatData.size - 1), side="right") + lowestValue
+    return lowerValue + ((rankPos - lowerRank) * (upperValue - lowerValue))
+
 def _ADCnameFromNum(chanNum):
     # converts an int like 0 or 1 into a complete file name that matches the format used in the zip archive
     return "ADC" + str(chanNum) + "_ImageRaw_int16.bin"
 
+def _dtypeFromName(fName):
+    # binary members end in their dtype, eg ADC0_ImageRaw_int16.bin => int16
+    return np.dtype(path.splitext(fName)[0].split("_")[-1].lower())
+
+def _numPointsInZip(fName, zipHandle):
+    # number of values in a binary member without reading it
+    return zipHandle.getinfo(fName).file_size // _dtypeFromName(fName).itemsize
+
 def _arrayFromZip(fName, zipHandle):
     # reads data file from Zip archive assuming last _ thing in name is dtype string
     fRoot = path.splitext(fName)[0]
     myDtype = fRoot.split("_")[-1].lower() # should be int16, float64 etc
     return np.frombuffer(zipHandle.read(fName), dtype=myDtype)
 
+def _pointsFromZip(fName, zipHandle, numPoints):
+    # reads only the first numPoints values of a binary member (deflated members are inflated just that far)
+    myDtype = _dtypeFromName(fName)
+    with zipHandle.open(fName, "r") as fMember:
+        rawBytes = fMember.read(numPoints * myDtype.itemsize)
+    return np.frombuffer(rawBytes, dtype=myDtype)
+
+def _memmapFromZip(fName, zipHandle, allowFallback=True):
+    # returns a read-only np.memmap onto a binary file that is stored uncompressed (ZIP_STORED) in the Zip
+    # archive; the bytes of such a file sit contiguously after its local header so no copy is needed.
+    # For deflated/encrypted files (or archives opened from memory) returns _arrayFromZip, or None if allowFallback=False
+    zipInfo = zipHandle.getinfo(fName)
+    archiveName = zipHandle.filename
+    canMap = zipInfo.compress_type == zipfile.ZIP_STORED and not (zipInfo.flag_bits & 0x1) # bit 0 = encrypted
+    if canMap and archiveName and zipInfo.file_size > 0:
+        with open(archiveName, "rb") as fArchive:
+            fArchive.seek(zipInfo.header_offset)
+            localHeader = fArchive.read(30) # fixed part of zip local file header
+        if len(localHeader) == 30 and localHeader[:4] == b"PK\x03\x04":
+            nameLength, extraLength = struct.unpack("<HH", localHeader[26:30])
+            dataOffset = zipInfo.header_offset + 30 + nameLength + extraLength
+            myDtype = _dtypeFromName(fName)
+            return np.memmap(archiveName, dtype=myDtype, mode="r", offset=dataOffset,
+                             shape=(zipInfo.file_size // myDtype.itemsize,))
+    if allowFallback:
+        return _arrayFromZip(fName, zipHandle)
+    return None
+
 def _dictFromZip(fName, zipHandle):
     # removes section headings and just makes a one-level Dict; always converts keys to lowercase
     config = ConfigParser.ConfigParser()
@@ -399,7 +1028,7 @@ def _findChannelMaxValues(retDict):
     for ff in range(retDict["numFrames"]):
         for cc in range(retDict["numChannels"]):
             # get the 99th percentile value of the pixels in each frame
-            tempValue = 10 * int(np.percentile(retDict["data"][cc][ff], 99) / 10)
+            tempValue = 10 * int(_fastPercentile(retDict["data"][cc][ff], 99) / 10)
             #print("Max: " + str(tempValue) + "  and min " + str(np.percentile(retDict["data"][cc][ff], 1)))
             if tempValue > tempList[cc]:
                 tempList[cc] = tempValue
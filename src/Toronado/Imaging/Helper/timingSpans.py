@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+""" timingSpans.py
+
+Per-stage timing of the scan-to-display chain (control file, scan generation, zip build, send, hardware wait,
+receive, decode, display). Code is timed either with a context manager or a decorator:
+    with TS.span("buildZip"):
+        ...
+    @TS.timed("decode")
+    def loadRasterZipFile(...):
+Each span (stage name, start time, duration in ms, thread name, tag) goes into a ring buffer that keeps the
+most recent maxSpans spans. summaryText() gives count / mean / median / 95th percentile / max per stage (the
+RasterGUI "timing" command) and setLogFile() also appends every span to a .csv or .json (one JSON object per
+line) file as it is recorded.
+
+"""
+
+import time
+import threading
+import collections
+import functools
+import contextlib
+import json
+import os.path as path
+import numpy as np
+
+maxSpans = 5000
+_spans = collections.deque(maxlen=maxSpans)
+_spansLock = threading.Lock()
+_logHandle = None
+_logIsJSON = False
+logFields = ["stage", "startTime", "durationMs", "thread", "tag"]
+
+@contextlib.contextmanager
+def span(stageName, tag=""):
+    startTime = time.time()
+    startCounter = time.perf_counter()
+    try:
+        yield
+    finally:
+        addSpan(stageName, startTime, 1000. * (time.perf_counter() - startCounter), tag)
+
+def timed(stageName):
+    # decorator version of span for timing whole functions
+    def decorator(timedFunction):
+        @functools.wraps(timedFunction)
+        def wrapper(*args, **kwargs):
+            with span(stageName):
+                return timedFunction(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def addSpan(stageName, startTime, durationMs, tag=""):
+    # for stages timed by hand; startTime is time.time() seconds, durationMs in milliseconds
+    oneSpan = (stageName, startTime, durationMs, threading.current_thread().name, str(tag))
+    with _spansLock:
+        _spans.append(oneSpan)
+        if _logHandle:
+            _writeLogEntry(oneSpan)
+
+def getSpans(stageName=None):
+    # returns a list of recorded span tuples (oldest first), optionally only those of one stage
+    with _spansLock:
+        return [oneSpan for oneSpan in _spans if stageName is None or oneSpan[0] == stageName]
+
+def clear():
+    with _spansLock:
+        _spans.clear()
+
+def setRingSize(numSpans):
+    global _spans, maxSpans
+    with _spansLock:
+        maxSpans = max(1, int(numSpans))
+        _spans = collections.deque(_spans, maxlen=maxSpans)
+    return maxSpans
+
+def summary():
+    # returns an ordered Dict of stage name => Dict of count, meanMs, medianMs, p95Ms, maxMs, totalMs; stages are
+    #   listed in the order they first appear so they follow the acquisition chain
+    stageTimes = collections.OrderedDict()
+    for oneSpan in getSpans():
+        stageTimes.setdefault(oneSpan[0], []).append(oneSpan[2])
+    retDict = collections.OrderedDict()
+    for stageName, durations in stageTimes.items():
+        durations = np.array(durations)
+        retDict[stageName] = {"count": len(durations), "meanMs": float(np.mean(durations)),
+                              "medianMs": float(np.median(durations)), "p95Ms": float(np.percentile(durations, 95)),
+                              "maxMs": float(np.max(durations)), "totalMs": float(np.sum(durations))}
+    return retDict
+
+def summaryText():
+    stageStats = summary()
+    if not stageStats:
+        return "No timing spans recorded yet."
+    nameWidth = max(len(stageName) for stageName in stageStats) + 2
+    lines = ["Stage".ljust(nameWidth) + "{:>7}{:>10}{:>10}{:>10}{:>10}".format("count", "mean ms", "median", "p95",
+                                                                             "max")]
+    for stageName, stats in stageStats.items():
+        lines.append(stageName.ljust(nameWidth) + "{:>7d}{:>10.2f}{:>10.2f}{:>10.2f}{:>10.2f}".format(
+            stats["count"], stats["meanMs"], stats["medianMs"], stats["p95Ms"], stats["maxMs"]))
+    return "\n".join(lines)
+
+def setLogFile(fileName):
+    # starts appending every new span to fileName (.json gives one JSON object per line, anything else CSV);
+    #   None or an empty name stops logging. Returns True if the log file is open.
+    global _logHandle, _logIsJSON
+    with _spansLock:
+        if _logHandle:
+            _logHandle.close()
+            _logHandle = None
+        if not fileName:
+            return False
+        fileName = path.expanduser(fileName)
+        newFile = not path.exists(fileName) or path.getsize(fileName) == 0
+        try:
+            _logHandle = open(fileName, "a")
+        except OSError as errorInfo:
+            print("Could not open timing log file " + fileName + ": " + str(errorInfo))
+            return False
+        _logIsJSON = path.splitext(fileName)[1].lower() == ".json"
+        if newFile and not _logIsJSON:
+            _logHandle.write(",".join(logFields) + "\n")
+    return True
+
+def _writeLogEntry(oneSpan):
+    if _logIsJSON:
+        _logHandle.write(json.dumps(dict(zip(logFields, oneSpan))) + "\n")
+    else:
+        _logHandle.write(oneSpan[0] + "," + "{:.6f}".format(oneSpan[1]) + "," + "{:.3f}".format(oneSpan[2]) + "," +
+                         oneSpan[3] + "," + oneSpan[4].replace(",", ";") + "\n")
+    _logHandle.flush()
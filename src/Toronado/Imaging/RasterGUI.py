@@ -27,8 +27,13 @@ from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 import Imaging.Helper.RasterDisplayThread as RDT
 import Imaging.Helper.rasterPlots as RP
+import Imaging.Helper.AcquisitionThread as AT
 import traceback
 import Imaging.doScan as DS
+import Imaging.Helper.processImageData as PI
+import Imaging.Helper.timingSpans as TS
+import Imaging.Helper.Scans.scanRegistry as SR
+from Imaging.Helper.EasyDict import EasyDict
 
 class clsRasterGUI(QtGui.QDialog):
     """The core scope window class
@@ -39,6 +44,8 @@ class clsRasterGUI(QtGui.QDialog):
     acquired frame/movie to all the ImageDisplay windows controlled by the callingInstance window.)
 
     """
+    axographMessageReceived = QtCore.Signal(str) # emitted by the file watcher thread; handled in the GUI thread
+
     def __init__(self, callingInstance, iniParameters):
         super(clsRasterGUI, self).__init__()
         self.callingInstance = callingInstance # save handle so we can use that instance to display images
@@ -54,7 +61,23 @@ class clsRasterGUI(QtGui.QDialog):
         self.focusMode = False
         self.lastStartTime = None
         self.runViaAxograph = False
+        self.focusFramesInFlight = 0
+        self.numFocusFrames = 0
+        self.numFocusFramesDropped = 0
+        self.numControlFiles = 0
+        # scans run on a separate acquisition thread unless asyncAcquisition = 0 in the system INI file
+        if iniParameters.get("asyncAcquisition", "1").lower() not in self.falseStrings:
+            self.acqThread = AT.clsAcquisitionThread()
+            self.acqThread.start()
+        else:
+            self.acqThread = None
+        # find the scan generation functions now rather than on the first scan
+        SR.registerScanModules(iniParameters.get("scanModules", ""))
+        SR.scanFunctionNames("raster")
+        if len(iniParameters.get("timingLog", "").strip()):
+            TS.setLogFile(iniParameters["timingLog"].strip()) # per-stage scan timing, see the timing command
         # start the Axograph file watcher if requested in system iniParameter file
+        self.axographMessageReceived.connect(self.processAxographMessage)
         self._initAxographWatcher(iniParameters)
         # save the main system parameters dict
         self.systemParms = iniParameters
@@ -84,6 +107,31 @@ class clsRasterGUI(QtGui.QDialog):
         # retFunction is routine that should be called once new image data is available
         #  (This routine communicates with hardware via the doRunScanner function in the Image.doScan module)
         QtGui.QApplication.processEvents()
+        cmdFN = self._writeScanControlFile(newFileName, numFrames, focusMode)
+        if not cmdFN:
+            return None
+        retDict = self._runDoScan(cmdFN)
+        return self._finishScan(retFunction, retDict)
+
+    def submitScan(self, retFunction, newFileName, numFrames=1, focusMode=False, onFinished=None):
+        # same as runScanner but returns as soon as the scan is queued on the acquisition thread; once the data
+        #   arrive the image is displayed via retFunction and onFinished(retFileName, curParms) is called
+        cmdFN = self._writeScanControlFile(newFileName, numFrames, focusMode)
+        if not cmdFN:
+            if onFinished:
+                onFinished("", None)
+            return False
+        def finishFunction(retDict):
+            retFileName, curParms = self._finishScan(retFunction, retDict)
+            if onFinished:
+                onFinished(retFileName, curParms)
+        if self.acqThread:
+            self.acqThread.submitJob(cmdFN, finishFunction)
+        else:
+            finishFunction(DS.doCommonEntry(cmdFN))
+        return True
+
+    def _writeScanControlFile(self, newFileName, numFrames, focusMode):
         tempCmds = {}
         tempCmds["numFrames"] = str(numFrames)
         tempCmds["focusMode"] = str(int(focusMode)) # converts True to 1 but still allows 0 or 1 to be passed
@@ -92,11 +140,34 @@ class clsRasterGUI(QtGui.QDialog):
             tempCmds["estSecPerFrame"] = str(self.lastEstSec)
         tempCmds["doScanFunction"] = "runScanner"
         cmdFN = self._writeControlFile(tempCmds) # writes cmd.txt file with tempCmds key,value added to [Interface]
-        # next line writes imageDesc file and waveforms, if needed, and communicates with hardwarePC
         if not cmdFN:
             print("ERROR - did not get back a proper cmdFN from writeControlFile inside runScanner")
-            return None
-        retDict = DS.doCommonEntry(cmdFN)
+        return cmdFN
+
+    def _runDoScan(self, cmdFN):
+        # writes imageDesc file and waveforms, if needed, and communicates with hardwarePC; when the acquisition
+        #   thread is running the command waits for the scan in progress but not for scans queued there
+        if self.acqThread:
+            return self.acqThread.runJobNow(cmdFN)
+        return DS.doCommonEntry(cmdFN)
+
+    def _runShortCommand(self, cmdFN, cmdName, onFinished=None):
+        # short commands (shutter, arm/disarm photometry) go ahead of queued scans on the acquisition thread and
+        #   return at once (True once queued); onFinished(retOkay) is called when the hardware has the command
+        def finishFunction(retDict):
+            if not retDict["retOkay"]:
+                print("ERROR - problem sending " + cmdName + " to the hardware computer")
+            if onFinished:
+                onFinished(retDict["retOkay"])
+            return retDict["retOkay"]
+        if self.acqThread:
+            self.acqThread.submitJob(cmdFN, finishFunction, urgent=True)
+            return True
+        return finishFunction(DS.doCommonEntry(cmdFN))
+
+    @TS.timed("finishScan")
+    def _finishScan(self, retFunction, retDict, showImage=True):
+        # post processing, display and status updates once doScan has returned (or the queued job finished)
         if retDict["retOkay"]:
             retFileName = retDict["newFileName"]
             imageDescFN = retDict["imageDescFN"]
@@ -105,6 +176,7 @@ class clsRasterGUI(QtGui.QDialog):
                 print(echoStr)
             postProcFuncName = self.minorParameters["postprocfunction"].lower().strip()
             if len(postProcFuncName) and int(self.minorParameters["postprocenable"]):
+                DS.waitForFileWrite(retFileName) # post processing reads the saved file
                 postModuleName = self.minorParameters["postprocmodule"].strip()
                 if len(path.split(postModuleName)[0]) == 0:
                     postModuleName = "Imaging.Helper." + postModuleName
@@ -117,10 +189,16 @@ class clsRasterGUI(QtGui.QDialog):
                 except:
                     print("ERROR - could not match requested postProcFunction: " + postProcFuncName)
 
-            if int(self.minorParameters["calldisplay"]) == 1:
-                retFunction(retFileName)
+            if int(self.minorParameters["calldisplay"]) == 1 and retFunction:
+                if showImage:
+                    retFunction(self._newDisplayItem(retFileName, retDict))
+            elif "gsiBytes" in retDict:
+                DS.waitForFileWrite(retFileName) # caller may read the new file right away
             if imageDescFN:
-                curParms = self.callingInstance.processINIfile(imageDescFN) # full saved parm set
+                if "imageDescText" in retDict:
+                    curParms = self._processImageDescText(retDict["imageDescText"]) # zip was built in memory
+                else:
+                    curParms = self.callingInstance.processINIfile(imageDescFN) # full saved parm set
                 self.lastEstSec = float(curParms["Derived"]["estimatedTotalSeconds"])
                 if "statusMsg" in curParms["Derived"]:
                     self.statusLabel.setText(curParms["Derived"]["statusMsg"])
@@ -136,9 +214,19 @@ class clsRasterGUI(QtGui.QDialog):
             self.lastNumFrames = -1 # to force regeneration of scan waveforms on next scan
             return "", None
 
-    def sendGenericCommand(self, newCmdStr):
+    def _newDisplayItem(self, retFileName, retDict):
+        # when doScan received the data into memory (receiveInMemory = 1) the image is decoded from those bytes
+        #   while the .gsi file is still being written, and the image windows get the decoded Dict
+        if "gsiBytes" in retDict:
+            imageDict = PI.loadRasterZipFile(retFileName, fastMode=False, zipBytes=retDict["gsiBytes"])
+            if imageDict:
+                return imageDict
+            DS.waitForFileWrite(retFileName)
+        return retFileName
+
+    def sendGenericCommand(self, newCmdStr, onFinished=None):
         # Main routine for sending mode change commands such as openShutter
-        #  (This routine communicates with hardware via doGenericCommand)
+        #  (This routine communicates with hardware via doGenericCommand; see _runShortCommand for onFinished)
         tempCmds = {}
         tempCmds["doScanFunction"] = "genericCommand"
         tempCmds["specificCommand"] = newCmdStr
@@ -146,8 +234,7 @@ class clsRasterGUI(QtGui.QDialog):
         if not cmdFN:
             print("ERROR - did not get back a proper cmdFN from writeControlFile")
             return None
-        retDict = DS.doCommonEntry(cmdFN)
-        return retDict["retOkay"]
+        return self._runShortCommand(cmdFN, newCmdStr, onFinished)
 
     def loadPhotometryScans(self):
         # Arms the photometry system (Communicates with hardware via doArmPhotometry)
@@ -163,12 +250,28 @@ class clsRasterGUI(QtGui.QDialog):
         if not cmdFN:
             print("ERROR - did not get back a proper cmdFN from writeControlFile inside loadPhotometryScans")
             return None, None
-        retDict = DS.doCommonEntry(cmdFN)
-        return retDict["retOkay"]
+        return self._runShortCommand(cmdFN, "armPhotometry")
 
     def testPhotometryScan(self, xVolt, yVolt):
         # runs a brief photometry scan and retrieves output; allows testing different X offset adjustments
         #  (Communicates with hardware via doTestPhotometry)
+        cmdFN = self._writePhotometryTestFile(xVolt, yVolt)
+        if not cmdFN:
+            return None, None
+        return self._finishPhotometryTest(self._runDoScan(cmdFN), xVolt, yVolt)
+
+    def submitPhotometryTest(self, xVolt, yVolt, onFinished):
+        # queued version of testPhotometryScan; onFinished(meanA, meanB) is called when the test is done
+        cmdFN = self._writePhotometryTestFile(xVolt, yVolt)
+        if not cmdFN:
+            onFinished(None, None)
+        elif self.acqThread:
+            self.acqThread.submitJob(cmdFN, lambda retDict: onFinished(*self._finishPhotometryTest(retDict, xVolt, yVolt)))
+        else:
+            onFinished(*self._finishPhotometryTest(DS.doCommonEntry(cmdFN), xVolt, yVolt))
+
+    def _writePhotometryTestFile(self, xVolt, yVolt):
+        # the test parameters only go into the control file; the current photometry settings are kept
         oldPhotometryMode = self.photometryMode
         oldMinorParms = self.minorParameters.copy()
         self.minorParameters["photometrydurms"] = "15" # do photometry spot test for 15 ms
@@ -180,16 +283,14 @@ class clsRasterGUI(QtGui.QDialog):
         tempCmds = {}
         tempCmds["doScanFunction"] = "testPhotometry"
         cmdFN = self._writeControlFile(tempCmds) # writes cmd.txt file
-        # next line writes imageDesc file and waveforms, if needed, and communicates with hardwarePC
         if not cmdFN:
-            print("ERROR - did not get back a proper cmdFN from writeControlFile inside loadPhotometryScans")
-            return None, None
-        retDict = DS.doCommonEntry(cmdFN)
-
+            print("ERROR - did not get back a proper cmdFN from writeControlFile inside testPhotometryScan")
         self.minorParameters = oldMinorParms.copy()
         self.photometryMode = oldPhotometryMode
-        self._disablePhotometryMode()
+        return cmdFN
 
+    def _finishPhotometryTest(self, retDict, xVolt, yVolt):
+        self._disablePhotometryMode()
         if retDict["retOkay"]:
             self.lastTestPhotometryXvolts = xVolt
             self.lastTestPhotometryYvolts = yVolt
@@ -197,13 +298,30 @@ class clsRasterGUI(QtGui.QDialog):
         else:
             return None, None
 
+    def _processImageDescText(self, descText):
+        # same Dict of sections that processINIfile makes from an ImageDesc file, but from its text
+        config = ConfigParser.ConfigParser()
+        config.read_string(descText)
+        descDict = EasyDict()
+        for oneSection in config.sections():
+            descDict[oneSection] = EasyDict()
+            for key in config[oneSection]:
+                descDict[oneSection][key] = config[oneSection][key].split(";")[0].strip()
+        return descDict
+
+    @TS.timed("writeControlFile")
     def _writeControlFile(self, doScanCommands, newFileName="", numFrames=1, focusMode=0):
         #  helper routine that is typically called before communicating with hardware computer
         #    this routine packages the current parameters and fileName/frame info if taking images
         #    required doScanCommands is a Dict with information about which routine inside DoScan.py
         #    should be called and provides any parameters the top-level DoScan function needs
         #    The doScanCommands Dict needs to provide a string value for the "doScanFunction" key
-        cmdFileName = self.systemParms["tempFolder"] + "/DoScanInput.txt"
+        #    Each command queued on the acquisition thread gets its own file (removed once it has been run)
+        if self.acqThread:
+            self.numControlFiles += 1
+            cmdFileName = self.systemParms["tempFolder"] + "/DoScanInput_" + str(self.numControlFiles) + ".txt"
+        else:
+            cmdFileName = self.systemParms["tempFolder"] + "/DoScanInput.txt"
         with open(cmdFileName, "w") as fControl:
             refreshNeeded = self._checkForChangedMajorParms()
             numFramesChanged = numFrames != self.lastNumFrames
@@ -244,10 +362,8 @@ class clsRasterGUI(QtGui.QDialog):
             self.cmdSingle.setFocus(True)
             self.setWindowTitle("Single frame started with " + self.minorParameters["objective"])
             self.guiLockOut = True
-            retFileName, curParms = self.runScanner(self.callingInstance.requestNewImageDisplayItem,
-                                                       self._getNextSaveFileName(),
-                                                       numFrames=1)
-            self.guiLockOut = False
+            self.submitScan(self.callingInstance.requestNewImageDisplayItem, self._getNextSaveFileName(),
+                            numFrames=1, onFinished=self._scanFinished)
 
     def doMovie(self):
         # GUI callback
@@ -258,10 +374,12 @@ class clsRasterGUI(QtGui.QDialog):
             self.setWindowTitle("Movie acquisition started ...")
             self.curMode = "movie"
             self.guiLockOut = True
-            retFileName, curParms = self.runScanner(self.callingInstance.requestNewImageDisplayItem,
-                                                       self._getNextSaveFileName(),
-                                                       numFrames=int(self.numFrames.value()))
-            self.guiLockOut = False
+            self.submitScan(self.callingInstance.requestNewImageDisplayItem, self._getNextSaveFileName(),
+                            numFrames=int(self.numFrames.value()), onFinished=self._scanFinished)
+
+    def _scanFinished(self, retFileName, curParms):
+        # called once a single frame or movie submitted by doSingle/doMovie is done
+        self.guiLockOut = False
 
     def doFocus(self):
         # GUI callback
@@ -273,6 +391,14 @@ class clsRasterGUI(QtGui.QDialog):
             self.setWindowTitle("Focus mode started ...")
             self.curMode = "focus"
             self.focusMode = True
+            if self.acqThread:
+                # pipelined focus: focusPipeline frames are kept queued so the next request goes to the hardware
+                #   computer while the last frame is decoded and displayed; frames the display cannot keep up
+                #   with are skipped. Each finished frame queues a new one until Stop is pressed.
+                self.numFocusFrames = 0
+                self.numFocusFramesDropped = 0
+                self._fillFocusPipeline()
+                return
             while self.focusMode:
                 QtGui.QApplication.processEvents()
                 retFileName, curParms = self.runScanner(self.callingInstance.requestNewImageDisplayItem,
@@ -284,11 +410,37 @@ class clsRasterGUI(QtGui.QDialog):
         else:
             self._stopFocusMode()
 
+    def _fillFocusPipeline(self):
+        pipelineDepth = max(1, int(self.minorParameters["focuspipeline"]))
+        while self.focusMode and self.focusFramesInFlight < pipelineDepth:
+            # frames in flight each get their own temp file so one being displayed is not overwritten
+            fileIndex = (self.numFocusFrames + self.focusFramesInFlight) % (pipelineDepth + 2)
+            focusFileName = self.systemParms["tempFolder"] + "/tempFocusImage" + str(fileIndex) + ".gsi"
+            cmdFN = self._writeScanControlFile(focusFileName, 1, False)
+            if not cmdFN:
+                break
+            self.focusFramesInFlight += 1
+            self.acqThread.submitJob(cmdFN, self._focusFrameFinished)
+
+    def _focusFrameFinished(self, retDict):
+        self.focusFramesInFlight -= 1
+        self.numFocusFrames += 1
+        self._fillFocusPipeline() # the next request is queued before this frame is decoded and displayed
+        showImage = self.acqThread.numNewerResults() == 0 # a later frame is already waiting to be shown
+        if not showImage:
+            self.numFocusFramesDropped += 1
+        retFileName, curParms = self._finishScan(self.callingInstance.requestNewImageDisplayItem, retDict, showImage)
+        if retFileName and int(self.minorParameters["diagmode"]):
+            print("Got frame at " + str(datetime.datetime.now()))
+
     def _stopFocusMode(self):
         # helper function for doFocus()
         self.focusMode = False
         self.cmdFocus.setText("Focus")
         self.setWindowTitle("Focus mode stopped.")
+        if self.numFocusFramesDropped and int(self.minorParameters["diagmode"]):
+            print("Focus mode skipped displaying " + str(self.numFocusFramesDropped) + " of " +
+                  str(self.numFocusFrames) + " frames to keep up with the scanner")
         QtGui.QApplication.processEvents()
 
 
@@ -299,8 +451,7 @@ class clsRasterGUI(QtGui.QDialog):
         # called either by RasterGUI with X and Y volts and a spotName to be added to the comboBox or
         #   internally when a previous testSpot position should be added to the comboBox
         if testMode:
-            meanA, meanB = self.testPhotometryScan(xVolts, yVolts)
-            print("Single spot test: " + str(int(meanA * 10) /10.) + " and " + str(int(meanB * 10) /10.))
+            self.submitPhotometryTest(xVolts, yVolts, self._printPhotometryTest)
         else:
             if spotName.strip():
                 newKey = spotName.strip().replace(" ", "_")
@@ -311,6 +462,12 @@ class clsRasterGUI(QtGui.QDialog):
             else:
                 print("Problem with empty spot name passed to setCursorPos in RasterGUI")
 
+    def _printPhotometryTest(self, meanA, meanB):
+        if meanA is None:
+            print("Single spot test failed.")
+        else:
+            print("Single spot test: " + str(int(meanA * 10) /10.) + " and " + str(int(meanB * 10) /10.))
+
     def doPhotoArm(self):
         # GUI callback
         curKey = str(self.photoName.currentText()).replace(" ", "_")
@@ -345,20 +502,23 @@ class clsRasterGUI(QtGui.QDialog):
         if curKey:
             self.photometryMode = True
             self.photoLabel.setStyleSheet("color: rgb(255, 0, 0)")
-            curPosX = self.photoSpotsDict[curKey][0]
-            curPosY = self.photoSpotsDict[curKey][1]
-            bestAsignal = 0.
-            bestAoffset = 0.
-            for ii in range(-10, 10):
-                xOffset = ii * float(self.minorParameters["photometryautoinc"])
-                self._updatePhotometryParameters()
-                meanA, meanB = self.testPhotometryScan(curPosX + xOffset, curPosY)
-                print("test offset: " + str(xOffset) + " meanA: " + str(meanA))
-                if meanA > bestAsignal:
-                    bestAsignal = meanA
-                    bestAoffset = xOffset
-            if bestAoffset != 0.:
-                print("setting best offset to " + str(bestAoffset))
+            self._photoAutoXStep(self.photoSpotsDict[curKey][0], self.photoSpotsDict[curKey][1], -10, 0., 0.)
+
+    def _photoAutoXStep(self, curPosX, curPosY, stepNum, bestAsignal, bestAoffset):
+        # helper for doPhotoAutoX; each test spot is queued once the previous one is done so the GUI stays live
+        xOffset = stepNum * float(self.minorParameters["photometryautoinc"])
+        def testFinished(meanA, meanB):
+            print("test offset: " + str(xOffset) + " meanA: " + str(meanA))
+            if meanA is not None and meanA > bestAsignal:
+                newBest = (meanA, xOffset)
+            else:
+                newBest = (bestAsignal, bestAoffset)
+            if stepNum + 1 < 10:
+                self._photoAutoXStep(curPosX, curPosY, stepNum + 1, *newBest)
+            elif newBest[1] != 0.:
+                print("setting best offset to " + str(newBest[1]))
+        self._updatePhotometryParameters()
+        self.submitPhotometryTest(curPosX + xOffset, curPosY, testFinished)
 
     def _disablePhotometryMode(self):
         # Helper function for commonly used code
@@ -524,6 +684,10 @@ class clsRasterGUI(QtGui.QDialog):
 
     def closeWindow(self):
         # GUI callback
+        self.focusMode = False
+        if self.acqThread:
+            self.acqThread.stop() # lets a scan in progress finish
+        DS.closeHardwareSessions()
         QtCore.QCoreApplication.instance().quit()
 
 
@@ -561,7 +725,10 @@ class clsRasterGUI(QtGui.QDialog):
         retValue = True
         if actualCommand in ["help"]:
             print("Minor parameters: " + str(self.minorParameters.keys()))
-            print("Special commands: help, dump, dumplow")
+            print("Special commands: help, dump, dumplow, timing, timingclear")
+            print("  scanFunction choices: " + ", ".join(SR.scanFunctionNames("raster")))
+            print("  photometryShape choices: " + ", ".join(SR.scanFunctionNames("photometry")))
+            print("  timingLog = fileName.csv (or .json) logs each scan stage time, timingLog = off stops logging")
         elif actualCommand in ["dumpraw"]:
             print(self.minorParameters)
         elif actualCommand in ["dumpminor", "dump"]:
@@ -574,6 +741,12 @@ class clsRasterGUI(QtGui.QDialog):
             self._dictToStringList(self.minorParameters, printNow=True)
             print(" System ")
             self._dictToStringList(self.systemParms, printNow=True)
+        elif actualCommand in ["timing", "timingsummary"]:
+            # time taken by each stage from control file to image display for the last TS.maxSpans spans
+            print(TS.summaryText())
+        elif actualCommand in ["timingclear", "cleartiming"]:
+            TS.clear()
+            print("  Cleared stored timing spans.")
         elif actualCommand in ["plotrowpair", "plotrow", "pr"]:
             self.plotRowPair()
         elif actualCommand in ["plotxpos", "plotxposition", "plotx"]:
@@ -647,6 +820,13 @@ class clsRasterGUI(QtGui.QDialog):
             else:
                 print("Problem in setting pixelUs value: " + str(noun))
                 return False
+        elif cmd == "timinglog":
+            if noun.lower() in self.falseStrings + ["none"]:
+                TS.setLogFile(None)
+                print("  Stopped timing log.")
+            elif TS.setLogFile(noun):
+                print("  Logging scan stage times to: " + noun)
+            return "timingLog"
         elif "fullscale" in cmd:
             newIndex = None
             if noun.lower() == "off":
@@ -811,6 +991,7 @@ class clsRasterGUI(QtGui.QDialog):
         #tempDict["scanmodule"] = "createStandardScans" # either imports standard scanning module or specialized ones
         tempDict["scanfunction"] = "standard" # allows specialized scans if not passed as standard
         tempDict["calldisplay"] = "1" # whether to update the ImageDisplay windows after aquiring new data
+        tempDict["focuspipeline"] = "2" # focus frames kept queued for the hardware computer (1 = one at a time)
         tempDict["postprocenable"] = "0"
         tempDict["postprocmodule"] = "" # allows special routines to be called after acquiring images
         tempDict["postprocfunction"] = "" # subroutine name to be called after acquiring images
@@ -824,6 +1005,9 @@ class clsRasterGUI(QtGui.QDialog):
         # to turn-around and therefore a smaller % of the scan spent acquiring actual data. The actual turn-
         # around duration in influenced by the pixel clock and zoom level as well. Only used with bidirectional scans
         tempDict["rotation"] = "0" # image rotation in degrees
+        tempDict["scanencoding"] = "float64" # how scan waveforms are sent: float64, float32 or int16 samples; adding
+        # rowpair (eg "rowpair int16") sends one row pair plus the Y ramp settings instead of the whole frame, which
+        # needs a hardware program that expands it (see Helper/hardwareStandIn.py)
         tempDict["xbinning"] = "1" # compresses the final image after decoding; value of 2 turns 512 acquired
         # pixels into a final image with 256 X pixels; adjecent pixels are summed to form final image
         tempDict["ybinning"] = "1" # same as above for Y axis
@@ -1268,6 +1452,6 @@ class clsWatchForFile(FileSystemEventHandler):
                 remoteText = fRemote.read()
             os.remove(fName)
             if self.funcName == "axograph":
-                self.callingInstance.processAxographMessage(remoteText)
+                self.callingInstance.axographMessageReceived.emit(remoteText) # handled in the GUI thread
             else:
                 print("Unknown funcName passed to clsWatchForFile: " + self.funcName)
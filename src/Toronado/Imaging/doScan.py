@@ -20,11 +20,37 @@ import numpy as np
 import os.path as path
 import datetime
 import time
-import importlib
+import traceback
+import io
+import shutil
+import hashlib
+import collections
+import threading
 import configparser as ConfigParser
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from .Helper.EasyDict import EasyDict
 import Imaging.Helper.processImageData as PI
+import Imaging.Helper.Scans.scanFiles as SF
+import Imaging.Helper.Scans.scanRegistry as SR
+import Imaging.Helper.hardwareLink as HL
+import Imaging.Helper.timingSpans as TS
+
+# scans already generated by _createScan (derived parms plus waveform file bytes) keyed by a hash of the parameters
+# that shape the waveforms, so switching back to an earlier configuration skips scan generation; the System INI
+# entry scanCacheSize sets how many are kept (0 turns the cache off)
+_scanCache = collections.OrderedDict()
+_defaultScanCacheSize = 8
+# Minor parameters that only affect decoding, display or bookkeeping and never the scan waveforms
+_scanCacheIgnoredMinor = ["calldisplay", "focuspipeline", "postprocenable", "postprocmodule", "postprocfunction",
+                          "echostring", "macrofolder", "xbinning", "ybinning", "zlevel", "zstackindex", "objective",
+                          "listentoaxograph", "diagmode", "forcenewscanwaveforms"]
+
+# open sessions with hardware computers (persistentSession = 1 in the system INI file), keyed by address
+_hardwareSessions = {}
+# listeners kept open on returnIP:returnPort for acquired data sent back with the original protocol
+_dataReceivers = {}
+# background threads still writing received .gsi files (receiveInMemory = 1), keyed by file name
+_pendingWrites = {}
 
 def doCommonEntry(rasterDescFileIn):
     # Main function that recieves an INI-style text file with a command and parameters
@@ -36,28 +62,35 @@ def doCommonEntry(rasterDescFileIn):
     if not allParmsStr:
         print("Error: problem with absence of parm Dict inside doScan.py")
         return errorRetDict
+    # by default the zip file sent to the hardware computer is assembled in memory; zipInMemory = 0 in the
+    # system INI file writes the files and rasterInput.zip to tempFolder instead (useful for debugging)
+    if allParmsStr["System"].get("zipInMemory", "1").lower() not in ["false", "no", "0", "off"]:
+        zipMembers = {} # file name inside zip => bytes
+    else:
+        zipMembers = None
+    session = _hardwareSession(allParmsStr)
     requestedFunction = allParmsStr["Interface"]["doScanFunction"].lower().strip()
     if requestedFunction in ["runscanner"]:
-        retDict = _doRunScanner(localInputFolder, allParmsStr)
+        retDict = _doRunScanner(localInputFolder, allParmsStr, zipMembers, session)
     elif requestedFunction in ["genericcommand"]:
-        retDict = _doGenericCommand(localInputFolder, allParmsStr)
+        retDict = _doGenericCommand(localInputFolder, allParmsStr, zipMembers, session)
     elif requestedFunction in ["armphotometry"]:
-        retDict = _doArmPhotometry(localInputFolder, allParmsStr)
+        retDict = _doArmPhotometry(localInputFolder, allParmsStr, zipMembers, session)
     elif requestedFunction in ["testphotometry"]:
-        retDict = _doTestPhotometry(localInputFolder, allParmsStr)
+        retDict = _doTestPhotometry(localInputFolder, allParmsStr, zipMembers, session)
     else:
         print("Error: requested function not available in DoScan.py: " + requestedFunction)
         return errorRetDict
     return retDict
 
-def _doGenericCommand(localInputFolder, allParmsStr):
+def _doGenericCommand(localInputFolder, allParmsStr, zipMembers=None, session=None):
     falseStrings = ["false", "no", "0", "off"]
     retDict = {}
     diagMode = allParmsStr["Interface"]["diagmode"].lower() not in falseStrings
     allParmsStr["Interface"]["currentcommand"] = allParmsStr["Interface"]["specificCommand"]
     hardwareAddress = (allParmsStr["System"]["hardwareADCip"], int(allParmsStr["System"]["hardwareADCport"]))
     retOkay = _sendZipFile(localInputFolder, allParmsStr["Interface"], allParmsStr["System"]["tempFolder"],
-                           hardwareAddress, diagMode)
+                           hardwareAddress, diagMode, zipMembers, session)
     if not retOkay:
         print("Problem on return code from sendZipFile inside doScan.py (doGenericCommand)")
         retDict["retOkay"] = False
@@ -67,7 +100,7 @@ def _doGenericCommand(localInputFolder, allParmsStr):
     retDict["retOkay"] = True
     return retDict
 
-def _doTestPhotometry(localInputFolder, allParmsStr):
+def _doTestPhotometry(localInputFolder, allParmsStr, zipMembers=None, session=None):
     falseStrings = ["false", "no", "0", "off"]
     retDict = {}
     diagMode = allParmsStr["Interface"]["diagmode"].lower() not in falseStrings
@@ -78,7 +111,7 @@ def _doTestPhotometry(localInputFolder, allParmsStr):
 
     # make new scan waveforms
     allParmsStr["minor"]["photometrydurms"] = "7" # use 7 ms
-    retOkay = _createPhotometryScan(allParmsStr, imageDescFN)
+    retOkay = _createPhotometryScan(allParmsStr, imageDescFN, zipMembers)
     if not retOkay:
         print("Problem creating photometry scan files.")
         retDict["retOkay"] = False
@@ -87,9 +120,13 @@ def _doTestPhotometry(localInputFolder, allParmsStr):
         print("Created new photometry scan waveforms as part of test.")
 
     # send photometry scan waveforms to hardware computer
+    servAddr = (allParmsStr["System"]["returnIP"], int(allParmsStr["System"]["returnPort"]))
+    if not session and not _readyDataReceiver(servAddr, diagMode):
+        retDict["retOkay"] = False
+        return retDict
     hardwareAddress = (allParmsStr["System"]["hardwareADCip"], int(allParmsStr["System"]["hardwareADCport"]))
     retOkay = _sendZipFile(localInputFolder, allParmsStr["Interface"], allParmsStr["System"]["tempFolder"],
-                           hardwareAddress, diagMode)
+                           hardwareAddress, diagMode, zipMembers, session)
     if not retOkay:
         print("Problem on return code from sendZipFile inside doScan.py (doTestPhotometry)")
         retDict["retOkay"] = False
@@ -101,11 +138,10 @@ def _doTestPhotometry(localInputFolder, allParmsStr):
     if diagMode:
         print("Request sent now waiting for hardware computer to finish ...")
 
-    servAddr = (allParmsStr["System"]["returnIP"], int(allParmsStr["System"]["returnPort"]))
     newFileName = allParmsStr["Interface"]["destFileName"].strip()
 
     timeOutSec = 2
-    retOkay = _waitForSocketResponse(servAddr, newFileName, timeOutSec, diagMode)
+    retOkay = _waitForSocketResponse(servAddr, newFileName, timeOutSec, diagMode, session) is not None
     if not retOkay:
         print("Problem with return code on waitForSocketResponse in DoScan.py (doTestPhotometry).")
         retDict["retOkay"] = False
@@ -126,7 +162,7 @@ def _doTestPhotometry(localInputFolder, allParmsStr):
         retDict["retOkay"] = False
         return retDict
 
-def _doArmPhotometry(localInputFolder, allParmsStr):
+def _doArmPhotometry(localInputFolder, allParmsStr, zipMembers=None, session=None):
     falseStrings = ["false", "no", "0", "off"]
     retDict = {}
     diagMode = allParmsStr["Interface"]["diagmode"].lower() not in falseStrings
@@ -135,7 +171,7 @@ def _doArmPhotometry(localInputFolder, allParmsStr):
     allParmsStr["Interface"]["ImageDesc"] = imageDescFN
     allParmsStr["Interface"]["PositionData"] = str(allParmsStr["Minor"]["positionEpisode"])
     # make new scan waveforms
-    retOkay = _createPhotometryScan(allParmsStr, imageDescFN)
+    retOkay = _createPhotometryScan(allParmsStr, imageDescFN, zipMembers)
     if not retOkay:
         print("Problem creating photometry scan files.")
         retDict["retOkay"] = False
@@ -146,7 +182,7 @@ def _doArmPhotometry(localInputFolder, allParmsStr):
     # send photometry scan waveforms to hardware computer
     hardwareAddress = (allParmsStr["System"]["hardwareADCip"], int(allParmsStr["System"]["hardwareADCport"]))
     retOkay = _sendZipFile(localInputFolder, allParmsStr["Interface"], allParmsStr["System"]["tempFolder"],
-                           hardwareAddress, diagMode)
+                           hardwareAddress, diagMode, zipMembers, session)
     if not retOkay:
         print("Problem on return code from sendZipFile inside doScan.py (doArmPhotometry)")
         retDict["retOkay"] = False
@@ -156,7 +192,8 @@ def _doArmPhotometry(localInputFolder, allParmsStr):
     retDict["retOkay"] = True
     return retDict
 
-def _doRunScanner(localInputFolder, allParmsStr):
+@TS.timed("runScanner")
+def _doRunScanner(localInputFolder, allParmsStr, zipMembers=None, session=None):
     startTime = datetime.datetime.now()
     falseStrings = ["false", "no", "0", "off"]
     retDict = {}
@@ -168,7 +205,7 @@ def _doRunScanner(localInputFolder, allParmsStr):
     allParmsStr["Interface"]["ImageDesc"] = imageDescFN
     allParmsStr["Interface"]["ReturnPositionData"] = str(int(allParmsStr["Interface"]["positionData"]))
     if allParmsStr["Interface"]["updateScanWaveforms"].lower() not in falseStrings:
-        retOkay = _createScan(allParmsStr, imageDescFN)
+        retOkay = _createScan(allParmsStr, imageDescFN, zipMembers)
         if retOkay:
             retImageDescFN = imageDescFN # to let calling program know about updated parms
         else:
@@ -181,9 +218,13 @@ def _doRunScanner(localInputFolder, allParmsStr):
         # hardwarePC is going to recycle cached ImageDescription.txt file since no changed parameters
         retImageDescFN = "" # this routine did not create a new ImageDesc file, so nothing to return
 
+    servAddr = (allParmsStr["System"]["returnIP"], int(allParmsStr["System"]["returnPort"]))
+    if not session and not _readyDataReceiver(servAddr, diagMode):
+        retDict["retOkay"] = False
+        return retDict
     hardwareAddress = (allParmsStr["System"]["hardwareADCip"], int(allParmsStr["System"]["hardwareADCport"]))
     retOkay = _sendZipFile(localInputFolder, allParmsStr["Interface"], allParmsStr["System"]["tempFolder"],
-                           hardwareAddress, diagMode)
+                           hardwareAddress, diagMode, zipMembers, session)
     if not retOkay:
         print("Problem on return code from sendZipFile inside doScan.py (doGenericCommand)")
         retDict["retOkay"] = False
@@ -195,14 +236,15 @@ def _doRunScanner(localInputFolder, allParmsStr):
     if diagMode:
         print("Request sent now waiting for hardware computer to finish ...")
 
-    servAddr = (allParmsStr["System"]["returnIP"], int(allParmsStr["System"]["returnPort"]))
     newFileName = allParmsStr["Interface"]["destFileName"].strip()
     if "estSecPerFrame" in allParmsStr["Interface"]:
         timeOutSec = 2 + (int(allParmsStr["Interface"]["numframes"])) * float(allParmsStr["interface"]["estSecPerFrame"])
     else:
         timeOutSec = 2 * int(allParmsStr["Interface"]["numframes"]) # estimate of 2 sec per frame max
-    retOkay = _waitForSocketResponse(servAddr, newFileName, timeOutSec, diagMode)
-    if not retOkay:
+    # with receiveInMemory = 1 the data are handed back in retDict[gsiBytes] and written to disk in the background
+    inMemory = allParmsStr["System"].get("receiveInMemory", "0").lower() not in falseStrings
+    gsiBytes = _waitForSocketResponse(servAddr, newFileName, timeOutSec, diagMode, session, inMemory)
+    if not gsiBytes:
         print("Problem with return code on waitForSocketResponse in DoScan.py (runScanner).")
         retDict["retOkay"] = False
         return retDict
@@ -212,7 +254,11 @@ def _doRunScanner(localInputFolder, allParmsStr):
         elaspedMs = (diffTime.seconds * 1000) + (diffTime.microseconds / 1000)
         print("Total milliseconds required: " + str(int(10. * elaspedMs) / 10.))
     retDict["newFileName"] = newFileName
+    if inMemory:
+        retDict["gsiBytes"] = gsiBytes
     retDict["imageDescFN"] = retImageDescFN
+    if retImageDescFN and zipMembers is not None:
+        retDict["imageDescText"] = zipMembers[retImageDescFN].decode() # no ImageDesc file on disk in this mode
     retDict["retOkay"] = True
     return retDict
 
@@ -246,27 +292,40 @@ def _prepareToMakeZipFile(rasterDescFileIn):
                 shutil.rmtree(filePlusPath)
     return localInputFolder, allParmsStr
 
-def _sendZipFile(localInputFolder, parmDict, tempFolder, hardwareAddress, diagMode):
+def _sendZipFile(localInputFolder, parmDict, tempFolder, hardwareAddress, diagMode, zipMembers=None, session=None):
     # Makes Cmd.txt file, collapses everything in localInputFolder into a zip file and sends it to IP+port specified
     #   typically parmDict is only the [Interface] section of the main parameter dict. However
     #   the hardware RasterNoGUI will make a copy of the input ImageParameters INI file and include it in
     #   the output Zip file since some of those parameters (e.g., systemLag) are needed to decode raw data
-    finalCmdFile = localInputFolder + "/Cmd.txt"
-    with open(finalCmdFile, "w") as fOut: # write interface parameters to Cmd.txt file
-        print("[Commands]\r", file=fOut) # the extra return char is required for Windows PCs
-        for key in sorted(parmDict):
-            print(str(key).lower() + " = " + parmDict[key] + "\r", file=fOut)
-
-    # write final Zip file containing cmd, imageDesc, and scan waveforms (if requested)
-    os.chdir(localInputFolder) # temp folder (typically on a RamDrive)
-    zipFileName = tempFolder + "/rasterInput.zip"
-    with zipfile.ZipFile(zipFileName, "w") as fZip:
-        for root, dirs, files in os.walk(localInputFolder):
-            for file in files:
-                fZip.write(file)
+    #   If zipMembers (Dict of name => bytes) is passed the zip is built in memory with no temp files
+    #   If session (hardwareLink.clsHardwareSession) is passed the zip goes over that open connection instead
+    cmdText = io.StringIO()
+    print("[Commands]\r", file=cmdText) # the extra return char is required for Windows PCs
+    for key in sorted(parmDict):
+        print(str(key).lower() + " = " + parmDict[key] + "\r", file=cmdText)
+
+    if zipMembers is None:
+        # write final Zip file containing cmd, imageDesc, and scan waveforms (if requested)
+        SF.saveScanText(cmdText.getvalue(), "Cmd.txt", localInputFolder) # write interface parameters to Cmd.txt file
+        os.chdir(localInputFolder) # temp folder (typically on a RamDrive)
+        zipFileName = tempFolder + "/rasterInput.zip"
+        with TS.span("buildZip"):
+            with zipfile.ZipFile(zipFileName, "w") as fZip:
+                for root, dirs, files in os.walk(localInputFolder):
+                    for file in files:
+                        fZip.write(file)
+            zipBytes = open(zipFileName, "rb").read()
+    else:
+        SF.saveScanText(cmdText.getvalue(), "Cmd.txt", localInputFolder, zipMembers)
+        zipBytes = _buildZipInMemory(localInputFolder, zipMembers)
 
+    with TS.span("sendCommand", parmDict.get("currentcommand", "")):
+        if session:
+            return session.sendCommand(zipBytes, diagMode)
+        return _sendZipBytes(zipBytes, hardwareAddress, diagMode)
+
+def _sendZipBytes(zipBytes, hardwareAddress, diagMode):
     # send Zip file to hardwareAddress
-    zipBytes = open(zipFileName, "rb").read()
     client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     client.settimeout(1) # allow 1 sec before triggering a time-out exception
     try:
@@ -282,35 +341,159 @@ def _sendZipFile(localInputFolder, parmDict, tempFolder, hardwareAddress, diagMo
     client.close()
     return True
 
-def _waitForSocketResponse(servAddr, returnDataFileName, timeOutSec, diagMode):
-    bufSize = 4096 * 2
-    serv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    serv.bind(servAddr)
-    serv.listen(5)
-    if diagMode:
-        print("listening for return of acquired data from hardware computer...")
-    serv.settimeout(timeOutSec)
-    while True:
-        try:
-            listenConn, listenAddr = serv.accept()
-        except socket.timeout:
-            print("ERROR - hardware computer did not respond with acquired data within max time allowed.")
-            return None
-        if diagMode:
-            print('hardware computer connected ... ', listenAddr)
-        serv.settimeout(None)
-        myHandle = open(returnDataFileName, "wb")
-        while True:
-            data = listenConn.recv(bufSize)
-            if not data: break
-            myHandle.write(data)
-        myHandle.close()
-        listenConn.close()
-        if diagMode:
-            print("Closed socket connection with hardware computer.")
-        break
+@TS.timed("buildZip")
+def _buildZipInMemory(localInputFolder, zipMembers):
+    # returns the bytes of a zip file holding zipMembers plus any files a scan generator wrote to localInputFolder
+    zipBuffer = io.BytesIO()
+    with zipfile.ZipFile(zipBuffer, "w") as fZip:
+        for memberName in sorted(zipMembers):
+            fZip.writestr(memberName, zipMembers[memberName])
+        for oneFile in sorted(os.listdir(localInputFolder)):
+            if oneFile not in zipMembers and path.isfile(path.join(localInputFolder, oneFile)):
+                fZip.write(path.join(localInputFolder, oneFile), arcname=oneFile)
+    return zipBuffer.getbuffer()
+
+def _scanCacheKey(allParms, newParms, scanFunction):
+    # canonical hash of everything the scan generation function sees except numFrames (the waveforms only describe
+    #   one frame) and Minor parameters that do not change the waveforms; None if these scans should not be cached
+    cacheSize = int(allParms["System"].get("scanCacheSize", str(_defaultScanCacheSize)))
+    if cacheSize <= 0 or int(allParms["Minor"].get("saverowpair", "0")) == 1:
+        return None # saveRowPair writes its file as a side effect of scan generation
+    keyText = io.StringIO()
+    print(scanFunction.__module__ + "." + scanFunction.__name__, file=keyText)
+    for sectionName in ["Major", "Minor", "System"]:
+        for key, value in sorted(allParms[sectionName].items()):
+            if sectionName != "Minor" or key.lower() not in _scanCacheIgnoredMinor:
+                print(sectionName + "." + key.lower() + " = " + str(value).strip(), file=keyText)
+    for key, value in sorted(newParms.items()):
+        print("Derived." + key.lower() + " = " + str(value), file=keyText)
+    return hashlib.sha1(keyText.getvalue().encode()).hexdigest()
+
+def _scanFileNames(allParms, zipMembers):
+    # names of the scan files present now, so the ones a scan generation function adds can be found afterwards
+    if zipMembers is not None:
+        return set(zipMembers)
+    return set(os.listdir(allParms["Interface"]["localInputFolder"]))
+
+def _addCachedScan(cacheKey, allParms, updatedNewParms, filesBefore, zipMembers):
+    scanFiles = {}
+    for fileName in _scanFileNames(allParms, zipMembers) - filesBefore:
+        if zipMembers is not None:
+            scanFiles[fileName] = zipMembers[fileName]
+        else:
+            with open(path.join(allParms["Interface"]["localInputFolder"], fileName), "rb") as fIn:
+                scanFiles[fileName] = fIn.read()
+    _scanCache[cacheKey] = (dict(updatedNewParms), scanFiles)
+    _scanCache.move_to_end(cacheKey)
+    while len(_scanCache) > int(allParms["System"].get("scanCacheSize", str(_defaultScanCacheSize))):
+        _scanCache.popitem(last=False)
+
+def _reuseCachedScan(cacheKey, allParms, zipMembers):
+    # if cacheKey was generated before, puts the cached scan files back into zipMembers (or the local input folder)
+    #   and returns a copy of the derived parms with estimatedTotalSeconds for this numFrames; None otherwise
+    if not cacheKey or cacheKey not in _scanCache:
+        return None
+    _scanCache.move_to_end(cacheKey)
+    cachedParms, scanFiles = _scanCache[cacheKey]
+    for fileName, fileBytes in scanFiles.items():
+        if zipMembers is not None:
+            zipMembers[fileName] = fileBytes
+        else:
+            with open(path.join(allParms["Interface"]["localInputFolder"], fileName), "wb") as fOut:
+                fOut.write(fileBytes)
+    updatedNewParms = dict(cachedParms)
+    if "estimatedFrameMs" in updatedNewParms:
+        updatedNewParms["estimatedTotalSeconds"] = str(int(allParms["Interface"]["numFrames"]) *
+                                                       (float(updatedNewParms["estimatedFrameMs"]) / 1000.))
+    if allParms["Interface"].get("diagMode", "0").lower() not in ["false", "no", "0", "off"]:
+        print("Reused cached scan waveforms.")
+    return updatedNewParms
+
+def _findScanFunction(kind, scanFunctionStr, allParms):
+    # kind is raster or photometry; modules listed in the System INI entry scanModules are registered first
+    SR.registerScanModules(allParms["System"].get("scanModules", ""))
+    return SR.findScanFunction(kind, scanFunctionStr)
+
+def _callScanFunction(scanFunction, scanArgs, zipMembers):
+    # scan generation functions that accept zipMembers return their waveforms in it; older ones write files
+    if zipMembers is not None and SR.acceptsZipMembers(scanFunction):
+        return scanFunction(*scanArgs, zipMembers=zipMembers)
+    return scanFunction(*scanArgs)
+
+def _hardwareSession(allParmsStr):
+    # returns the open session with the hardware computer, or None to use one connection per command
+    if allParmsStr["System"].get("persistentSession", "0").lower() in ["false", "no", "0", "off"]:
+        for session in _hardwareSessions.values():
+            session.close() # sessions left open when persistentSession was turned off
+        _hardwareSessions.clear()
+        return None
+    hardwareAddress = (allParmsStr["System"]["hardwareADCip"], int(allParmsStr["System"]["hardwareADCport"]))
+    if hardwareAddress not in _hardwareSessions:
+        _hardwareSessions[hardwareAddress] = HL.clsHardwareSession(hardwareAddress)
+    return _hardwareSessions[hardwareAddress]
+
+def _readyDataReceiver(servAddr, diagMode):
+    # makes sure something is listening on servAddr before a command that returns data is sent
+    if servAddr not in _dataReceivers:
+        receiver = HL.clsDataReceiver(servAddr)
+        if not receiver.start():
+            return False
+        _dataReceivers[servAddr] = receiver
+    numDiscarded = _dataReceivers[servAddr].discardPending()
+    if numDiscarded and diagMode:
+        print("discarded " + str(numDiscarded) + " late data file(s) from earlier acquisitions")
     return True
 
+def closeHardwareSessions():
+    # closes open hardware sessions and acquired data listeners (call when the program ends)
+    for session in _hardwareSessions.values():
+        session.close()
+    _hardwareSessions.clear()
+    for receiver in _dataReceivers.values():
+        receiver.close()
+    _dataReceivers.clear()
+    waitForFileWrite()
+
+def waitForFileWrite(fileName=None):
+    # waits until a received .gsi file (or all of them if fileName is None) is completely written to disk
+    fileNames = list(_pendingWrites) if fileName is None else [fileName]
+    for oneName in fileNames:
+        writeThread = _pendingWrites.pop(oneName, None)
+        if writeThread:
+            writeThread.join()
+
+def _writeFileInBackground(fileName, data):
+    waitForFileWrite(fileName) # focus mode reuses one file name so an earlier write must finish first
+    writeThread = threading.Thread(target=_writeDataFile, args=(fileName, data))
+    writeThread.start()
+    _pendingWrites[fileName] = writeThread
+
+@TS.timed("writeDataFile")
+def _writeDataFile(fileName, data):
+    with open(fileName, "wb") as myHandle:
+        myHandle.write(data)
+
+def _waitForSocketResponse(servAddr, returnDataFileName, timeOutSec, diagMode, session=None, inBackground=False):
+    # returns the received .gsi bytes (None on error); the file is written before returning unless inBackground
+    if session:
+        # acquired data comes back over the session connection so no listening socket is needed
+        gsiBytes = session.waitForData(timeOutSec, diagMode)
+    elif servAddr in _dataReceivers:
+        if diagMode:
+            print("listening for return of acquired data from hardware computer...")
+        gsiBytes = _dataReceivers[servAddr].waitForData(timeOutSec, diagMode)
+    else:
+        print("ERROR - not listening for acquired data on " + str(servAddr))
+        return None
+    if gsiBytes is None:
+        return None
+    if inBackground:
+        _writeFileInBackground(returnDataFileName, gsiBytes)
+    else:
+        _writeDataFile(returnDataFileName, gsiBytes)
+    return gsiBytes
+
+@TS.timed("preProcessParms")
 def _preProcessParms(parmFileName):
     # returns a Dict of input parmeters with subDicts for Major, Minor etc
     # returns strings of all parameters
@@ -344,32 +527,33 @@ def _preProcessParms(parmFileName):
     else:
         return None
 
-def _createPhotometryScan(allParms, passedImageDescFN):
-    scanModuleStr = "Imaging.Helper.Scans.createPhotometryScans"
-    try:
-        scanModule = importlib.import_module(scanModuleStr)
-    except:
-        print("ERROR - problem importing module: " + scanModuleStr)
-        return False
+@TS.timed("createScan")
+def _createPhotometryScan(allParms, passedImageDescFN, zipMembers=None):
     scanFunctionStr = allParms["Minor"]["photometryShape"].lower().strip()
+    scanFunction = _findScanFunction("photometry", scanFunctionStr, allParms)
+    if not scanFunction:
+        return False
     try:
-        updatedNewParms = getattr(scanModule, scanFunctionStr)(allParms)
-    except:
-        print("ERROR - could not match requested photometryMode with a generation subroutine: " + scanFunctionStr)
+        updatedNewParms = _callScanFunction(scanFunction, (allParms,), zipMembers)
+    except Exception:
+        print("ERROR - photometry scan function " + scanFunctionStr + " failed:")
+        traceback.print_exc()
         return False
     localInputFolder = allParms["Interface"]["localInputFolder"]
     updatedNewParms["scanWaveformsTimeStamp"] = str(datetime.datetime.now())
-    with open(localInputFolder + "/" + passedImageDescFN, "w") as fOut:
-        print("[Derived]\r", file=fOut)
-        for key, value in sorted(updatedNewParms.items()):
-            print(str(key).lower() + " = " + str(value) + "\r", file=fOut) # str to fix any number entries
-        print(" ", file=fOut)
-        print("[System]\r", file=fOut)
-        for key, value in sorted(allParms["System"].items()):
-            print(str(key).lower() + " = " + value + "\r", file=fOut)
+    fOut = io.StringIO()
+    print("[Derived]\r", file=fOut)
+    for key, value in sorted(updatedNewParms.items()):
+        print(str(key).lower() + " = " + str(value) + "\r", file=fOut) # str to fix any number entries
+    print(" ", file=fOut)
+    print("[System]\r", file=fOut)
+    for key, value in sorted(allParms["System"].items()):
+        print(str(key).lower() + " = " + value + "\r", file=fOut)
+    SF.saveScanText(fOut.getvalue(), passedImageDescFN, localInputFolder, zipMembers)
     return True
 
-def _createScan(allParms, passedImageDescFN):
+@TS.timed("createScan")
+def _createScan(allParms, passedImageDescFN, zipMembers=None):
     # called once major and minor parameters are set to create derived Dict
     # this routine creates the ImageDescription.txt file that contains all parameters - both
     # those specified by the user and the derived settings like turnLength
@@ -401,40 +585,46 @@ def _createScan(allParms, passedImageDescFN):
     newParms["numADCs"] = str(numADCs)
     newParms["ADCchanLetters"] = chanList
 
-    # now load module and run function selected by Minor parameters to create scan
+    # now run the function selected by Minor parameters to create scan (see Helper/Scans/scanRegistry.py)
     #   allows program to be extended with new types of scans without changing core code
     updatedNewParms = None # an empty variable in case scan generation does not work
-    scanModuleStr = "Imaging.Helper.Scans.createStandardScans"
-    try:
-        scanModule = importlib.import_module(scanModuleStr)
-    except:
-        print("ERROR - problem importing module: " + scanModuleStr)
     scanFunctionStr = allParms["Minor"]["scanfunction"].lower().strip()
+    scanFunction = _findScanFunction("raster", scanFunctionStr, allParms)
+    if not scanFunction:
+        return False
+    cacheKey = _scanCacheKey(allParms, newParms, scanFunction)
     try:
-        updatedNewParms = getattr(scanModule, scanFunctionStr)(allParms, newParms)
-    except:
-        print("ERROR - could not match requested scanType with a generation subroutine: " + scanFunctionStr)
+        updatedNewParms = _reuseCachedScan(cacheKey, allParms, zipMembers)
+        if not updatedNewParms:
+            filesBefore = _scanFileNames(allParms, zipMembers)
+            updatedNewParms = _callScanFunction(scanFunction, (allParms, newParms), zipMembers)
+            if updatedNewParms and cacheKey:
+                _addCachedScan(cacheKey, allParms, updatedNewParms, filesBefore, zipMembers)
+    except Exception:
+        print("ERROR - scan function " + scanFunctionStr + " failed:")
+        traceback.print_exc()
 
     # write final ImageDescription file to temp folder
     if updatedNewParms:
         localInputFolder = allParms["Interface"]["localInputFolder"]
         updatedNewParms["scanWaveformsTimeStamp"] = str(datetime.datetime.now())
-        with open(localInputFolder + "/" + passedImageDescFN, "w") as fOut:
-            print("[Major]\r", file=fOut)
-            for key, value in sorted(allParms["Major"].items()):
-                print(str(key).lower() + " = " + value + "\r", file=fOut)
-            print(" ", file=fOut)
-            print("[Minor]\r", file=fOut)
-            for key, value in sorted(allParms["Minor"].items()):
-                print(str(key).lower() + " = " + value + "\r", file=fOut)
-            print(" ", file=fOut)
-            print("[Derived]\r", file=fOut)
-            for key, value in sorted(updatedNewParms.items()):
-                print(str(key).lower() + " = " + str(value) + "\r", file=fOut) # str to fix any number entries
-            print(" ", file=fOut)
-            print("[System]\r", file=fOut)
-            for key, value in sorted(allParms["System"].items()):
-                print(str(key).lower() + " = " + value + "\r", file=fOut)
+        fOut = io.StringIO()
+        print("[Major]\r", file=fOut)
+        for key, value in sorted(allParms["Major"].items()):
+            print(str(key).lower() + " = " + value + "\r", file=fOut)
+        print(" ", file=fOut)
+        print("[Minor]\r", file=fOut)
+        for key, value in sorted(allParms["Minor"].items()):
+            print(str(key).lower() + " = " + value + "\r", file=fOut)
+        print(" ", file=fOut)
+        print("[Derived]\r", file=fOut)
+        for key, value in sorted(updatedNewParms.items()):
+            print(str(key).lower() + " = " + str(value) + "\r", file=fOut) # str to fix any number entries
+        print(" ", file=fOut)
+        print("[System]\r", file=fOut)
+        for key, value in sorted(allParms["System"].items()):
+            print(str(key).lower() + " = " + value + "\r", file=fOut)
+        SF.saveScanText(fOut.getvalue(), passedImageDescFN, localInputFolder, zipMembers)
         return True
     else:
         return False
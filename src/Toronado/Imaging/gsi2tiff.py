@@ -5,6 +5,10 @@ This is a utility function that converts the Toronado output Zip file (typically
 into a TIFF file that can be viewed by standard image processing programs. The routine also prints
 diag information to the terminal about the image shape and mean pixel value.
 
+Any mix of .gsi files, folders (all .gsi files inside) and wildcard patterns can be given, eg
+  python gsi2tiff.py D:/Data/2017-12-17 "D:/Data/cell3_*.gsi" --jobs 4
+Files whose TIFF outputs are newer than the .gsi file are skipped unless --force is used.
+
 last revised 17 Dec 2017 BWS
 
 """
@@ -17,6 +21,9 @@ import os.path as path
 import datetime
 import time
 import importlib
+import glob
+import argparse
+import concurrent.futures
 import configparser as ConfigParser
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import Helper.processImageData as PI
@@ -26,10 +33,13 @@ def convertFile(zipFileName):
         print("  Cannot find requested .gsi file: " + zipFileName)
         return None
 
-    # uncompress and read Zip file contents into a Dict
-    tempDict = PI.loadRasterZipFile(zipFileName, lagPixelsAdjust=0, fastMode=False)
-    infoStr = "  Image data: " + str(tempDict["Xsize"]) + " by " + str(tempDict["Ysize"]) + " pixels"
-    infoStr += " by " + str(tempDict["numFrames"])
+    # uncompress and read Zip file contents into a Dict; fastMode skips the display max value search
+    tempDict = PI.loadRasterZipFile(zipFileName, lagPixelsAdjust=0, fastMode=True, memoryMap=True)
+    if not tempDict:
+        print("  Could not read " + zipFileName)
+        return None
+    infoStr = "  " + path.basename(zipFileName) + ": " + str(tempDict["Xsize"]) + " by " + str(tempDict["Ysize"])
+    infoStr += " pixels by " + str(tempDict["numFrames"])
     numChannels = len(tempDict["channelLetters"])
     if numChannels == 1:
         infoStr += " frames (1 channel, " + tempDict["channelLetters"][0] + ")"
@@ -41,9 +51,74 @@ def convertFile(zipFileName):
     retName = PI.saveProcessedImageData(tempDict, zipFileName, "tif", -1) # last -1 means save whole movie
     return retName
 
-if __name__ == "__main__":
-    if len(sys.argv) == 2:
-        convertFile(sys.argv[1])
+def convertFiles(fileNames, numJobs=1, force=False):
+    # converts a list of .gsi files using numJobs processes; returns the number of files converted
+    startTime = time.time()
+    toConvert = [oneFile for oneFile in fileNames if force or not _outputsUpToDate(oneFile)]
+    numSkipped = len(fileNames) - len(toConvert)
+    if numSkipped > 0:
+        print("  Skipping " + str(numSkipped) + " file(s) with up to date TIFF output")
+    numConverted = 0
+    totalBytes = 0
+    if numJobs > 1 and len(toConvert) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(numJobs, len(toConvert))) as pool:
+            for oneFile, retName in zip(toConvert, pool.map(convertFile, toConvert)):
+                if retName:
+                    numConverted += 1
+                    totalBytes += path.getsize(oneFile)
     else:
-        print("You need to supply a path + file name to gsi2tiff.py")
+        for oneFile in toConvert:
+            if convertFile(oneFile):
+                numConverted += 1
+                totalBytes += path.getsize(oneFile)
+    elapsedSec = max(time.time() - startTime, 1e-6)
+    print("  Converted " + str(numConverted) + " of " + str(len(toConvert)) + " file(s) in " +
+          "{:.1f}".format(elapsedSec) + " sec (" + "{:.2f}".format(numConverted / elapsedSec) + " files/s, " +
+          "{:.1f}".format(totalBytes / (1024. * 1024. * elapsedSec)) + " MB/s)")
+    return numConverted
+
+def findGsiFiles(inputPaths):
+    # expands folders and wildcard patterns into a sorted list of .gsi files
+    fileNames = []
+    for onePath in inputPaths:
+        onePath = path.expanduser(onePath)
+        if path.isdir(onePath):
+            fileNames.extend(glob.glob(path.join(onePath, "*.gsi")))
+        elif glob.has_magic(onePath):
+            fileNames.extend(glob.glob(onePath))
+        elif path.exists(onePath):
+            fileNames.append(onePath)
+        else:
+            print("  Cannot find requested .gsi file: " + onePath)
+    return sorted(set(path.abspath(oneFile) for oneFile in fileNames))
 
+def _outputsUpToDate(zipFileName):
+    # True if every ADC channel in the archive already has a TIFF written after the archive was saved
+    try:
+        with zipfile.ZipFile(zipFileName, "r") as fZip:
+            contents = fZip.namelist()
+    except (zipfile.BadZipFile, OSError):
+        return False
+    fileRoot = path.splitext(zipFileName)[0]
+    sourceTime = path.getmtime(zipFileName)
+    numChannels = 0
+    for chanNum in range(4):
+        if PI._ADCnameFromNum(chanNum) in contents:
+            numChannels += 1
+            tifNames = glob.glob(glob.escape(fileRoot) + "_ADC" + chr(65 + chanNum) + "_*.tif")
+            if not any(path.getmtime(oneTif) >= sourceTime for oneTif in tifNames):
+                return False
+    return numChannels > 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert Toronado .gsi files into TIFF files")
+    parser.add_argument("inputs", nargs="+", help=".gsi files, folders or wildcard patterns")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="number of files converted at the same time (default: number of CPUs)")
+    parser.add_argument("-f", "--force", action="store_true", help="convert even if TIFF output is up to date")
+    args = parser.parse_args()
+    gsiFiles = findGsiFiles(args.inputs)
+    if gsiFiles:
+        convertFiles(gsiFiles, numJobs=max(1, args.jobs), force=args.force)
+    else:
+        print("No .gsi files found in: " + str(args.inputs))
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+# shared helpers for the Toronado tests; run with  python -m pytest src/Toronado/tests
+
+import sys, os
+import io
+import zipfile
+import numpy as np
+import pytest
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from Imaging.Helper.EasyDict import EasyDict
+import Imaging.Helper.Scans.createStandardScans as CS
+
+def rasterParms(**changes):
+    # ImageDesc [Major]/[Minor]/[Derived] entries read by the raster decoder (lowercase keys, string values)
+    parmDict = {"xsize": "32", "ysize": "16", "bidirectional": "1", "lagpixels": "5", "turnlength": "4",
+                "xbinning": "1", "ybinning": "1", "adcchanletters": "A", "chananame": "Green",
+                "chanbname": "Red"}
+    parmDict.update({key.lower(): str(value) for key, value in changes.items()})
+    return parmDict
+
+def rawPointsNeeded(parmDict, numFrames, extraPoints=40):
+    # raw ADC points for numFrames frames (one extra point per frame, as the hardware computer writes them)
+    pixelsX, pixelsY = int(parmDict["xsize"]), int(parmDict["ysize"])
+    frameStride = (pixelsY * (pixelsX + int(parmDict["turnlength"]))) + 1
+    return int(parmDict["lagpixels"]) + (numFrames * frameStride) + extraPoints
+
+def gsiBytes(parmDict, numFrames, rawByChannel, compression=zipfile.ZIP_STORED):
+    # builds a .gsi archive like the one the hardware computer returns: Cmd.txt, the ImageDesc file and one
+    #   ADCn_ImageRaw_int16.bin member per channel
+    cmdText = "[Commands]\r\ncurrentcommand = DoScan\r\nimagedesc = ImageDesc.txt\r\nnumframes = " + str(numFrames)
+    cmdText += "\r\nreturnpositiondata = 0\r\n"
+    descText = "[Major]\r\n" + "".join(key + " = " + value + "\r\n" for key, value in sorted(parmDict.items()))
+    zipBuffer = io.BytesIO()
+    with zipfile.ZipFile(zipBuffer, "w", compression=compression) as fZip:
+        fZip.writestr("Cmd.txt", cmdText)
+        fZip.writestr("ImageDesc.txt", descText)
+        for chanNum, rawData in sorted(rawByChannel.items()):
+            fZip.writestr("ADC" + str(chanNum) + "_ImageRaw_int16.bin", np.asarray(rawData, dtype="int16").tobytes())
+    return zipBuffer.getvalue()
+
+def referenceDecode(rawData, parmDict, numFrames, lagPixelsAdjust=0):
+    # the original frame by frame, row by row decode loop (before vectorization) used as the reference
+    pixelsX, pixelsY = int(parmDict["xsize"]), int(parmDict["ysize"])
+    bidirectional = (1 == int(parmDict["bidirectional"]))
+    turnLength = int(parmDict["turnlength"])
+    index = int(parmDict["lagpixels"]) + lagPixelsAdjust
+    zStack = []
+    for _ in range(numFrames):
+        oneFrame = np.zeros((pixelsX, pixelsY), dtype="int16")
+        if bidirectional:
+            for y in range(0, pixelsY, 2):
+                index += turnLength
+                oneFrame[:, y] = rawData[index:index + pixelsX]
+                index += pixelsX + turnLength
+                oneFrame[:, y + 1] = rawData[index:index + pixelsX][::-1]
+                index += pixelsX
+        else:
+            for y in range(0, pixelsY):
+                index += turnLength
+                oneFrame[:, y] = rawData[index:index + pixelsX]
+                index += pixelsX
+        index += 1
+        zStack.append(oneFrame)
+    return np.array(zStack)
+
+def standardParms(**minorChanges):
+    # the parameter sections createStandardScans.standard reads, as doScan passes them
+    sectionDicts = {"Interface": {"localInputFolder": "", "numFrames": "1"},
+                    "Major": {"Xsize": "64", "Ysize": "32", "pixelUs": "1"},
+                    "Minor": {"accelfactor": "1", "centerXvolts": "0.5", "centerYvolts": "-0.25", "bidirectional": "1",
+                              "bidirends": "flat", "linearpercentage": "80", "rotation": "0", "saverowpair": "0",
+                              "scanEncoding": "float64"},
+                    "System": {"scancmdattenuation": "1", "tempFolder": ""}}
+    sectionDicts["Minor"].update(minorChanges)
+    allParms = EasyDict()
+    for sectionName, sectionValues in sectionDicts.items():
+        allParms[sectionName] = EasyDict()
+        for key, value in sectionValues.items():
+            allParms[sectionName][key] = value
+    return allParms
+
+def runStandard(allParms):
+    # returns (newParms with lowercase keys, zipMembers) from one standard scan generated in memory
+    zipMembers = {}
+    newParms = CS.standard(allParms, {"zoomAsVolts": "4", "lagUs": "10", "lagPixels": "10"}, zipMembers=zipMembers)
+    return {key.lower(): value for key, value in newParms.items()}, zipMembers
+
+@pytest.fixture
+def writeGsi(tmp_path):
+    # writeGsi(parmDict, numFrames, rawByChannel, compression) => path of a new .gsi file in tmp_path
+    fileNums = iter(range(1000))
+    def writeOne(parmDict, numFrames, rawByChannel, compression=zipfile.ZIP_STORED):
+        fileName = str(tmp_path / ("test" + str(next(fileNums)) + ".gsi"))
+        with open(fileName, "wb") as fOut:
+            fOut.write(gsiBytes(parmDict, numFrames, rawByChannel, compression))
+        return fileName
+    return writeOne
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+# session protocol and acquired data receiver checks against the hardware stand-in
+
+import io
+import socket
+import threading
+import time
+import zipfile
+import numpy as np
+import pytest
+import Imaging.Helper.hardwareLink as HL
+import Imaging.Helper.hardwareStandIn as HS
+import Imaging.Helper.processImageData as PI
+from conftest import standardParms, runStandard
+
+@pytest.fixture
+def standIn():
+    oneStandIn = HS.clsHardwareStandIn(("127.0.0.1", 0))
+    oneStandIn.start()
+    yield oneStandIn
+    oneStandIn.stop()
+
+def _commandZip(currentCommand, numFrames=2, returnAddress=("127.0.0.1", 0)):
+    # command zip file like doScan sends; DoScan commands carry the ImageDesc file and standard scan waveforms
+    cmdText = "[Commands]\r\ncurrentcommand = " + currentCommand + "\r\nimagedesc = ImageDesc.txt\r\n"
+    cmdText += "numframes = " + str(numFrames) + "\r\nreturnpositiondata = 0\r\nupdatescanwaveforms = 1\r\n"
+    cmdText += "returnipaddress = " + returnAddress[0] + "\r\nreturnport = " + str(returnAddress[1]) + "\r\n"
+    zipMembers = {"Cmd.txt": cmdText.encode()}
+    if currentCommand.lower() == "doscan":
+        newParms, scanMembers = runStandard(standardParms())
+        descParms = {"xsize": "64", "ysize": "32", "bidirectional": "1", "lagpixels": "10", "zoomasvolts": "4",
+                     "adcchanletters": "AB", "chananame": "Green", "chanbname": "Red"}
+        descParms.update(newParms)
+        descText = "[Major]\r\n" + "".join(key + " = " + str(value) + "\r\n" for key, value in sorted(descParms.items()))
+        zipMembers["ImageDesc.txt"] = descText.encode()
+        zipMembers.update(scanMembers)
+    zipBuffer = io.BytesIO()
+    with zipfile.ZipFile(zipBuffer, "w") as fZip:
+        for memberName, memberBytes in zipMembers.items():
+            fZip.writestr(memberName, memberBytes)
+    return zipBuffer.getvalue()
+
+def test_messageFraming():
+    sendSock, recvSock = socket.socketpair()
+    with sendSock, recvSock:
+        payload = bytes(range(256)) * 5000 # larger than the socket buffers, so it is sent from another thread
+        def sendAll():
+            HL.sendMessage(sendSock, b"DATA", payload)
+            HL.sendMessage(sendSock, b"OKAY")
+            sendSock.shutdown(socket.SHUT_WR)
+        sendThread = threading.Thread(target=sendAll)
+        sendThread.start()
+        assert HL.receiveMessage(recvSock) == (b"DATA", payload)
+        assert HL.receiveMessage(recvSock) == (b"OKAY", b"")
+        assert HL.receiveMessage(recvSock) == (None, None)
+        sendThread.join()
+
+def test_sessionRoundTrip(standIn):
+    session = HL.clsHardwareSession(standIn.serverSocket.getsockname())
+    try:
+        assert session.sendCommand(_commandZip("CloseShutter"))
+        for _ in range(2): # the same connection carries several acquisitions
+            assert session.sendCommand(_commandZip("DoScan", numFrames=3))
+            gsiBytes = session.waitForData(5)
+            retDict = PI.loadRasterZipFile("acquired.gsi", zipBytes=bytes(gsiBytes))
+            assert retDict["channelLetters"] == ["A", "B"] and retDict["data"]["A"].shape == (3, 64, 32)
+            assert retDict["data"]["A"].max() > 1000 # bright spots of the synthetic specimen
+    finally:
+        session.close()
+
+def test_sessionReportsRejectedCommand(standIn):
+    session = HL.clsHardwareSession(standIn.serverSocket.getsockname())
+    try:
+        assert not session.sendCommand(b"not a zip file")
+        assert session.sendCommand(_commandZip("CloseShutter")) # session stays usable
+    finally:
+        session.close()
+
+def test_receiverGetsOriginalProtocolUploadDuringSession(standIn):
+    receiver = HL.clsDataReceiver(("127.0.0.1", 0))
+    assert receiver.start()
+    session = HL.clsHardwareSession(standIn.serverSocket.getsockname())
+    try:
+        assert session.connect() # an open session must not hold up one-connection-per-command clients
+        with socket.create_connection(standIn.serverSocket.getsockname(), timeout=5) as cmdConn:
+            cmdConn.sendall(_commandZip("DoScan", numFrames=1, returnAddress=receiver.serv.getsockname()))
+        gsiBytes = receiver.waitForData(5)
+        assert gsiBytes is not None
+        retDict = PI.loadRasterZipFile("acquired.gsi", zipBytes=bytes(gsiBytes))
+        assert retDict["data"]["B"].shape == (1, 64, 32)
+        assert receiver.waitForData(0.1) is None
+    finally:
+        session.close()
+        receiver.close()
+
+def test_receiverDiscardsLateUploads():
+    receiver = HL.clsDataReceiver(("127.0.0.1", 0))
+    assert receiver.start()
+    try:
+        for uploadNum in range(2):
+            with socket.create_connection(receiver.serv.getsockname(), timeout=5) as uploadConn:
+                uploadConn.sendall(np.full(300000, uploadNum, dtype="int16").tobytes())
+        assert receiver.waitForData(5) == np.zeros(300000, dtype="int16").tobytes()
+        receiver.waitForData(5)
+        with socket.create_connection(receiver.serv.getsockname(), timeout=5) as uploadConn:
+            uploadConn.sendall(b"late")
+        waitEnd = time.time() + 5
+        while receiver.dataQueue.empty() and time.time() < waitEnd:
+            time.sleep(0.01)
+        assert receiver.discardPending() == 1
+    finally:
+        receiver.close()
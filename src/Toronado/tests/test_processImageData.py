@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+# decoding, lag, lazy loading, percentile, binning and export checks for Imaging.Helper.processImageData
+
+import pickle
+import zipfile
+import numpy as np
+import pytest
+from scipy.io import loadmat
+import Imaging.Helper.processImageData as PI
+from conftest import rasterParms, rawPointsNeeded, gsiBytes, referenceDecode
+
+def _randomRaw(parmDict, numFrames, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 2048, rawPointsNeeded(parmDict, numFrames), dtype="int16")
+
+@pytest.mark.parametrize("bidirectional", ["1", "0"])
+@pytest.mark.parametrize("lagPixelsAdjust", [0, 3, -2])
+def test_decodeMatchesReferenceLoop(bidirectional, lagPixelsAdjust):
+    parmDict = rasterParms(bidirectional=bidirectional, numframes=5)
+    rawData = _randomRaw(parmDict, 5)
+    zStack = PI._decodeRasterData(rawData, parmDict, lagPixelsAdjust=lagPixelsAdjust, asStack=True)
+    assert zStack.shape == (5, 32, 16)
+    assert np.array_equal(zStack, referenceDecode(rawData, parmDict, 5, lagPixelsAdjust))
+
+def test_decodeListIndexesLikeStack():
+    parmDict = rasterParms(numframes=3)
+    rawData = _randomRaw(parmDict, 3)
+    zList = PI._decodeRasterData(rawData, parmDict, asStack=False)
+    zStack = PI._decodeRasterData(rawData, parmDict, asStack=True)
+    assert len(zList) == 3 and all(np.array_equal(zList[ii], zStack[ii]) for ii in range(3))
+
+def test_decodeTooShortReturnsNone():
+    parmDict = rasterParms(numframes=4)
+    rawData = _randomRaw(parmDict, 4)[:500]
+    assert PI._decodeRasterData(rawData, parmDict) is None
+
+def test_lagDriftOnePointPerFrame():
+    # a ramp makes the one extra raw point per frame visible as a per-frame offset of the first pixel
+    numFrames = 6
+    parmDict = rasterParms(numframes=numFrames)
+    rawData = np.arange(rawPointsNeeded(parmDict, numFrames), dtype="int16")
+    zStack = PI._decodeRasterData(rawData, parmDict, asStack=True)
+    frameStride = (16 * (32 + 4)) + 1
+    assert list(zStack[:, 0, 0]) == [5 + 4 + (ii * frameStride) for ii in range(numFrames)]
+
+def test_fractionalLagBlendsNeighbors():
+    parmDict = rasterParms(numframes=2)
+    rawData = _randomRaw(parmDict, 2)
+    zStack = PI._decodeRasterData(rawData, parmDict, lagPixelsAdjust=1.25, asStack=True)
+    lowStack = referenceDecode(rawData, parmDict, 2, 1).astype(float)
+    highStack = referenceDecode(rawData, parmDict, 2, 2).astype(float)
+    assert np.array_equal(zStack, np.rint((0.75 * lowStack) + (0.25 * highStack)))
+
+def test_binningSumsPixelBlocks():
+    parmDict = rasterParms(numframes=3, xbinning=2, ybinning=4)
+    rawData = _randomRaw(parmDict, 3)
+    zStack = PI._decodeRasterData(rawData, parmDict, asStack=True)
+    fullStack = referenceDecode(rawData, parmDict, 3).astype("int32")
+    assert zStack.dtype == np.int32 and zStack.shape == (3, 16, 4)
+    assert np.array_equal(zStack, fullStack.reshape(3, 16, 2, 4, 4).sum(axis=(2, 4)))
+    assert PI._rasterBinning(parmDict)[4] == 2048 * 8
+
+@pytest.mark.parametrize("dtype", ["int16", "int32"])
+def test_fastPercentileMatchesNumpy(dtype):
+    rng = np.random.default_rng(3)
+    imageData = rng.integers(-200, 2047, (4, 64, 48)).astype(dtype)
+    for percentile in [0, 50, 99, 100]:
+        assert PI._fastPercentile(imageData, percentile) == pytest.approx(np.percentile(imageData, percentile))
+
+def test_loadRasterZipFileChannelsAndStack(writeGsi):
+    parmDict = rasterParms()
+    rawA, rawB = _randomRaw(parmDict, 4, 1), _randomRaw(parmDict, 4, 2)
+    fileName = writeGsi(parmDict, 4, {0: rawA, 1: rawB})
+    for workers in [1, 2]:
+        retDict = PI.loadRasterZipFile(fileName, workers=workers)
+        assert retDict["channelLetters"] == ["A", "B"] and retDict["numFrames"] == 4
+        assert np.array_equal(retDict["data"]["A"], referenceDecode(rawA, parmDict, 4))
+        assert np.array_equal(retDict["data"]["B"], referenceDecode(rawB, parmDict, 4))
+    retDict = PI.loadRasterZipFile(fileName, specificADCchannels="B")
+    assert retDict["channelLetters"] == ["B"]
+
+@pytest.mark.parametrize("compression", [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED])
+def test_lazyAndMemoryMappedLoadsMatchEager(writeGsi, compression):
+    parmDict = rasterParms()
+    fileName = writeGsi(parmDict, 12, {0: _randomRaw(parmDict, 12)}, compression)
+    eagerDict = PI.loadRasterZipFile(fileName)
+    mappedDict = PI.loadRasterZipFile(fileName, memoryMap=True)
+    assert np.array_equal(mappedDict["data"]["A"], eagerDict["data"]["A"])
+    lazyDict = PI.openRasterZipFile(fileName, cachedFrames=2)
+    try:
+        lazyChannel = lazyDict["data"]["A"]
+        assert len(lazyChannel) == 12
+        for frameNum in [0, 5, 11, 3, 3, -1]: # forward, then back to earlier frames
+            assert np.array_equal(lazyChannel[frameNum], eagerDict["data"]["A"][frameNum])
+        assert np.array_equal(np.asarray(lazyChannel), eagerDict["data"]["A"])
+    finally:
+        lazyDict["lazyFile"].close()
+
+def test_decodeFromBytesNeedsNoFile(tmp_path):
+    parmDict = rasterParms()
+    rawData = _randomRaw(parmDict, 2)
+    retDict = PI.loadRasterZipFile(str(tmp_path / "notWrittenYet.gsi"), zipBytes=gsiBytes(parmDict, 2, {0: rawData}))
+    assert np.array_equal(retDict["data"]["A"], referenceDecode(rawData, parmDict, 2))
+    assert "rawData" not in retDict
+
+def _meshedRaw(parmDict, numFrames, trueLagAdjust):
+    # raw data of a smooth specimen sampled so that decoding needs lagPixelsAdjust = trueLagAdjust
+    pixelsX, pixelsY = int(parmDict["xsize"]), int(parmDict["ysize"])
+    xGrid, yGrid = np.meshgrid(np.arange(pixelsX), np.arange(pixelsY), indexing="ij")
+    specimen = (1000 + 800 * np.sin(xGrid / 3.) * np.cos(yGrid / 5.)).astype("int16")
+    # decoding a ramp of raw indices gives the raw position of every pixel
+    indexRamp = np.arange(rawPointsNeeded(parmDict, numFrames), dtype="int32")
+    positions = referenceDecode(indexRamp, parmDict, numFrames, trueLagAdjust).astype("int64")
+    rawData = np.zeros(len(indexRamp), dtype="int16")
+    for frameNum in range(numFrames):
+        rawData[positions[frameNum].ravel()] = specimen.ravel()
+    return rawData, specimen
+
+def test_findBestLagAdjustRecoversLag(writeGsi):
+    parmDict = rasterParms(xsize=64, ysize=32, lagpixels=12)
+    rawData, specimen = _meshedRaw(parmDict, 1, 3)
+    fileName = writeGsi(parmDict, 1, {0: rawData})
+    assert PI.findRasterLagAdjust(fileName) == 3
+    retDict = PI.loadRasterZipFile(fileName, autoLag=True)
+    assert retDict["lagPixelsAdjust"] == 3
+    assert np.array_equal(retDict["data"]["A"][0], specimen)
+
+def test_rephaseReadsRawDataOnlyWhenNeeded(writeGsi):
+    parmDict = rasterParms()
+    rawData = _randomRaw(parmDict, 3)
+    fileName = writeGsi(parmDict, 3, {0: rawData})
+    retDict = PI.loadRasterZipFile(fileName)
+    assert "rawData" not in retDict
+    assert PI.rephaseRasterData(retDict, 2)
+    assert np.array_equal(retDict["data"]["A"], referenceDecode(rawData, parmDict, 3, 2))
+    assert "A" in retDict["rawData"]
+
+def test_streamedExportsMatchData(writeGsi, tmp_path):
+    tifffile = pytest.importorskip("tifffile")
+    parmDict = rasterParms()
+    fileName = writeGsi(parmDict, 20, {0: _randomRaw(parmDict, 20)})
+    eagerDict = PI.loadRasterZipFile(fileName)
+    lazyDict = PI.openRasterZipFile(fileName)
+    try:
+        for oneDict, oneRoot in [(eagerDict, "eager.gsi"), (lazyDict, "lazy.gsi")]:
+            tifName = PI.saveProcessedImageData(oneDict, str(tmp_path / oneRoot), "tif")
+            assert np.array_equal(tifffile.imread(tifName), eagerDict["data"]["A"])
+            binName = PI.saveProcessedImageData(oneDict, str(tmp_path / oneRoot), "bin")
+            assert np.array_equal(np.fromfile(binName, dtype="int16").reshape(20, 32, 16), eagerDict["data"]["A"])
+    finally:
+        lazyDict["lazyFile"].close()
+
+def test_wholeDictSavesOfLazyDicts(writeGsi, tmp_path):
+    pytest.importorskip("h5py")
+    parmDict = rasterParms()
+    fileName = writeGsi(parmDict, 4, {0: _randomRaw(parmDict, 4)})
+    eagerDict = PI.loadRasterZipFile(fileName)
+    h5Name = PI.saveProcessedImageData(eagerDict, str(tmp_path / "movie.gsi"), "h5")
+    for oneDict in [PI.openRasterZipFile(fileName), PI.loadRasterH5File(h5Name)]:
+        pkName = PI.saveProcessedImageData(oneDict, str(tmp_path / "saved.gsi"), "pk")
+        with open(pkName, "rb") as fP:
+            savedDict = pickle.load(fP)
+        assert "lazyFile" not in savedDict and "rawData" not in savedDict
+        assert np.array_equal(savedDict["data"]["A"], eagerDict["data"]["A"])
+        matName = PI.saveProcessedImageData(oneDict, str(tmp_path / "saved.gsi"), "mat")
+        assert "saved" in loadmat(matName)
+        oneDict["lazyFile"].close()
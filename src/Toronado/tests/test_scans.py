@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# scan waveform checks: rotation, compact encodings, the scan function registry and the doScan scan cache
+
+import math
+import io
+import zipfile
+import numpy as np
+import pytest
+import Imaging.Helper.Scans.scanFiles as SF
+import Imaging.Helper.Scans.scanRegistry as SR
+import Imaging.Helper.Scans.createStandardScans as CS
+import Imaging.doScan as DS
+from conftest import standardParms, runStandard
+
+def _loopRotation(scanPointsX, scanPointsY, rotationDegrees, centerX, centerY):
+    # the original per-point rotation loop
+    rot = np.radians(rotationDegrees)
+    mSinRot, mCosRot = math.sin(rot), math.cos(rot)
+    scanPointsX, scanPointsY = scanPointsX.copy(), scanPointsY.copy()
+    for ii in range(len(scanPointsX)):
+        TX, TY = scanPointsX[ii], scanPointsY[ii]
+        scanPointsX[ii] = (((TX - centerX) * mCosRot) - ((TY - centerY) * mSinRot)) + centerX
+        scanPointsY[ii] = (((TX - centerX) * mSinRot) + ((TY - centerY) * mCosRot)) + centerY
+    return scanPointsX, scanPointsY
+
+@pytest.mark.parametrize("rotationDegrees", [0.5, 15, 90, -33.3, 180])
+def test_rotateFrameBitIdenticalToLoop(rotationDegrees):
+    rng = np.random.default_rng(7)
+    scanPointsX, scanPointsY = rng.uniform(-5, 5, 2000), rng.uniform(-5, 5, 2000)
+    rotatedX, rotatedY = CS.rotateFrame(scanPointsX, scanPointsY, rotationDegrees, 0.5, -0.25)
+    loopX, loopY = _loopRotation(scanPointsX, scanPointsY, rotationDegrees, 0.5, -0.25)
+    assert rotatedX.tobytes() == loopX.tobytes() and rotatedY.tobytes() == loopY.tobytes()
+
+@pytest.mark.parametrize("sampleType", SF.scanSampleTypes)
+def test_encodeDecodeRoundTrip(sampleType):
+    scanPoints = np.linspace(-9.99, 9.99, 1001)
+    decoded = SF.decodeScanPoints(SF.encodeScanPoints(scanPoints, sampleType).tobytes(), sampleType)
+    tolerance = {"float64": 0., "float32": 1e-6, "int16": SF.dacVoltsPerCode / 2.}[sampleType]
+    assert decoded.dtype == np.float64 and np.max(np.abs(decoded - scanPoints)) <= tolerance
+
+@pytest.mark.parametrize("scanEncoding", ["float32", "int16", "rowpair", "rowpair int16"])
+def test_expandScanPointsMatchesFullFrame(scanEncoding):
+    fullParms, fullMembers = runStandard(standardParms())
+    fullX, fullY = SF.expandScanPoints(fullParms, fullMembers)
+    newParms, zipMembers = runStandard(standardParms(scanEncoding=scanEncoding))
+    expandedX, expandedY = SF.expandScanPoints(newParms, zipMembers)
+    sampleType = SF.scanEncoding(standardParms(scanEncoding=scanEncoding))[1]
+    tolerance = {"float64": 0., "float32": 1e-6, "int16": SF.dacVoltsPerCode / 2.}[sampleType]
+    assert len(expandedX) == len(fullX) and len(expandedY) == len(fullY)
+    assert np.max(np.abs(expandedX - fullX)) <= tolerance and np.max(np.abs(expandedY - fullY)) <= tolerance
+    if "rowpair" in scanEncoding:
+        assert newParms["scandescription"] == "rowpair"
+        assert sum(len(memberBytes) for memberBytes in zipMembers.values()) < len(fullMembers["ScanPointsX_float64.bin"])
+
+def test_rotatedScanIgnoresRowPair():
+    newParms, zipMembers = runStandard(standardParms(rotation="15", scanEncoding="rowpair"))
+    assert newParms.get("scandescription", "frame") != "rowpair"
+    assert "ScanPointsX_float64.bin" in zipMembers
+
+def test_registryFindsBuiltInScans():
+    assert SR.findScanFunction("raster", "Standard") is CS.standard
+    for shapeName in ["circle", "lissajous", "spiral", "halfspiral"]:
+        assert SR.findScanFunction("photometry", shapeName) is not None
+    assert SR.acceptsZipMembers(CS.standard)
+    assert "rotateframe" not in SR.scanFunctionNames("raster") # helpers with other arguments are skipped
+    assert SR.findScanFunction("raster", "noSuchScan") is None
+
+def test_registryRejectsWrongSignature():
+    def badScan(allParms):
+        return {}
+    assert not SR.registerScanFunction("raster", "badScan", badScan)
+    assert SR.findScanFunction("raster", "badScan") is None
+
+def test_scanCacheKeyIgnoresDisplayOnlyParms():
+    allParms = standardParms()
+    allParms["System"]["scanCacheSize"] = "4"
+    newParms = {"zoomAsVolts": "4", "lagUs": "10", "lagPixels": "10"}
+    firstKey = DS._scanCacheKey(allParms, newParms, CS.standard)
+    allParms["Interface"]["numFrames"] = "20"
+    allParms["Minor"]["callDisplay"] = "0"
+    assert DS._scanCacheKey(allParms, newParms, CS.standard) == firstKey
+    allParms["Minor"]["rotation"] = "5"
+    assert DS._scanCacheKey(allParms, newParms, CS.standard) != firstKey
+
+def test_buildZipInMemoryHoldsEveryMember(tmp_path):
+    newParms, zipMembers = runStandard(standardParms())
+    zipMembers["Cmd.txt"] = b"[Commands]\r\ncurrentcommand = DoScan\r\n"
+    (tmp_path / "extra.bin").write_bytes(b"1234")
+    with zipfile.ZipFile(io.BytesIO(DS._buildZipInMemory(str(tmp_path), zipMembers))) as fZip:
+        assert sorted(fZip.namelist()) == sorted(list(zipMembers) + ["extra.bin"])
+        assert all(fZip.read(memberName) == memberBytes for memberName, memberBytes in zipMembers.items())
@@ -17,6 +17,7 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from Imaging.Helper.EasyDict import EasyDict
 import Imaging.RasterGUI as RGUI
 import Imaging.Helper.RasterDisplayThread as RDT
+import Imaging.Helper.processImageData as PI
 
 class clsMainWindow(QtGui.QMainWindow):
 
@@ -27,6 +28,8 @@ class clsMainWindow(QtGui.QMainWindow):
         if not self.coreParms:
             print("Problem in toronado.ini file.")
             self.coreParms = None
+        elif "decodeWorkers" in self.coreParms["Raster"]:
+            PI.setDefaultDecodeWorkers(self.coreParms["Raster"]["decodeWorkers"])
         self._initUI(versionNum = 0.833)
         self.rasterGUI = None
         self.imageDisplayThread = None